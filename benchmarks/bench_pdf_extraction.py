@@ -0,0 +1,73 @@
+"""PDF extraction benchmark
+
+Generates synthetic Mercadona tickets and compares the time and the parsed
+items of every PDF text backend. Run it from the repository root with
+python -m benchmarks.bench_pdf_extraction
+
+Usage:
+  bench_pdf_extraction.py [--tickets=<n>] [--items=<n>]
+
+Options:
+  -h --help         Show this screen.
+  --tickets=<n>     Number of tickets to generate [default: 200].
+  --items=<n>       Items per ticket [default: 30].
+"""
+
+import os
+import tempfile
+import time
+
+from docopt import docopt
+
+from benchmarks.synthetic import write_mercadona_pdf
+from src.pdf_text import PDF_BACKENDS, PdfTextExtractor
+from src.vendors.mercadona_parser import MercadonaTicketParser
+
+
+def run_backend(backend: str, file_paths: list[str], expected: list) -> dict:
+    try:
+        MercadonaTicketParser.PDF_BACKEND = backend
+        PdfTextExtractor(backend)
+    except ImportError:
+        return None
+
+    start = time.perf_counter()
+    parsed = []
+    for file_path in file_paths:
+        parsed.append(MercadonaTicketParser(file_path).extract_items())
+    elapsed = time.perf_counter() - start
+
+    correct = sum(items == truth for items, truth in zip(parsed, expected))
+    return {
+        "seconds": elapsed,
+        "tickets_per_second": len(file_paths) / elapsed,
+        "correct": correct,
+    }
+
+
+def main(n_tickets: int, n_items: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_paths = []
+        expected = []
+        for i in range(n_tickets):
+            file_path = os.path.join(
+                tmp_dir, f"202401{i % 28 + 1:02d} Mercadona {i}.pdf"
+            )
+            expected.append(write_mercadona_pdf(file_path, n_items, seed=i))
+            file_paths.append(file_path)
+
+        for backend in PDF_BACKENDS:
+            result = run_backend(backend, file_paths, expected)
+            if result is None:
+                print(f"{backend:>15}: not installed")
+                continue
+            print(
+                f"{backend:>15}: {result['seconds']:.3f}s, "
+                f"{result['tickets_per_second']:.1f} tickets/s, "
+                f"{result['correct']}/{n_tickets} tickets parsed correctly"
+            )
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    main(int(args["--tickets"]), int(args["--items"]))
@@ -0,0 +1,216 @@
+"""Ticket pipeline benchmark
+
+Generates synthetic Mercadona PDFs and Granel/Fruteria photos with a known
+ground truth, times every stage of the parsing pipeline and checks the
+parsed items. Run it from the repository root with
+python -m benchmarks.bench_pipeline
+
+Usage:
+  bench_pipeline.py [options]
+
+Options:
+  -h --help             Show this screen.
+  --tickets=<n>         Tickets per vendor [default: 10].
+  --items=<n>           Items per ticket [default: 15].
+  --skew=<degrees>      Maximum skew of the photos [default: 2.0].
+  --noise=<sigma>       Gaussian noise of the photos, 0-1 [default: 0.05].
+  --shadow=<fraction>   Maximum shadow of the photos, 0-1 [default: 0.4].
+  --seed=<n>            Random seed [default: 0].
+  --save=<file>         Save the results as a JSON baseline.
+  --compare=<file>      Compare the results with a saved baseline.
+  --tolerance=<pct>     Allowed p50 slowdown against the baseline [default: 10].
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import pytesseract
+from docopt import docopt
+
+from benchmarks.synthetic import (
+    FRUTERIA_PRODUCTS,
+    GRANEL_PRODUCTS,
+    fruteria_ticket_lines,
+    granel_ticket_lines,
+    random_weighed_items,
+    write_mercadona_pdf,
+    write_ticket_jpeg,
+)
+from benchmarks.timing import (
+    StageTimer,
+    compare_baseline,
+    format_summary,
+    save_baseline,
+)
+from src.expense_table import ExpenseTable
+from src.image_processor import ImageProcessor
+from src.ocr import get_ocr_engine
+from src.pdf_text import get_pdf_extractor
+from src.vendors.fruteria_parser import FruteriaTicketParser
+from src.vendors.granel_parser import GranelTicketParser
+from src.vendors.mercadona_parser import MercadonaTicketParser
+
+# Vendor -> (parser, products, ticket lines)
+PHOTO_VENDORS = {
+    "Granel": (GranelTicketParser, GRANEL_PRODUCTS, granel_ticket_lines),
+    "Fruteria": (FruteriaTicketParser, FRUTERIA_PRODUCTS, fruteria_ticket_lines),
+}
+
+
+def item_matches(item: dict, truth: dict) -> bool:
+    return (
+        item.get("product") == truth["product"]
+        and abs(item.get("total_price", 0) - truth["total_price"]) < 0.005
+    )
+
+
+class Accuracy:
+    """Tickets and items parsed exactly like the ground truth, per vendor."""
+
+    def __init__(self) -> None:
+        self.results = {}
+
+    def add(self, vendor: str, items: list[dict], truth: list[dict]) -> None:
+        result = self.results.setdefault(
+            vendor, {"tickets": 0, "tickets_ok": 0, "items": 0, "items_ok": 0}
+        )
+        result["tickets"] += 1
+        result["tickets_ok"] += items == truth
+        result["items"] += len(truth)
+        result["items_ok"] += sum(map(item_matches, items, truth))
+
+    def report(self) -> str:
+        lines = []
+        for vendor, result in self.results.items():
+            lines.append(
+                f"{vendor:<10} tickets {result['tickets_ok']}/{result['tickets']}"
+                f"  items {result['items_ok']}/{result['items']}"
+            )
+        return "\n".join(lines)
+
+
+def bench_pdf(timer: StageTimer, file_path: str) -> list[dict]:
+    parser = MercadonaTicketParser(file_path)
+    with timer.stage("pdf_text"):
+        parser._text = get_pdf_extractor(parser.PDF_BACKEND).extract(file_path)
+    with timer.stage("extract_items"):
+        return parser.extract_items()
+
+
+def bench_photo(
+    timer: StageTimer, vendor: str, file_path: str, text: str, ocr: bool
+) -> list[dict]:
+    """Run the standard preprocessing of the parser one stage at a time.
+
+    Without OCR the items are extracted from the rendered text instead.
+    """
+    parser_class, _, _ = PHOTO_VENDORS[vendor]
+    parser = parser_class(file_path)
+
+    with timer.stage("imread"):
+        processor = ImageProcessor(file_path)
+    with timer.stage("rescale_image"):
+        processor.rescale_image()
+    with timer.stage("deskew_image"):
+        processor.img = processor.deskew_image(
+            limit=parser.DESKEW_LIMIT, method=parser.DESKEW_METHOD
+        )
+    with timer.stage("remove_shadows"):
+        processor.img = processor.remove_shadows()
+    with timer.stage("grayscale_image"):
+        processor.grayscale_image()
+    with timer.stage("remove_noise"):
+        processor.remove_noise()
+
+    if ocr:
+        engine = get_ocr_engine(lang="cat+eng+spa", psm=4, oem=1)
+        with timer.stage("tesseract"):
+            text = engine.image_to_string(processor.img)
+    parser._text = parser._clean_ocr_text(text)
+    with timer.stage("extract_items"):
+        return parser.extract_items()
+
+
+def ocr_available() -> bool:
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        return False
+    return True
+
+
+def run(args: dict, tmp_dir: str) -> tuple[StageTimer, Accuracy]:
+    n_tickets = int(args["--tickets"])
+    n_items = int(args["--items"])
+    rng = random.Random(int(args["--seed"]))
+    ocr = ocr_available()
+    if not ocr:
+        print("Tesseract not found: OCR is skipped, items come from the text")
+
+    timer = StageTimer()
+    accuracy = Accuracy()
+    parsed = {}
+    for i in range(n_tickets):
+        seed = rng.randrange(2**31)
+        date = f"202401{i % 28 + 1:02d}"
+
+        file_path = os.path.join(tmp_dir, f"{date} Mercadona {i}.pdf")
+        truth = write_mercadona_pdf(file_path, n_items, seed=seed)
+        items = bench_pdf(timer, file_path)
+        accuracy.add("Mercadona", items, truth)
+        parsed.setdefault("Mercadona", []).append((items, date))
+
+        for vendor, (_, products, ticket_lines) in PHOTO_VENDORS.items():
+            file_path = os.path.join(tmp_dir, f"{date}_{vendor.lower()}_{i}.jpg")
+            truth = random_weighed_items(n_items, products, seed)
+            lines = ticket_lines(truth)
+            write_ticket_jpeg(
+                file_path,
+                lines,
+                seed,
+                skew=rng.uniform(-1, 1) * float(args["--skew"]),
+                noise=float(args["--noise"]),
+                shadow=rng.uniform(0, 1) * float(args["--shadow"]),
+            )
+            items = bench_photo(timer, vendor, file_path, "\n".join(lines), ocr)
+            if ocr:
+                accuracy.add(vendor, items, truth)
+            parsed.setdefault(vendor, []).append((items, date))
+
+    with timer.stage("aggregation"):
+        table = ExpenseTable()
+        for vendor, all_items in parsed.items():
+            table.extend(all_items, vendor=vendor)
+        table.expenses_per_month()
+        table.expenses_per_item()
+        table.expenses_per_vendor()
+    return timer, accuracy
+
+
+def main(args: dict) -> int:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        timer, accuracy = run(args, tmp_dir)
+
+    summary = timer.summary()
+    print(format_summary(summary))
+    print(accuracy.report())
+
+    if args["--save"]:
+        params = {
+            key.lstrip("-"): value
+            for key, value in args.items()
+            if key not in ("--save", "--compare", "--help")
+        }
+        save_baseline(args["--save"], summary, accuracy.results, params)
+        print(f"Baseline saved to {args['--save']}")
+    if args["--compare"]:
+        tolerance = float(args["--tolerance"]) / 100
+        if compare_baseline(args["--compare"], summary, tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(docopt(__doc__)))
@@ -0,0 +1,298 @@
+"""Synthetic tickets with a known ground truth, used by the benchmarks."""
+
+import os
+import random
+import zlib
+
+import cv2
+import matplotlib
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+PRODUCTS = [
+    "LECHE ENTERA",
+    "PAN BARRA",
+    "HUEVOS L",
+    "YOGUR NATURAL",
+    "ACEITE OLIVA",
+    "ARROZ REDONDO",
+    "TOMATE FRITO",
+    "QUESO TIERNO",
+    "PASTA ESPIRAL",
+    "CAFE MOLIDO",
+]
+WEIGHED_PRODUCTS = ["PLATANO", "MANZANA GOLDEN", "PATATA", "CEBOLLA", "TOMATE PERA"]
+TICKET_FONT = os.path.join(
+    matplotlib.get_data_path(), "fonts", "ttf", "DejaVuSansMono.ttf"
+)
+# Names must not contain the item markers of their parser (ART, Total)
+GRANEL_PRODUCTS = [
+    "ARROZ INTEGRAL",
+    "LENTEJAS PARDINAS",
+    "GARBANZOS",
+    "COPOS AVENA",
+    "NUECES",
+    "ALMENDRAS",
+    "QUINOA",
+    "PASAS",
+]
+FRUTERIA_PRODUCTS = [
+    "MANZANA",
+    "PERA CONFERENCIA",
+    "NARANJA",
+    "PLATANO CANARIAS",
+    "TOMATE RAMA",
+    "CALABACIN",
+    "FRESAS",
+]
+
+
+def format_price(value: float) -> str:
+    return f"{value:.2f}".replace(".", ",")
+
+
+def random_mercadona_items(n_items: int, seed: int = 0) -> list[dict]:
+    """Return n_items random ticket items in the MercadonaTicketParser format."""
+    rng = random.Random(seed)
+    items = []
+    for _ in range(n_items):
+        if rng.random() < 0.25:
+            weight_kg = round(rng.uniform(0.2, 2.5), 3)
+            price_per_kg = round(rng.uniform(0.8, 4.5), 2)
+            items.append(
+                {
+                    "product": rng.choice(WEIGHED_PRODUCTS),
+                    "weight_kg": weight_kg,
+                    "price_per_kg": price_per_kg,
+                    "total_price": round(weight_kg * price_per_kg, 2),
+                }
+            )
+        else:
+            units = rng.randint(1, 4)
+            price_per_unit = round(rng.uniform(0.5, 9.5), 2)
+            items.append(
+                {
+                    "units": units,
+                    "product": rng.choice(PRODUCTS),
+                    "price_per_unit": price_per_unit,
+                    "total_price": round(units * price_per_unit, 2),
+                }
+            )
+    return items
+
+
+def mercadona_ticket_lines(items: list[dict]) -> list[str]:
+    lines = [
+        "MERCADONA, S.A. A-46103834",
+        "C/ MAJOR 1, 46001 VALENCIA",
+        "Descripció P. Unit Import",
+    ]
+    for item in items:
+        if "weight_kg" in item:
+            lines.append(f"1 {item['product']}")
+            weight = f"{item['weight_kg']:.3f}".replace(".", ",")
+            lines.append(
+                f"{weight} kg {format_price(item['price_per_kg'])} "
+                f"€/kg {format_price(item['total_price'])}"
+            )
+        elif item["units"] > 1:
+            lines.append(
+                f"{item['units']} {item['product']} "
+                f"{format_price(item['price_per_unit'])} "
+                f"{format_price(item['total_price'])}"
+            )
+        else:
+            lines.append(
+                f"{item['units']} {item['product']} {format_price(item['total_price'])}"
+            )
+    total = sum(item["total_price"] for item in items)
+    lines.append(f"TOTAL (€) {format_price(total)}")
+    lines.append("TARJETA BANCARIA")
+    return lines
+
+
+def _pdf_string(text: str) -> bytes:
+    raw = text.encode("cp1252")
+    raw = raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return b"(" + raw + b")"
+
+
+def write_pdf(file_path: str, lines: list[str], lines_per_page: int = 60) -> None:
+    """Write a minimal text PDF with one Tj per line (Courier, WinAnsi)."""
+    pages = [
+        lines[i : i + lines_per_page] for i in range(0, len(lines), lines_per_page)
+    ]
+    n_pages = len(pages)
+    # 1: catalog, 2: pages, 3: font, then a page and a content object per page
+    page_ids = [4 + 2 * i for i in range(n_pages)]
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids ["
+        + b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+        + b"] /Count %d >>" % n_pages,
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier "
+        b"/Encoding /WinAnsiEncoding >>",
+    }
+    for page_id, page_lines in zip(page_ids, pages):
+        content = bytearray()
+        for i, line in enumerate(page_lines):
+            y = 800 - 12 * i
+            content += b"BT /F1 10 Tf 20 %d Td %s Tj ET\n" % (y, _pdf_string(line))
+        stream = zlib.compress(bytes(content))
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (page_id + 1)
+        )
+        objects[page_id + 1] = (
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream)
+            + stream
+            + b"\nendstream"
+        )
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(output)
+        output += b"%d 0 obj\n" % obj_id + objects[obj_id] + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in sorted(objects):
+        output += b"%010d 00000 n \n" % offsets[obj_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(objects) + 1)
+    output += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    with open(file_path, "wb") as f:
+        f.write(output)
+
+
+def write_mercadona_pdf(
+    file_path: str, n_items: int = 20, seed: int = 0, lines_per_page: int = 60
+) -> list[dict]:
+    """Write a synthetic Mercadona ticket and return its items."""
+    items = random_mercadona_items(n_items, seed)
+    write_pdf(file_path, mercadona_ticket_lines(items), lines_per_page)
+    return items
+
+
+def random_weighed_items(
+    n_items: int, products: list[str], seed: int = 0
+) -> list[dict]:
+    """Return n_items items sold by weight, as the JPEG ticket parsers do."""
+    rng = random.Random(seed)
+    items = []
+    for _ in range(n_items):
+        weight_kg = round(rng.uniform(0.1, 2.0), 3)
+        price_per_kg = round(rng.uniform(1.0, 15.0), 2)
+        items.append(
+            {
+                "product": rng.choice(products),
+                "weight_kg": weight_kg,
+                "price_per_kg": price_per_kg,
+                "total_price": round(weight_kg * price_per_kg, 2),
+            }
+        )
+    return items
+
+
+def _format_weight(value: float) -> str:
+    return f"{value:.3f}".replace(".", ",")
+
+
+def granel_ticket_lines(items: list[dict]) -> list[str]:
+    lines = ["GRANEL BIO", "C/ MAJOR 1, 46001 VALENCIA", "ART DESCRIPCION"]
+    for code, item in enumerate(items, 100):
+        lines.append(f"{code} {item['product']}")
+        lines.append(
+            f"{_format_weight(item['weight_kg'])} "
+            f"{format_price(item['price_per_kg'])} "
+            f"{format_price(item['total_price'])}"
+        )
+    total = sum(item["total_price"] for item in items)
+    lines.append(f"TOTAL {format_price(total)}")
+    return lines
+
+
+def fruteria_ticket_lines(items: list[dict]) -> list[str]:
+    lines = ["FRUTERIA LA HUERTA", "C/ MAJOR 2, 46001 VALENCIA", "Artículo Importe"]
+    for item in items:
+        lines.append(item["product"])
+        lines.append(
+            f"1 x {_format_weight(item['weight_kg'])} kg "
+            f"{format_price(item['price_per_kg'])} EUR/kg "
+            f"{format_price(item['total_price'])}"
+        )
+    total = sum(item["total_price"] for item in items)
+    lines.append(f"Total {format_price(total)}")
+    return lines
+
+
+def render_ticket_image(
+    lines: list[str],
+    seed: int = 0,
+    skew: float = 0.0,
+    noise: float = 0.0,
+    shadow: float = 0.0,
+    font_size: int = 28,
+    width: int = 700,
+) -> np.ndarray:
+    """Render ticket lines as a photographed-looking BGR image.
+
+    skew rotates the ticket by that many degrees, noise adds gaussian noise
+    with that fraction of the full range as sigma and shadow darkens one side
+    of the ticket by up to that fraction.
+    """
+    # The fonts bundled with matplotlib have the accented characters
+    font = ImageFont.truetype(TICKET_FONT, font_size)
+    line_height = int(font_size * 1.5)
+    height = line_height * (len(lines) + 4)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((40, line_height * (i + 2)), line, fill=0, font=font)
+    img = np.asarray(image, dtype=np.float32)
+
+    if skew:
+        M = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+        img = cv2.warpAffine(img, M, (width, height), borderValue=255)
+    if shadow:
+        gradient = np.linspace(1.0, 1.0 - shadow, width, dtype=np.float32)
+        img *= gradient[np.newaxis, :]
+    if noise:
+        rng = np.random.default_rng(seed)
+        img += rng.normal(0, noise * 255, img.shape).astype(np.float32)
+
+    gray = np.clip(img, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def write_ticket_jpeg(
+    file_path: str,
+    lines: list[str],
+    seed: int = 0,
+    skew: float = 0.0,
+    noise: float = 0.0,
+    shadow: float = 0.0,
+) -> None:
+    img = render_ticket_image(lines, seed, skew, noise, shadow)
+    cv2.imwrite(file_path, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+
+def write_granel_jpeg(
+    file_path: str, n_items: int = 10, seed: int = 0, **distortions
+) -> list[dict]:
+    """Write a synthetic Granel ticket photo and return its items.
+
+    distortions are the skew, noise and shadow of render_ticket_image.
+    """
+    items = random_weighed_items(n_items, GRANEL_PRODUCTS, seed)
+    write_ticket_jpeg(file_path, granel_ticket_lines(items), seed, **distortions)
+    return items
+
+
+def write_fruteria_jpeg(
+    file_path: str, n_items: int = 10, seed: int = 0, **distortions
+) -> list[dict]:
+    """Write a synthetic Fruteria ticket photo and return its items."""
+    items = random_weighed_items(n_items, FRUTERIA_PRODUCTS, seed)
+    write_ticket_jpeg(file_path, fruteria_ticket_lines(items), seed, **distortions)
+    return items
@@ -0,0 +1,108 @@
+"""Stage timings, percentiles and baselines shared by the benchmarks."""
+
+import json
+import subprocess
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimer:
+    """Collects the duration of every run of every named stage."""
+
+    def __init__(self) -> None:
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations.setdefault(name, []).append(seconds)
+
+    def summary(self) -> dict:
+        """Stage -> count, total, throughput (runs/s) and percentiles in ms."""
+        summary = {}
+        for name, durations in self.durations.items():
+            durations = np.array(durations)
+            total = float(durations.sum())
+            stats = {
+                "count": len(durations),
+                "total_s": total,
+                "per_second": len(durations) / total if total else float("inf"),
+                "mean_ms": float(durations.mean() * 1000),
+            }
+            for p, value in zip(PERCENTILES, np.percentile(durations, PERCENTILES)):
+                stats[f"p{p}_ms"] = float(value * 1000)
+            summary[name] = stats
+        return summary
+
+
+def format_summary(summary: dict) -> str:
+    header = f"{'stage':<18}{'count':>7}{'total s':>10}{'per s':>10}" + "".join(
+        f"{f'p{p} ms':>10}" for p in PERCENTILES
+    )
+    lines = [header]
+    for name, stats in summary.items():
+        lines.append(
+            f"{name:<18}{stats['count']:>7}{stats['total_s']:>10.3f}"
+            f"{stats['per_second']:>10.1f}"
+            + "".join(f"{stats[f'p{p}_ms']:>10.2f}" for p in PERCENTILES)
+        )
+    return "\n".join(lines)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_baseline(file_path: str, summary: dict, accuracy: dict, params: dict):
+    baseline = {
+        "revision": git_revision(),
+        "params": params,
+        "stages": summary,
+        "accuracy": accuracy,
+    }
+    with open(file_path, "w") as f:
+        json.dump(baseline, f, indent=2)
+
+
+def compare_baseline(file_path: str, summary: dict, tolerance: float = 0.1) -> list:
+    """Print the p50 of every stage against a saved baseline.
+
+    Returns the stages whose p50 got slower than the baseline by more than
+    the tolerance (a fraction).
+    """
+    with open(file_path, "r") as f:
+        baseline = json.load(f)
+    print(f"Compared to {file_path} (revision {baseline['revision']}):")
+    regressions = []
+    for name, stats in summary.items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            continue
+        ratio = stats["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(
+            f"{name:<18}{old['p50_ms']:>10.2f} -> {stats['p50_ms']:>10.2f} ms"
+            f"  x{ratio:.2f}{flag}"
+        )
+    return regressions
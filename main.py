@@ -1,140 +1,466 @@
 """Email Collector
 
+Without a command, downloads the new emails, parses all the tickets and
+plots the expenses.
+
 Usage:
   main.py YAMLCONF
+  main.py (sync | parse | report) YAMLCONF [options]
+
+Commands:
+  sync        Only download the ticket attachments of new emails.
+  parse       Parse the downloaded and local tickets and report them.
+  report      Report the stored expenses (needs a ticket_db), no parsing.
 
 Arguments:
   YAMLCONF    The path to the .yaml configuration file.
 
 Options:
-  -h --help     Show this screen.
+  -h --help          Show this screen.
+  --vendor=<names>   Only these vendors, comma separated.
+  --since=<date>     Only tickets from this date, YYYYMMDD or YYYY-MM-DD.
+  --until=<date>     Only tickets up to this date, included.
+  --workers=<n>      Parsing processes, instead of the configured ones.
+  --no-plot          Only print the totals, without charts.
 """
 
-from collections import defaultdict
-import os
+import asyncio
 import yaml
 from docopt import docopt
 
+from src import instrumentation
 from src.collector import EmailCollector
-from src.parser_factory import get_ticket_parser
-from src.plotter import plot_expenses_per_month, plot_expenses_per_item, plot_show
-from src.utils import extract_expenses_per_month, extract_expenses_per_item
-
-
-def extract_items_from_emails(email_ids, email_collector, download_folder):
+from src.imap_pool import PooledEmailCollector
+from src.parallel import iter_parsed_tickets, parse_tickets
+from src.parse_cache import ParseCache
+from src.product_catalog import ProductCatalog
+from src.ingest import filter_by_date, group_by_vendor, scan_tickets
+from src.parser_factory import PARSER_CLASSES, get_parser_versions
+from src.sync_state import SyncState
+from src.plotter import (
+    ChartRenderer,
+    plot_expenses_per_item,
+    plot_expenses_per_month,
+    plot_show,
+)
+from src.expense_table import ExpenseTable
+from src.pipeline import TicketPipeline
+from src.ticket_db import TicketDatabase
+
+COMMANDS = ("sync", "parse", "report")
+
+
+def parse_new_tickets(
+    tickets: list,
+    workers: int = 1,
+    cache_path: str = None,
+    ticket_db: TicketDatabase = None,
+) -> list:
+    if ticket_db is None:
+        return parse_tickets(tickets, workers, cache_path)
+
+    # Only parse the tickets that are not in the database yet
+    tickets = [ticket for ticket in tickets if not ticket_db.is_known(ticket[1])]
     all_items = []
-    for email_id in email_ids:
-        file_path = email_collector.download_attachments(email_id, download_folder)
-        pdf_parser = get_ticket_parser("Mercadona", file_path)
-        if pdf_parser is not None:
-            items = pdf_parser.extract_items()
-            date = pdf_parser.get_date()
-            all_items.append((items, date))
+    for vendor, file_path, (items, date) in iter_parsed_tickets(
+        tickets, workers, cache_path
+    ):
+        ticket_db.upsert_ticket(vendor, file_path, date, items)
+        all_items.append((items, date))
     return all_items
 
 
-def extract_items_from_tickets(tickets_dir: str, vendor: str) -> list:
-    # Get a list of all files in the directory
-    all_files = os.listdir(tickets_dir)
+def extract_items_from_emails(
+    email_ids,
+    email_collector,
+    download_folder,
+    workers: int = 1,
+    cache_path: str = None,
+    ticket_db: TicketDatabase = None,
+):
+    file_paths = email_collector.fetch_attachments(email_ids, download_folder)
+    tickets = [
+        ("Mercadona", file_path)
+        for file_path in file_paths
+        if file_path.lower().endswith(".pdf")
+    ]
+    return parse_new_tickets(tickets, workers, cache_path, ticket_db)
+
+
+def create_chart_renderer(config: dict):
+    """Writes the charts to plot_output when configured, None shows them."""
+    if not config.get("plot_output"):
+        return None
+    return ChartRenderer(
+        config["plot_output"],
+        formats=config.get("plot_formats", ["png"]),
+        background=config.get("plot_background", False),
+    )
 
-    # List to store all the items
-    all_items = []
 
-    # Loop over each file
-    for file_name in all_files:
-        # If the file is a .jpg file and the vendor name is in the file name
-        if file_name.lower().endswith(".jpg") and vendor.lower() in file_name.lower():
-            # Full path to the file
-            file_path = os.path.join(tickets_dir, file_name)
-            print(f"Processing {file_path}...")
+def plot_vendor_expenses(
+    expenses,
+    vendor: str,
+    renderer=None,
+    catalog: ProductCatalog = None,
+    **filters,
+) -> None:
+    """Plot the expenses per month and per item, filters are since/until."""
+    expenses_per_month = expenses.expenses_per_month(vendor=vendor, **filters)
+    expenses_per_item = expenses.expenses_per_item(vendor=vendor, **filters)
+    if catalog is not None:
+        # The OCR variants of a product are added up under its canonical name
+        expenses_per_item = catalog.merge_totals(expenses_per_item)
+
+    if renderer is not None:
+        renderer.expenses_per_month(expenses_per_month, title_vendor=vendor)
+        renderer.expenses_per_item(expenses_per_item, title_vendor=vendor)
+        return
+    plot_expenses_per_month(expenses_per_month, title_vendor=vendor)
+    plot_expenses_per_item(expenses_per_item, title_vendor=vendor)
+    plot_show()
 
-            # Parse the file with the vendor parser
-            jpg_parser = get_ticket_parser(vendor, file_path)
-            items = jpg_parser.extract_items()
-            date = jpg_parser.get_date()
 
-            # Add the items to the all_items list
-            all_items.append((items, date))
+def plot_all_vendors(expenses, renderer=None, **filters) -> None:
+    # Plot the expenses per month for all vendors
+    expenses_per_month = expenses.expenses_per_month(**filters)
+    if renderer is not None:
+        renderer.expenses_per_month(expenses_per_month, title_vendor="All Vendors")
+        written = renderer.close()
+        print(f"Wrote {len(written)} charts to {renderer.output_dir}")
+        return
+    plot_expenses_per_month(expenses_per_month, title_vendor="All Vendors")
+    plot_show()
 
-    return all_items
 
+def print_expenses(expenses, vendors: list, **filters) -> None:
+    """Print the total per vendor and month, filters are since/until."""
+    for vendor in vendors:
+        expenses_per_month = expenses.expenses_per_month(vendor=vendor, **filters)
+        if not expenses_per_month:
+            continue
+        print(f"{vendor}: {sum(expenses_per_month.values()):.2f} €")
+        for (year, month), total in sorted(expenses_per_month.items()):
+            print(f"  {year}-{month} {total:10.2f} €")
+
+
+def create_email_collector(config: dict, password: str):
+    """One IMAP connection, or a pool when imap_connections is configured."""
+    if config.get("imap_connections"):
+        return PooledEmailCollector(
+            config["username"],
+            password,
+            config["imap_url"],
+            connections=config["imap_connections"],
+        )
+    return EmailCollector(config["username"], password, config["imap_url"])
+
+
+def fetch_emails(email_collector, config: dict, state: SyncState = None) -> list:
+    if isinstance(email_collector, PooledEmailCollector):
+        # Any number of senders and folders
+        return email_collector.fetch_emails(
+            config["email_sender"], config.get("mailboxes", ["inbox"]), state
+        )
+    return email_collector.fetch_emails(config["email_sender"], state=state)
+
+
+def run_pipeline(
+    config: dict,
+    email_collector: EmailCollector,
+    workers: int,
+    cache_path: str,
+    ticket_db: TicketDatabase,
+):
+    """Download, parse and aggregate all the vendors concurrently."""
+    local_tickets = []
+    sync_state = None
+    if config.get("sync_state"):
+        sync_state = SyncState(config["sync_state"])
+        email_ids = fetch_emails(email_collector, config, sync_state)
+        print(f"Found {len(email_ids)} new emails.")
+        local_tickets += scan_tickets(config["download_folder"], vendors=["Mercadona"])
+    else:
+        email_ids = fetch_emails(email_collector, config)
+
+    local_tickets += scan_tickets(
+        config["tickets_dir"], recursive=config.get("recursive_scan", False)
+    )
 
-def extract_total_per_month(dicts):
-    result = defaultdict(float)
-    for d in dicts:
-        for key, value in d.items():
-            result[key] += value
-    return result
+    pipeline = TicketPipeline(workers, cache_path, ticket_db)
+    expenses = asyncio.run(
+        pipeline.run(
+            local_tickets, email_collector, email_ids, config["download_folder"]
+        )
+    )
+    if sync_state is not None:
+        email_collector.save_sync_state(sync_state)
+    return expenses
 
 
-def main(yaml_conf: str) -> None:
-    with open(yaml_conf, "r") as stream:
-        config = yaml.safe_load(stream)
-    with open(config["password"], "r") as f:
-        password = f.read()
+def open_ticket_stores(config: dict) -> tuple:
+    """The parse cache path and the ticket database, both optional."""
+    # Optional cache of already parsed tickets
+    cache_path = config.get("parse_cache")
+    if cache_path:
+        cache = ParseCache(cache_path)
+        cache.prune(get_parser_versions())
+        cache.close()
+
+    # Optional database of parsed tickets, only new tickets are parsed and
+    # the charts are built from its aggregates
+    ticket_db = None
+    if config.get("ticket_db"):
+        ticket_db = TicketDatabase(config["ticket_db"])
+    return cache_path, ticket_db
 
+
+def collect_expenses(config: dict, password: str) -> None:
     print(f"Connecting to {config['imap_url']}...")
     print(f"Fetching emails from {config['email_sender']}...")
     print(f"and downloading attachments to {config['download_folder']}...")
-    email_collector = EmailCollector(config["username"], password, config["imap_url"])
+    email_collector = create_email_collector(config, password)
     email_collector.connect()
 
-    email_ids = email_collector.fetch_emails(config["email_sender"])
+    # Number of processes used to parse tickets
+    workers = config.get("workers", 1)
+
+    cache_path, ticket_db = open_ticket_stores(config)
+
+    # Headless rendering of the charts to files instead of GUI windows
+    renderer = create_chart_renderer(config)
+
+    # Optional catalog of canonical product names, see src/product_catalog.py
+    catalog = None
+    if config.get("product_catalog"):
+        catalog = ProductCatalog(config["product_catalog"])
+
+    if config.get("pipeline"):
+        expenses = run_pipeline(config, email_collector, workers, cache_path, ticket_db)
+        for parser_class in PARSER_CLASSES.values():
+            plot_vendor_expenses(expenses, parser_class.VENDOR, renderer, catalog)
+        plot_all_vendors(expenses, renderer)
+        if catalog is not None:
+            catalog.save()
+        return
+
+    if config.get("sync_state"):
+        # Incremental sync: only download emails newer than the last run and
+        # parse every ticket already in the download folder
+        sync_state = SyncState(config["sync_state"])
+        email_ids = fetch_emails(email_collector, config, sync_state)
+        print(f"Found {len(email_ids)} new emails.")
+        email_collector.fetch_attachments(email_ids, config["download_folder"])
+        email_collector.save_sync_state(sync_state)
+
+        all_items_mercadona = parse_new_tickets(
+            scan_tickets(config["download_folder"], vendors=["Mercadona"]),
+            workers,
+            cache_path,
+            ticket_db,
+        )
+    else:
+        email_ids = fetch_emails(email_collector, config)
+
+        all_items_mercadona = extract_items_from_emails(
+            email_ids,
+            email_collector,
+            config["download_folder"],
+            workers=workers,
+            cache_path=cache_path,
+            ticket_db=ticket_db,
+        )
+
+    # Column store with the items of all the vendors, or the database which
+    # already holds them
+    expenses = ExpenseTable() if ticket_db is None else ticket_db
+    if ticket_db is None:
+        expenses.extend(all_items_mercadona, vendor="Mercadona")
+
+    plot_vendor_expenses(expenses, "Mercadona", renderer, catalog)
 
-    all_items_mercadona = extract_items_from_emails(
-        email_ids, email_collector, config["download_folder"]
+    print(f"Fetching tickets from {config['tickets_dir']}...")
+    # A single scan of the tickets directory classifies the tickets of all
+    # the other vendors, the Mercadona ones come from the emails and would
+    # be counted twice
+    vendors = [
+        parser_class.VENDOR
+        for parser_class in PARSER_CLASSES.values()
+        if parser_class.VENDOR != "Mercadona"
+    ]
+    tickets = scan_tickets(
+        config["tickets_dir"],
+        recursive=config.get("recursive_scan", False),
+        vendors=vendors,
     )
 
-    # Dictionary to store the total expenses per month
-    expenses_per_month_mercadona = extract_expenses_per_month(all_items_mercadona)
-    expenses_per_item = extract_expenses_per_item(all_items_mercadona)
+    for vendor, vendor_tickets in group_by_vendor(tickets).items():
+        all_items = parse_new_tickets(vendor_tickets, workers, cache_path, ticket_db)
 
-    # Plot the expenses per month and per item
-    plot_expenses_per_month(expenses_per_month_mercadona, title_vendor="Mercadona")
-    plot_expenses_per_item(expenses_per_item, title_vendor="Mercadona")
-    plot_show()
+        if ticket_db is None:
+            expenses.extend(all_items, vendor=vendor)
 
-    print(f"Fetching tickets from {config['tickets_dir']}...")
-    # Directory containing the tickets
-    tickets_dir = config["tickets_dir"]
+        plot_vendor_expenses(expenses, vendor, renderer, catalog)
 
-    # List to store all the items for Granel vendor
-    all_items_granel = extract_items_from_tickets(tickets_dir, "Granel")
+    plot_all_vendors(expenses, renderer)
+    if catalog is not None:
+        catalog.save()
 
-    # Dictionary to store the total expenses per month and per item
-    expenses_per_month_granel = extract_expenses_per_month(all_items_granel)
-    expenses_per_item = extract_expenses_per_item(all_items_granel)
 
-    # Plot the expenses per month and per item
-    plot_expenses_per_month(expenses_per_month_granel, title_vendor="Granel")
-    plot_expenses_per_item(expenses_per_item, title_vendor="Granel")
-    plot_show()
+def sync_emails(config: dict, password: str) -> list[str]:
+    """Download the attachments of the new emails, returns their paths."""
+    print(f"Connecting to {config['imap_url']}...")
+    email_collector = create_email_collector(config, password)
+    email_collector.connect()
 
-    # List to store all the items for Fruteria vendor
-    all_items_fruteria = extract_items_from_tickets(tickets_dir, "Fruteria")
+    sync_state = None
+    if config.get("sync_state"):
+        sync_state = SyncState(config["sync_state"])
+    email_ids = fetch_emails(email_collector, config, sync_state)
+    print(f"Found {len(email_ids)} emails.")
+    file_paths = email_collector.fetch_attachments(email_ids, config["download_folder"])
+    if sync_state is not None:
+        email_collector.save_sync_state(sync_state)
+    email_collector.close()
+    return file_paths
+
+
+def select_tickets(
+    config: dict, vendors: list = None, since: int = None, until: int = None
+) -> list:
+    """(vendor, file_path) of the downloaded and local tickets to parse.
+
+    Vendors and dates are filtered on the file paths, before any parsing.
+    """
+    tickets = []
+    if vendors is None or "Mercadona" in vendors:
+        tickets += scan_tickets(config["download_folder"], vendors=["Mercadona"])
+    tickets += scan_tickets(
+        config["tickets_dir"],
+        recursive=config.get("recursive_scan", False),
+        vendors=vendors,
+    )
+    # The download folder may also be the tickets directory
+    tickets = list(dict.fromkeys(tickets))
+    return filter_by_date(tickets, since, until)
 
-    # Dictionary to store the total expenses per month and per item
-    expenses_per_month_fruteria = extract_expenses_per_month(all_items_fruteria)
-    expenses_per_item = extract_expenses_per_item(all_items_fruteria)
 
-    # Plot the expenses per month and per item
-    plot_expenses_per_month(expenses_per_month_fruteria, title_vendor="Fruteria")
-    plot_expenses_per_item(expenses_per_item, title_vendor="Fruteria")
-    plot_show()
+def parse_selected_tickets(config: dict, options: dict):
+    """Parse the tickets selected by the options.
 
-    # Plot the expenses per month and per item for all vendors
-    total_expenses_per_month = extract_total_per_month(
-        [
-            expenses_per_month_mercadona,
-            expenses_per_month_granel,
-            expenses_per_month_fruteria,
-        ]
+    Returns the aggregates: the ticket database if one is configured, an
+    ExpenseTable of the parsed tickets otherwise.
+    """
+    cache_path, ticket_db = open_ticket_stores(config)
+    workers = options["workers"] or config.get("workers", 1)
+    tickets = select_tickets(
+        config, options["vendors"], options["since"], options["until"]
     )
-    plot_expenses_per_month(total_expenses_per_month, title_vendor="All Vendors")
-    plot_show()
+    print(f"Parsing {len(tickets)} tickets...")
+
+    expenses = ExpenseTable() if ticket_db is None else ticket_db
+    for vendor, vendor_tickets in group_by_vendor(tickets).items():
+        all_items = parse_new_tickets(vendor_tickets, workers, cache_path, ticket_db)
+        if ticket_db is None:
+            expenses.extend(all_items, vendor=vendor)
+    return expenses
+
+
+def report_expenses(config: dict, expenses, options: dict) -> None:
+    """Print the totals and plot the charts of the selected vendors."""
+    vendors = options["vendors"]
+    if vendors is None:
+        vendors = [parser_class.VENDOR for parser_class in PARSER_CLASSES.values()]
+    filters = {"since": options["since"], "until": options["until"]}
+    print_expenses(expenses, vendors, **filters)
+    if not options["plot"]:
+        return
+
+    renderer = create_chart_renderer(config)
+    catalog = None
+    if config.get("product_catalog"):
+        catalog = ProductCatalog(config["product_catalog"])
+    for vendor in vendors:
+        plot_vendor_expenses(expenses, vendor, renderer, catalog, **filters)
+    if options["vendors"] is None:
+        plot_all_vendors(expenses, renderer, **filters)
+    elif renderer is not None:
+        renderer.close()
+    if catalog is not None:
+        catalog.save()
+
+
+def parse_date(value: str) -> int:
+    """YYYYMMDD or YYYY-MM-DD as a YYYYMMDD int, None stays None."""
+    if value is None:
+        return None
+    digits = value.replace("-", "")
+    if len(digits) != 8 or not digits.isdigit():
+        raise SystemExit(f"Invalid date {value}, use YYYYMMDD or YYYY-MM-DD")
+    return int(digits)
+
+
+def parse_options(args: dict) -> dict:
+    """The vendors, date window, workers and plotting of a command."""
+    vendors = None
+    if args["--vendor"]:
+        vendors = []
+        for name in args["--vendor"].split(","):
+            parser_class = PARSER_CLASSES.get(name.strip().upper())
+            if parser_class is None:
+                known = ", ".join(c.VENDOR for c in PARSER_CLASSES.values())
+                raise SystemExit(f"Unknown vendor {name}, use one of: {known}")
+            vendors.append(parser_class.VENDOR)
+    return {
+        "vendors": vendors,
+        "since": parse_date(args["--since"]),
+        "until": parse_date(args["--until"]),
+        "workers": int(args["--workers"]) if args["--workers"] else None,
+        "plot": not args["--no-plot"],
+    }
+
+
+def run_command(command: str, config: dict, options: dict) -> None:
+    if command == "sync":
+        sync_emails(config, read_password(config))
+    elif command == "parse":
+        expenses = parse_selected_tickets(config, options)
+        report_expenses(config, expenses, options)
+    else:
+        if not config.get("ticket_db"):
+            raise SystemExit("report reads the expenses from the ticket_db")
+        report_expenses(config, TicketDatabase(config["ticket_db"]), options)
+
+
+def read_password(config: dict) -> str:
+    with open(config["password"], "r") as f:
+        return f.read()
+
+
+def main(yaml_conf: str, command: str = None, options: dict = None) -> None:
+    with open(yaml_conf, "r") as stream:
+        config = yaml.safe_load(stream)
+
+    # Optional timings, bytes and items of every stage, see
+    # src/instrumentation.py
+    if config.get("instrumentation") or config.get("trace"):
+        instrumentation.enable()
+
+    with instrumentation.profile(config.get("profile")):
+        if command is None:
+            collect_expenses(config, read_password(config))
+        else:
+            run_command(command, config, options)
+
+    if instrumentation.is_enabled():
+        print(instrumentation.format_summary())
+        if config.get("trace"):
+            instrumentation.write_trace(config["trace"])
+            print(f"Trace written to {config['trace']}")
 
 
 if __name__ == "__main__":
     args = docopt(__doc__)
     yaml_conf = args["YAMLCONF"]
-    main(yaml_conf)
+    command = next((command for command in COMMANDS if args[command]), None)
+    main(yaml_conf, command, parse_options(args))
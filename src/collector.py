@@ -1,50 +1,267 @@
 import imaplib
-import email
-
 import os
+import tempfile
+from email.parser import BytesFeedParser
+
+from src import instrumentation
+from src.imap_parser import (
+    compress_uid_set,
+    decode_mime_words,
+    find_attachments,
+    iter_decoded_payload,
+    parse_fetch_response,
+    split_by_size,
+)
+from src.sync_state import SyncState
+
+ATTACHMENT_TYPES = ("application/pdf", "image/jpeg")
+ATTACHMENT_EXTENSIONS = (".pdf", ".jpg", ".jpeg")
+# Bytes of a raw email fed to the parser at a time
+FEED_CHUNK_SIZE = 1 << 16
+# Encoded attachment bytes requested in one FETCH command, imaplib holds the
+# whole response of a command in memory
+FETCH_MAX_BYTES = 32 << 20
+
+
+def write_attachment(payload, encoding: str, file_path: str) -> None:
+    """Decode an attachment payload to file_path in chunks.
+
+    The file is written under a temporary name and renamed once complete, so
+    an interrupted download never leaves a truncated ticket behind.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path) or ".", suffix=".part"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter_decoded_payload(payload, encoding):
+                f.write(chunk)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
 
 class EmailCollector:
-    def __init__(self, username: str, password: str, imap_url: str) -> None:
+    def __init__(
+        self, username: str, password: str, imap_url: str, timeout: float = None
+    ) -> None:
         self.username = username
         self.password = password
         self.imap_url = imap_url
+        self.timeout = timeout
         self.mail = None
+        self.mailbox = None
+        self.pending_sync = None
 
     def connect(self) -> None:
         """Connect to the email server."""
-        self.mail = imaplib.IMAP4_SSL(self.imap_url)
+        self.mail = imaplib.IMAP4_SSL(self.imap_url, timeout=self.timeout)
         self.mail.login(self.username, self.password)
+        # After a reconnect, UIDs refer to the previously selected mailbox
+        if self.mailbox is not None:
+            self.mail.select(self.mailbox)
+
+    @property
+    def connected(self) -> bool:
+        return self.mail is not None
+
+    def select(self, mailbox: str) -> None:
+        """Select the mailbox, unless it is already selected."""
+        if mailbox != self.mailbox:
+            self.mail.select(mailbox)
+            self.mailbox = mailbox
+
+    def noop(self) -> None:
+        """Keep the connection alive, raises if the server dropped it."""
+        if self.mail is None:
+            raise imaplib.IMAP4.abort("not connected")
+        self.mail.noop()
+
+    def close(self) -> None:
+        """Log out, ignoring a connection that is already broken."""
+        if self.mail is None:
+            return
+        try:
+            self.mail.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        self.mail = None
+
+    def _select_status(self, mailbox: str) -> tuple:
+        """Select the mailbox and return its (UIDVALIDITY, UIDNEXT)."""
+        self.mail.select(mailbox)
+        self.mailbox = mailbox
+        _, uidvalidity = self.mail.response("UIDVALIDITY")
+        _, uidnext = self.mail.response("UIDNEXT")
+        uidvalidity = int(uidvalidity[0]) if uidvalidity[0] else 0
+        uidnext = int(uidnext[0]) if uidnext[0] else 0
+        return uidvalidity, uidnext
+
+    @instrumentation.timed("fetch_emails", count_items=instrumentation.result_len)
+    def fetch_emails(
+        self, sender: str, mailbox: str = "inbox", state: SyncState = None
+    ) -> list:
+        """Search for emails based on the given criteria.
 
-    def fetch_emails(self, sender: str) -> list:
-        """Search for emails based on the given criteria."""
-        self.mail.select("inbox")
-        result, data = self.mail.uid("search", None, f"(FROM {sender})")
-        email_ids = data[0].split()
+        If a sync state is given only UIDs newer than the last synced one are
+        returned, unless the mailbox UIDVALIDITY changed (full resync).
+        Call save_sync_state once the returned emails have been processed.
+        """
+        if state is None:
+            self.select(mailbox)
+            result, data = self.mail.uid("search", None, f"(FROM {sender})")
+            email_ids = data[0].split()
+            return email_ids
+
+        uidvalidity, uidnext = self._select_status(mailbox)
+        last_uid = state.get_last_uid(mailbox, sender, uidvalidity)
+        if last_uid and uidnext and uidnext <= last_uid + 1:
+            # Nothing arrived in the mailbox since the last run
+            self.pending_sync = None
+            return []
+
+        if last_uid:
+            criteria = f"(UID {last_uid + 1}:* FROM {sender})"
+        else:
+            criteria = f"(FROM {sender})"
+        result, data = self.mail.uid("search", None, criteria)
+        # "UID n:*" always matches the highest UID, even when it is below n
+        email_ids = [uid for uid in data[0].split() if int(uid) > last_uid]
+
+        new_last_uid = max([last_uid, uidnext - 1] + [int(uid) for uid in email_ids])
+        self.pending_sync = (mailbox, sender, uidvalidity, new_last_uid)
         return email_ids
 
-    def download_attachments(self, email_id: str, download_folder: str) -> str:
-        """Download PDF attachments from the specified emails."""
+    def save_sync_state(self, state: SyncState) -> None:
+        """Persist the position reached by the last incremental fetch_emails."""
+        if self.pending_sync is None:
+            return
+        state.update(*self.pending_sync)
+        state.save()
+        self.pending_sync = None
+
+    @instrumentation.timed(
+        "download_attachments",
+        count_bytes=instrumentation.result_files_size,
+        count_items=instrumentation.result_len,
+    )
+    def download_attachments(self, email_id: str, download_folder: str) -> list[str]:
+        """Download the attachments of an email and return their paths.
+
+        The raw email is parsed as bytes and every attachment is decoded to
+        disk in chunks, without a decoded copy of the whole attachment.
+        """
         result, email_data = self.mail.uid("fetch", email_id, "(BODY.PEEK[])")
-        raw_email = email_data[0][1].decode("utf-8")
-        email_message = email.message_from_string(raw_email)
+        raw_email = email_data[0][1]
+        parser = BytesFeedParser()
+        for start in range(0, len(raw_email), FEED_CHUNK_SIZE):
+            parser.feed(raw_email[start : start + FEED_CHUNK_SIZE])
+        # Only the parsed message is kept from here on
+        del raw_email, email_data
+        email_message = parser.close()
+
+        file_paths = []
         for part in email_message.walk():
             if part.get_content_maintype() == "multipart":
                 continue
             if part.get("Content-Disposition") is None:
                 continue
             file_name = part.get_filename()
-            if bool(file_name):
+            if not file_name:
+                continue
+            # Named like fetch_attachments does, RFC 2047 words decoded
+            file_name = decode_mime_words(file_name)
+            file_path = os.path.join(download_folder, file_name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            if not os.path.isfile(file_path):
+                print(f"Downloading {file_name}...")
+                encoding = part.get("Content-Transfer-Encoding", "7bit")
+                write_attachment(
+                    part.get_payload(), encoding.strip().lower(), file_path
+                )
+                print(f"Download of {file_name} completed.")
+            else:
+                print(f"File {file_name} already exists!")
+            file_paths.append(file_path)
+        return file_paths
+
+    def _is_wanted_attachment(self, attachment: dict) -> bool:
+        return attachment["content_type"] in ATTACHMENT_TYPES or attachment[
+            "filename"
+        ].lower().endswith(ATTACHMENT_EXTENSIONS)
+
+    @instrumentation.timed(
+        "fetch_section",
+        count_bytes=instrumentation.result_files_size,
+        count_items=instrumentation.result_len,
+    )
+    def _fetch_section(
+        self, section: str, attachments: dict, download_folder: str
+    ) -> list[str]:
+        """Download the same MIME section of many emails, {uid: attachment}."""
+        file_paths = []
+        sizes = {uid: attachment["size"] for uid, attachment in attachments.items()}
+        for uids in split_by_size(sizes, FETCH_MAX_BYTES):
+            result, data = self.mail.uid(
+                "fetch", compress_uid_set(uids), f"(UID BODY.PEEK[{section}])"
+            )
+            bodies = parse_fetch_response(data)
+            for uid in uids:
+                payload = bodies.get(uid, {}).get(f"BODY[{section}]")
+                if payload is None:
+                    continue
+                file_name = attachments[uid]["filename"]
                 file_path = os.path.join(download_folder, file_name)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                if not os.path.isfile(file_path):
-                    with open(file_path, "wb") as f:
-                        print(f"Downloading {file_name}...")
-                        f.write(part.get_payload(decode=True))
-                    print(f"Download of {file_name} completed.")
-                else:
-                    print(f"File {file_name} already exists!")
-        return file_path
+                print(f"Downloading {file_name}...")
+                write_attachment(payload, attachments[uid]["encoding"], file_path)
+                file_paths.append(file_path)
+        return file_paths
+
+    @instrumentation.timed(
+        "fetch_attachments",
+        count_bytes=instrumentation.result_files_size,
+        count_items=instrumentation.result_len,
+    )
+    def fetch_attachments(
+        self, email_ids: list, download_folder: str, batch_size: int = 500
+    ) -> list[str]:
+        """Download PDF/JPEG attachments of many emails in batched commands.
+
+        The BODYSTRUCTURE of a whole batch is fetched in one command, and only
+        the MIME sections holding wanted attachments are downloaded afterwards,
+        grouping the UIDs that share the same section number. Each of these
+        commands asks for at most FETCH_MAX_BYTES of attachments, going by
+        their BODYSTRUCTURE size, and the attachments are written to disk
+        straight from the response, so memory doesn't grow with batch_size.
+        """
+        file_paths = []
+        os.makedirs(download_folder, exist_ok=True)
+        for i in range(0, len(email_ids), batch_size):
+            batch = email_ids[i : i + batch_size]
+            result, data = self.mail.uid(
+                "fetch", compress_uid_set(batch), "(UID BODYSTRUCTURE)"
+            )
+            structures = parse_fetch_response(data)
+
+            # Section number -> {uid: attachment}
+            sections = {}
+            for uid, items in structures.items():
+                for attachment in find_attachments(items["BODYSTRUCTURE"]):
+                    if not self._is_wanted_attachment(attachment):
+                        continue
+                    file_path = os.path.join(download_folder, attachment["filename"])
+                    if os.path.isfile(file_path):
+                        print(f"File {attachment['filename']} already exists!")
+                        file_paths.append(file_path)
+                        continue
+                    sections.setdefault(attachment["section"], {})[uid] = attachment
+
+            for section, attachments in sections.items():
+                file_paths.extend(
+                    self._fetch_section(section, attachments, download_folder)
+                )
+        return file_paths
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+from array import array
+
+import numpy as np
+
+GROUP_KEYS = ("vendor", "year", "month", "date", "product")
+
+
+class StringTable:
+    """Interns strings so that each distinct value is stored only once."""
+
+    def __init__(self) -> None:
+        self.ids = {}
+        self.values = []
+
+    def intern(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[value] = string_id
+            self.values.append(value)
+        return string_id
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ExpenseTable:
+    """Compact column store of ticket items with vectorized aggregations.
+
+    Every item is one row with typed columns: vendor and product ids (into
+    interned string tables), the date as an int (YYYYMMDD), units, weight,
+    unit price and total price. Missing numeric values are stored as NaN.
+    """
+
+    def __init__(self) -> None:
+        self.vendors = StringTable()
+        self.products = StringTable()
+        self.vendor = array("H")
+        self.date = array("l")
+        self.product = array("l")
+        self.units = array("f")
+        self.weight_kg = array("f")
+        self.unit_price = array("d")
+        self.total_price = array("d")
+
+    @classmethod
+    def from_items(cls, all_items: list, vendor: str = "") -> "ExpenseTable":
+        table = cls()
+        table.extend(all_items, vendor)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.total_price)
+
+    def append_ticket(self, vendor: str, items: list[dict], date: str) -> None:
+        vendor_id = self.vendors.intern(vendor)
+        date = int(date) if date.isdigit() else 0
+        for item in items:
+            self.vendor.append(vendor_id)
+            self.date.append(date)
+            self.product.append(self.products.intern(item["product"]))
+            self.units.append(item.get("units", np.nan))
+            self.weight_kg.append(item.get("weight_kg", np.nan))
+            unit_price = item.get("price_per_unit", item.get("price_per_kg"))
+            self.unit_price.append(np.nan if unit_price is None else unit_price)
+            self.total_price.append(item["total_price"])
+
+    def extend(self, all_items: list, vendor: str = "") -> None:
+        """Add (items, date) tuples as returned by the ticket parsers."""
+        for items, date in all_items:
+            self.append_ticket(vendor, items, date)
+
+    def merge(self, other: "ExpenseTable") -> None:
+        """Append all the rows of another table."""
+        vendor_map = np.array(
+            [self.vendors.intern(v) for v in other.vendors.values], dtype="H"
+        )
+        product_map = np.array(
+            [self.products.intern(p) for p in other.products.values], dtype="l"
+        )
+        if len(other):
+            vendors = vendor_map[other.column("vendor")]
+            products = product_map[other.column("product")]
+            self.vendor.frombytes(vendors.tobytes())
+            self.product.frombytes(products.tobytes())
+        self.date.extend(other.date)
+        self.units.extend(other.units)
+        self.weight_kg.extend(other.weight_kg)
+        self.unit_price.extend(other.unit_price)
+        self.total_price.extend(other.total_price)
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy numpy view of a column.
+
+        Don't keep the view around while appending rows, the array can't be
+        resized while it is exported.
+        """
+        column = getattr(self, name)
+        return np.frombuffer(column, dtype=column.typecode)
+
+    def _key_column(self, key: str) -> np.ndarray:
+        if key == "year":
+            return self.column("date") // 10000
+        if key == "month":
+            return self.column("date") // 100 % 100
+        return self.column(key)
+
+    def _key_label(self, key: str, value: int):
+        if key == "vendor":
+            return self.vendors.values[value]
+        if key == "product":
+            return self.products.values[value]
+        if key == "year":
+            return f"{value:04d}"
+        if key == "month":
+            return f"{value:02d}"
+        return f"{value:08d}"
+
+    def _mask(self, vendor: str = None, since: int = None, until: int = None):
+        mask = np.ones(len(self), dtype=bool)
+        if vendor is not None:
+            vendor_id = self.vendors.ids.get(vendor)
+            if vendor_id is None:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.column("vendor") == vendor_id
+        if since is not None:
+            mask &= self.column("date") >= since
+        if until is not None:
+            mask &= self.column("date") <= until
+        return mask
+
+    def group_by(
+        self,
+        *keys: str,
+        vendor: str = None,
+        since: int = None,
+        until: int = None,
+    ) -> dict:
+        """Sum the total price grouped by the given keys.
+
+        Keys are any of GROUP_KEYS. With one key the result is keyed by its
+        label, with several by a tuple of labels. vendor, since and until
+        (YYYYMMDD) filter the rows first.
+        """
+        for key in keys:
+            if key not in GROUP_KEYS:
+                raise ValueError(f"Unknown group key: {key}")
+
+        mask = self._mask(vendor, since, until)
+        totals = self.column("total_price")[mask]
+        if not len(totals):
+            return {}
+
+        # Combine the keys into one dense int64 code per row
+        codes = np.zeros(len(totals), dtype=np.int64)
+        key_values = []
+        for key in keys:
+            column = self._key_column(key)[mask]
+            if key in ("vendor", "product"):
+                # Interned ids are already dense
+                values = np.arange(len(getattr(self, key + "s")))
+                index = column
+            else:
+                values, index = np.unique(column, return_inverse=True)
+            codes = codes * len(values) + index
+            key_values.append(values)
+
+        groups, inverse = np.unique(codes, return_inverse=True)
+        sums = np.bincount(inverse, weights=totals, minlength=len(groups))
+
+        result = {}
+        for code, total in zip(groups.tolist(), sums.tolist()):
+            labels = []
+            for key, values in zip(reversed(keys), reversed(key_values)):
+                code, index = divmod(code, len(values))
+                labels.append(self._key_label(key, int(values[index])))
+            labels.reverse()
+            result[labels[0] if len(keys) == 1 else tuple(labels)] = total
+        return result
+
+    def expenses_per_month(self, **filters) -> dict:
+        """Total per (year, month), both as strings."""
+        return self.group_by("year", "month", **filters)
+
+    def expenses_per_item(self, **filters) -> dict:
+        return self.group_by("product", **filters)
+
+    def expenses_per_vendor(self, **filters) -> dict:
+        return self.group_by("vendor", **filters)
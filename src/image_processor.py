@@ -2,21 +2,131 @@ import numpy as np
 from scipy.ndimage import rotate
 import cv2
 
+from src import instrumentation
+
+DESKEW_METHODS = ("exhaustive", "coarse_to_fine")
+PREPROCESS_MODES = ("standard", "fast")
+# Limits of quality_metrics within which a photo is clean enough for
+# enhance_image_light
+CLEAN_IMAGE_THRESHOLDS = {
+    "min_contrast": 0.5,
+    "min_sharpness": 100.0,
+    "max_illumination": 0.15,
+    "max_noise": 5.0,
+}
+# JPEG start of frame markers, they hold the size of the image
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Bytes read from a file to find its JPEG size, after the EXIF data
+JPEG_HEADER_SIZE = 1 << 17
+# (reduction, grayscale) -> flag decoding the JPEG at 1/reduction its size
+REDUCED_FLAGS = {
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+    (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def jpeg_size(data: bytes) -> tuple:
+    """(height, width) from the JPEG header in data, or None."""
+    data = bytes(data[:JPEG_HEADER_SIZE])
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+        elif marker in SOF_MARKERS:
+            height = int.from_bytes(data[pos + 5 : pos + 7], "big")
+            width = int.from_bytes(data[pos + 7 : pos + 9], "big")
+            return height, width
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length
+            pos += 2
+        else:
+            pos += 2 + int.from_bytes(data[pos + 2 : pos + 4], "big")
+    return None
+
+
+def _gray(img: np.ndarray) -> np.ndarray:
+    # Photos decoded in grayscale are already a single plane
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
 
 class ImageProcessor:
-    def __init__(self, img_path: str) -> None:
-        self.img = cv2.imread(img_path)
+    @instrumentation.timed("imread")
+    def __init__(
+        self, img_path, target_height: int = None, grayscale: bool = False
+    ) -> None:
+        """Decode a photo from a path, or from its encoded bytes.
+
+        img_path can also be bytes, a memoryview or a numpy (memory mapped)
+        buffer, e.g. an attachment straight from the downloader. With a
+        target_height the JPEG is decoded at 1/2, 1/4 or 1/8 of its size as
+        long as its long side (the height of a ticket) stays above the target,
+        and is then downscaled to it. grayscale decodes a single plane, for
+        the preprocessing that starts with a grayscale conversion.
+        """
+        buffer = None
+        if isinstance(img_path, str):
+            if target_height is not None:
+                with open(img_path, "rb") as f:
+                    size = jpeg_size(f.read(JPEG_HEADER_SIZE))
+        else:
+            # Zero-copy view of the encoded bytes
+            buffer = np.frombuffer(img_path, dtype=np.uint8)
+            if target_height is not None:
+                size = jpeg_size(buffer[:JPEG_HEADER_SIZE])
+
+        flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+        if target_height is not None and size is not None:
+            reduction = 8
+            while reduction > 1 and max(size) / reduction < target_height:
+                reduction //= 2
+            flags = REDUCED_FLAGS.get((reduction, grayscale), flags)
+
+        if buffer is None:
+            self.img = cv2.imread(img_path, flags)
+        else:
+            self.img = cv2.imdecode(buffer, flags)
+        if self.img is None:
+            raise ValueError(f"Could not decode the image {img_path!r:.80}")
 
+        if target_height is not None:
+            scale = target_height / max(self.img.shape[:2])
+            # Small differences aren't worth a resize
+            if scale < 0.9:
+                self.img = cv2.resize(
+                    self.img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+                )
+
+    @instrumentation.timed("enhance_image", count_bytes=instrumentation.result_nbytes)
     def enhance_image(
         self,
         deskew_limit,
+        deskew_method: str = "exhaustive",
         high_contrast: bool = True,
         gaussian_blur: bool = True,
         show: bool = False,
+        mode: str = "standard",
     ) -> np.ndarray:
+        if mode not in PREPROCESS_MODES:
+            raise ValueError(f"Unknown preprocessing mode: {mode}")
+
+        if mode == "fast":
+            return self.enhance_image_fast(
+                deskew_limit, gaussian_blur=gaussian_blur, show=show
+            )
+
         self.img = self.rescale_image()
 
-        self.img = self.deskew_image(limit=deskew_limit)
+        self.img = self.deskew_image(limit=deskew_limit, method=deskew_method)
         self.img = self.remove_shadows()
 
         if high_contrast:
@@ -30,23 +140,195 @@ class ImageProcessor:
 
         return self.img
 
-    def deskew_image(self, delta: float = 0.2, limit: float = 3) -> np.ndarray:
-        def determine_score(arr, angle):
-            data = rotate(arr, angle, reshape=False, order=0)
-            histogram = np.sum(data, axis=1)
-            score = np.sum((histogram[1:] - histogram[:-1]) ** 2)
-            return histogram, score
+    @instrumentation.timed(
+        "enhance_image_fast", count_bytes=instrumentation.result_nbytes
+    )
+    def enhance_image_fast(
+        self,
+        deskew_limit,
+        scale: float = 1.2,
+        gaussian_blur: bool = True,
+        show: bool = False,
+    ) -> np.ndarray:
+        """Same steps as enhance_image on a single grayscale plane.
 
-        gray = cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
-        thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        The image goes to grayscale first, the skew angle is estimated on a
+        downsampled copy and rotation and upscaling are applied together in
+        one warpAffine, so the expensive steps never see a 1.44x color image.
+        """
+        self.img = self.grayscale_image()
+
+        thresh = cv2.threshold(
+            self.img, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+        )[1]
+        angle = self._coarse_to_fine_skew_angle(thresh, delta=0.2, limit=deskew_limit)
+        self.img = self._rotate_and_scale(self.img, angle, scale)
+
+        self.img = self.remove_shadows()
 
+        if gaussian_blur:
+            self.img = self.remove_noise()
+
+        if show:
+            self.show_image()
+
+        return self.img
+
+    @instrumentation.timed(
+        "enhance_image_light", count_bytes=instrumentation.result_nbytes
+    )
+    def enhance_image_light(
+        self, skew_angle: float = 0.0, scale: float = 1.2, show: bool = False
+    ) -> np.ndarray:
+        """Light preprocessing for clean photos, see quality_metrics.
+
+        Grayscale, one warpAffine for the skew angle and the upscaling, and
+        an Otsu threshold. self.img is left untouched, so enhance_image can
+        still run on the original photo if the result isn't good enough.
+        """
+        img = _gray(self.img)
+        img = self._rotate_and_scale(img, skew_angle, scale)
+        img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+        if show:
+            cv2.imshow("Light preprocessing", img)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+
+        return img
+
+    @instrumentation.timed("quality_metrics")
+    def quality_metrics(self, deskew_limit: float = 3, max_width: int = 800) -> dict:
+        """Cheap quality estimates computed on a downsampled grayscale copy.
+
+        contrast: gray level difference between paper and ink (0-1)
+        sharpness: variance of the Laplacian, low for blurry photos
+        illumination: brightness range of the paper (0-1), high with shadows
+        noise: standard deviation of the paper pixels around their median
+        skew: rotation in degrees that straightens the photo
+        """
+        gray = _gray(self.img)
+        scale = min(1.0, max_width / gray.shape[1])
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        # Otsu splits the pixels into paper (255) and ink (0)
+        paper = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        is_paper = paper > 0
+        if is_paper.all() or not is_paper.any():
+            contrast = 0.0
+        else:
+            contrast = (small[is_paper].mean() - small[~is_paper].mean()) / 255
+
+        smooth = cv2.medianBlur(small, 3)
+        sharpness = cv2.Laplacian(smooth, cv2.CV_64F).var()
+
+        # Paper far from any ink, so that glyph edges don't count as noise
+        is_paper = cv2.erode(paper, np.ones((5, 5), np.uint8)) > 0
+        residual = small.astype(np.float32) - smooth
+        noise = float(residual[is_paper].std()) if is_paper.any() else 0.0
+
+        # Dilating removes the ink, what is left is the paper brightness
+        background = cv2.dilate(small, np.ones((15, 15), np.uint8))
+        background = cv2.resize(background, (16, 16), interpolation=cv2.INTER_AREA)
+        illumination = (int(background.max()) - int(background.min())) / 255
+
+        skew = self._coarse_to_fine_skew_angle(255 - paper, 0.2, deskew_limit)
+
+        return {
+            "contrast": float(contrast),
+            "sharpness": float(sharpness),
+            "illumination": illumination,
+            "noise": noise,
+            "skew": float(skew),
+        }
+
+    @staticmethod
+    def is_clean(metrics: dict, thresholds: dict = CLEAN_IMAGE_THRESHOLDS) -> bool:
+        return (
+            metrics["contrast"] >= thresholds["min_contrast"]
+            and metrics["sharpness"] >= thresholds["min_sharpness"]
+            and metrics["illumination"] <= thresholds["max_illumination"]
+            and metrics["noise"] <= thresholds["max_noise"]
+        )
+
+    @staticmethod
+    def _rotate_and_scale(img: np.ndarray, angle: float, scale: float) -> np.ndarray:
+        # Rotation and upscaling in a single interpolation
+        (h, w) = img.shape[:2]
+        (new_h, new_w) = (int(round(h * scale)), int(round(w * scale)))
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, scale)
+        # Move the rotation center to the center of the upscaled image
+        M[0, 2] += (new_w - w) / 2
+        M[1, 2] += (new_h - h) / 2
+        return cv2.warpAffine(
+            img,
+            M,
+            (new_w, new_h),
+            flags=cv2.INTER_CUBIC,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+
+    @staticmethod
+    def _projection_score(arr: np.ndarray) -> float:
+        histogram = np.sum(arr, axis=1, dtype=np.float64)
+        return np.sum((histogram[1:] - histogram[:-1]) ** 2)
+
+    def _exhaustive_skew_angle(
+        self, thresh: np.ndarray, delta: float, limit: float
+    ) -> float:
+        # Rotate the full resolution image for every candidate angle
         scores = []
         angles = np.arange(-limit, limit + delta, delta)
         for angle in angles:
-            _, score = determine_score(thresh, angle)
-            scores.append(score)
+            data = rotate(thresh, angle, reshape=False, order=0)
+            scores.append(self._projection_score(data))
+
+        return angles[scores.index(max(scores))]
+
+    def _coarse_to_fine_skew_angle(
+        self, thresh: np.ndarray, delta: float, limit: float, max_width: int = 800
+    ) -> float:
+        # Score the angles on a downsampled image, first with a coarse step
+        # and then with the requested step around the best coarse angle
+        scale = min(1.0, max_width / thresh.shape[1])
+        small = cv2.resize(
+            thresh, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+        h, w = small.shape[:2]
+        center = (w // 2, h // 2)
+
+        def score_angles(angles):
+            scores = []
+            for angle in angles:
+                M = cv2.getRotationMatrix2D(center, angle, 1.0)
+                data = cv2.warpAffine(small, M, (w, h), flags=cv2.INTER_NEAREST)
+                scores.append(self._projection_score(data))
+            return angles[int(np.argmax(scores))]
 
-        best_angle = angles[scores.index(max(scores))]
+        coarse_delta = max(delta, min(1.0, limit / 3))
+        best_angle = score_angles(np.arange(-limit, limit + coarse_delta, coarse_delta))
+
+        fine_angles = np.arange(
+            max(-limit, best_angle - coarse_delta),
+            min(limit, best_angle + coarse_delta) + delta,
+            delta,
+        )
+        return score_angles(fine_angles)
+
+    @instrumentation.timed("deskew_image", count_bytes=instrumentation.result_nbytes)
+    def deskew_image(
+        self, delta: float = 0.2, limit: float = 3, method: str = "exhaustive"
+    ) -> np.ndarray:
+        if method not in DESKEW_METHODS:
+            raise ValueError(f"Unknown deskew method: {method}")
+
+        gray = _gray(self.img)
+        thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+        if method == "exhaustive":
+            best_angle = self._exhaustive_skew_angle(thresh, delta, limit)
+        else:
+            best_angle = self._coarse_to_fine_skew_angle(thresh, delta, limit)
 
         (h, w) = self.img.shape[:2]
         center = (w // 2, h // 2)
@@ -58,51 +340,48 @@ class ImageProcessor:
 
         return rotated
 
+    @instrumentation.timed("remove_shadows", count_bytes=instrumentation.result_nbytes)
     def remove_shadows(self) -> np.ndarray:
-        rgb_planes = cv2.split(self.img)
+        """Divide out the paper background, overwriting self.img."""
+        if self.img.ndim == 2:
+            rgb_planes = [self.img]
+        else:
+            rgb_planes = cv2.split(self.img)
 
-        result_planes = []
-        result_norm_planes = []
+        # Every plane is updated in place, with one background buffer
+        bg_img = None
         for plane in rgb_planes:
-            dilated_img = cv2.dilate(plane, np.ones((7, 7), np.uint8))
-            bg_img = cv2.medianBlur(dilated_img, 21)
-            diff_img = 255 - cv2.absdiff(plane, bg_img)
-            norm_img = cv2.normalize(
-                diff_img,
-                None,
-                alpha=0,
-                beta=255,
-                norm_type=cv2.NORM_MINMAX,
-                dtype=cv2.CV_8UC1,
-            )
-            result_planes.append(diff_img)
-            result_norm_planes.append(norm_img)
+            bg_img = cv2.dilate(plane, np.ones((7, 7), np.uint8), dst=bg_img)
+            bg_img = cv2.medianBlur(bg_img, 21)
+            cv2.absdiff(plane, bg_img, dst=plane)
+            cv2.bitwise_not(plane, dst=plane)
 
-        result = cv2.merge(result_planes)
-
-        return result
+        if len(rgb_planes) == 1:
+            return rgb_planes[0]
+        return cv2.merge(rgb_planes, dst=self.img)
 
+    @instrumentation.timed("rescale_image", count_bytes=instrumentation.result_nbytes)
     def rescale_image(self) -> np.ndarray:
         self.img = cv2.resize(
             self.img, None, fx=1.2, fy=1.2, interpolation=cv2.INTER_CUBIC
         )
         return self.img
 
+    @instrumentation.timed("grayscale_image", count_bytes=instrumentation.result_nbytes)
     def grayscale_image(self) -> np.ndarray:
-        self.img = cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+        self.img = _gray(self.img)
         return self.img
 
+    @instrumentation.timed("remove_noise", count_bytes=instrumentation.result_nbytes)
     def remove_noise(self) -> np.ndarray:
         kernel = np.ones((1, 1), np.uint8)
-        self.img = cv2.dilate(self.img, kernel, iterations=1)
-        self.img = cv2.erode(self.img, kernel, iterations=1)
+        cv2.dilate(self.img, kernel, dst=self.img, iterations=1)
+        cv2.erode(self.img, kernel, dst=self.img, iterations=1)
 
-        self.img = cv2.threshold(
-            cv2.GaussianBlur(self.img, (5, 5), 0),
-            150,
-            255,
-            cv2.THRESH_BINARY + cv2.THRESH_OTSU,
-        )[1]
+        cv2.GaussianBlur(self.img, (5, 5), 0, dst=self.img)
+        cv2.threshold(
+            self.img, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=self.img
+        )
         self.img = cv2.threshold(
             cv2.bilateralFilter(self.img, 5, 75, 75),
             0,
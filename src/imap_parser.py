@@ -0,0 +1,256 @@
+import binascii
+import quopri
+import re
+from email.header import decode_header, make_header
+from email.utils import collapse_rfc2231_value, decode_rfc2231
+
+LITERAL_PATTERN = re.compile(rb"\{(\d+)\}\r\n")
+ATOM_END = b" ()\r\n"
+# Every byte that is not part of the base64 alphabet, e.g. line breaks
+BASE64_IGNORED = bytes(
+    set(range(256))
+    - set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=")
+)
+
+
+def _to_str(value) -> str:
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+def join_response(data: list) -> tuple[bytes, list]:
+    """Rebuild the raw response stream from the chunks returned by imaplib.
+
+    imaplib splits literals out as (header, literal) tuples. Only the text
+    around the literals is joined, the literals themselves are returned apart
+    in the order of their "{n}" markers, so attachments are never copied.
+    """
+    chunks = []
+    literals = []
+    for chunk in data:
+        if isinstance(chunk, tuple):
+            chunks.append(chunk[0] + b"\r\n")
+            literals.append(chunk[1])
+        elif chunk is not None:
+            chunks.append(chunk)
+    return b"".join(chunks), literals
+
+
+def parse_list(raw: bytes, pos: int = 0, literals=None) -> tuple:
+    """Parse the parenthesized list starting at raw[pos] == "(".
+
+    Returns the parsed list and the position after the closing parenthesis.
+    Quoted strings and atoms are returned as str, literals as bytes and NIL
+    as None. literals is an iterator over the literals left out of raw by
+    join_response, otherwise they are read from raw.
+    """
+    assert raw[pos : pos + 1] == b"("
+    pos += 1
+    result = []
+    while pos < len(raw):
+        char = raw[pos : pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            pos += 1
+        elif char == b")":
+            return result, pos + 1
+        elif char == b"(":
+            value, pos = parse_list(raw, pos, literals)
+            result.append(value)
+        elif char == b'"':
+            end = pos + 1
+            value = bytearray()
+            while raw[end : end + 1] != b'"':
+                if end >= len(raw):
+                    raise ValueError("Unterminated IMAP quoted string")
+                if raw[end : end + 1] == b"\\":
+                    end += 1
+                value += raw[end : end + 1]
+                end += 1
+            result.append(_to_str(bytes(value)))
+            pos = end + 1
+        elif char == b"{":
+            match = LITERAL_PATTERN.match(raw, pos)
+            if match is None:
+                raise ValueError("Malformed IMAP literal")
+            if literals is not None:
+                result.append(next(literals))
+                pos = match.end()
+                continue
+            size = int(match.group(1))
+            start = match.end()
+            result.append(raw[start : start + size])
+            pos = start + size
+        else:
+            end = pos
+            while end < len(raw) and raw[end : end + 1] not in ATOM_END:
+                # Section specifiers like BODY[1.2] belong to the same atom
+                if raw[end : end + 1] == b"[":
+                    end = raw.index(b"]", end)
+                end += 1
+            atom = _to_str(raw[pos:end])
+            result.append(None if atom.upper() == "NIL" else atom)
+            pos = end
+    raise ValueError("Unterminated IMAP list")
+
+
+def parse_fetch_response(data: list) -> dict:
+    """Parse a UID FETCH response into {uid: {ITEM: value}}."""
+    raw, literals = join_response(data)
+    literals = iter(literals)
+    messages = {}
+    pos = raw.find(b"(")
+    while pos != -1:
+        values, pos = parse_list(raw, pos, literals)
+        items = {values[i].upper(): values[i + 1] for i in range(0, len(values) - 1, 2)}
+        if "UID" in items:
+            messages[items["UID"]] = items
+        pos = raw.find(b"(", pos)
+    return messages
+
+
+def _params_to_dict(params) -> dict:
+    if not params:
+        return {}
+    return {
+        _to_str(params[i]).lower(): _to_str(params[i + 1])
+        for i in range(0, len(params) - 1, 2)
+    }
+
+
+def decode_mime_words(value: str) -> str:
+    """Decode the RFC 2047 encoded words of a header value, e.g. a filename."""
+    return str(make_header(decode_header(value)))
+
+
+def _decode_filename(params: dict) -> str:
+    for key in ("filename*", "name*"):
+        if params.get(key):
+            return collapse_rfc2231_value(decode_rfc2231(params[key]))
+    for key in ("filename", "name"):
+        if params.get(key):
+            return decode_mime_words(params[key])
+    return None
+
+
+def _disposition_index(part: list) -> int:
+    # Extension data starts after the type specific fields of the part
+    main_type = _to_str(part[0]).lower()
+    sub_type = _to_str(part[1]).lower()
+    if main_type == "text":
+        return 9
+    if main_type == "message" and sub_type == "rfc822":
+        return 11
+    return 8
+
+
+def find_attachments(structure: list, section: str = "") -> list[dict]:
+    """Return the attachment parts of a BODYSTRUCTURE with their section.
+
+    Each attachment is a dict with "section", "content_type", "encoding",
+    "size" and "filename".
+    """
+    if isinstance(structure[0], list):
+        attachments = []
+        for index, part in enumerate(structure, start=1):
+            if not isinstance(part, list):
+                break
+            part_section = f"{section}.{index}" if section else str(index)
+            attachments.extend(find_attachments(part, part_section))
+        return attachments
+
+    disposition_index = _disposition_index(structure)
+    disposition = None
+    if len(structure) > disposition_index:
+        disposition = structure[disposition_index]
+    if not isinstance(disposition, list):
+        return []
+
+    params = _params_to_dict(structure[2])
+    params.update(_params_to_dict(disposition[1]))
+    filename = _decode_filename(params)
+    if not filename:
+        return []
+
+    return [
+        {
+            "section": section or "1",
+            "content_type": f"{_to_str(structure[0])}/{_to_str(structure[1])}".lower(),
+            "encoding": (_to_str(structure[5]) or "7bit").lower(),
+            "size": int(structure[6]) if structure[6] else 0,
+            "filename": filename,
+        }
+    ]
+
+
+def decode_payload(payload: bytes, encoding: str) -> bytes:
+    """Undo the Content-Transfer-Encoding of a fetched body section."""
+    if encoding == "base64":
+        return binascii.a2b_base64(payload)
+    if encoding == "quoted-printable":
+        return quopri.decodestring(payload)
+    return payload
+
+
+def iter_decoded_payload(payload, encoding: str, chunk_size: int = 1 << 16):
+    """Undo the Content-Transfer-Encoding of a body chunk_size bytes at a time.
+
+    Yields the decoded chunks, so only one chunk is decoded in memory at
+    once. str payloads, as stored by the email package, are encoded back to
+    their raw bytes one chunk at a time too.
+    """
+    carry = b""
+    for start in range(0, len(payload), chunk_size):
+        chunk = payload[start : start + chunk_size]
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8", "surrogateescape")
+        if encoding == "base64":
+            # Decode whole 4 character groups, the rest goes with the next chunk
+            chunk = carry + chunk.translate(None, BASE64_IGNORED)
+            end = len(chunk) - len(chunk) % 4
+            carry = chunk[end:]
+            yield binascii.a2b_base64(chunk[:end])
+        elif encoding == "quoted-printable":
+            # Decode whole lines, soft line breaks can't be split
+            chunk = carry + chunk
+            end = chunk.rfind(b"\n") + 1
+            carry = chunk[end:]
+            yield quopri.decodestring(chunk[:end])
+        else:
+            yield chunk
+    if carry:
+        yield decode_payload(carry, encoding)
+
+
+def split_by_size(sizes: dict, max_bytes: int) -> list[list]:
+    """Split the keys of {key: size} in batches of at most max_bytes.
+
+    A key larger than max_bytes gets a batch of its own.
+    """
+    batches = []
+    batch, batch_bytes = [], 0
+    for key, size in sizes.items():
+        if batch and batch_bytes + size > max_bytes:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(key)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def compress_uid_set(uids: list) -> str:
+    """Turn a list of UIDs into an IMAP sequence set like "1:5,9,12:14"."""
+    numbers = sorted({int(uid) for uid in uids})
+    ranges = []
+    start = prev = numbers[0]
+    for number in numbers[1:]:
+        if number != prev + 1:
+            ranges.append(f"{start}:{prev}" if start != prev else str(start))
+            start = number
+        prev = number
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
@@ -0,0 +1,235 @@
+import imaplib
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from src.collector import EmailCollector
+from src.logger import get_logger
+from src.sync_state import SyncState
+
+# Errors after which a connection can't be used anymore: the server dropped
+# it (abort), or the socket failed or timed out (OSError)
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError)
+
+
+class ImapConnectionPool:
+    """A fixed number of authenticated IMAP connections shared by threads.
+
+    Connections idle for longer than `keepalive` seconds are checked with a
+    NOOP when taken from the pool, and broken connections are closed and
+    transparently reconnected by run, reselecting the mailbox they had
+    selected.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        imap_url: str,
+        size: int = 4,
+        keepalive: float = 300,
+        timeout: float = 60,
+        retries: int = 3,
+        backoff: float = 1.0,
+        connection_class=EmailCollector,
+    ) -> None:
+        self.logger = get_logger("ImapPool")
+        self.username = username
+        self.password = password
+        self.imap_url = imap_url
+        self.size = max(1, size)
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.connection_class = connection_class
+        self.connections = queue.LifoQueue()
+        self.all_connections = []
+
+    def open(self) -> None:
+        """Connect and log in all the connections of the pool."""
+        for _ in range(self.size):
+            connection = self.connection_class(
+                self.username, self.password, self.imap_url, timeout=self.timeout
+            )
+            connection.connect()
+            connection.last_used = time.monotonic()
+            self.all_connections.append(connection)
+            self.connections.put(connection)
+
+    def close(self) -> None:
+        for connection in self.all_connections:
+            connection.close()
+        self.all_connections = []
+        self.connections = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, returning it to the pool afterwards.
+
+        A connection the server dropped while idle is closed, see run.
+        """
+        connection = self.connections.get()
+        healthy = False
+        try:
+            # A closed connection is reconnected by run, without a NOOP
+            if (
+                connection.connected
+                and time.monotonic() - connection.last_used > self.keepalive
+            ):
+                try:
+                    connection.noop()
+                except CONNECTION_ERRORS:
+                    self.logger.warning("Idle IMAP connection dropped, reconnecting")
+                    connection.close()
+            yield connection
+            healthy = True
+        finally:
+            # A connection that raised is checked before its next use
+            connection.last_used = time.monotonic() if healthy else float("-inf")
+            self.connections.put(connection)
+
+    def run(self, func, *args, **kwargs):
+        """Call func(connection, *args, **kwargs), reconnecting on failures.
+
+        func is called again on a fresh connection after a connection error,
+        so it has to be safe to retry, e.g. skip the work it already did. A
+        reconnect that fails counts as one more failed attempt.
+        """
+        with self.connection() as connection:
+            for attempt in range(self.retries + 1):
+                try:
+                    if not connection.connected:
+                        connection.connect()
+                    return func(connection, *args, **kwargs)
+                except CONNECTION_ERRORS as e:
+                    if attempt == self.retries:
+                        raise
+                    self.logger.warning(
+                        f"IMAP connection failed ({e}), reconnecting "
+                        f"[{attempt + 1}/{self.retries}]"
+                    )
+                    time.sleep(self.backoff * 2**attempt)
+                    # Also drops a connection left half open by connect
+                    connection.close()
+
+
+class PooledEmailCollector:
+    """Fetches several senders and folders over a pool of IMAP connections.
+
+    Email ids are (mailbox, uid) pairs. The UIDs of each mailbox are split
+    into contiguous ranges which are downloaded in parallel, one range per
+    connection at a time. A range that fails after a reconnect is resumed:
+    attachments already on disk are not downloaded again, and the sync state
+    only advances up to the first range that could not be downloaded.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        imap_url: str,
+        connections: int = 4,
+        chunk_size: int = 100,
+        **pool_options,
+    ) -> None:
+        self.pool = ImapConnectionPool(
+            username, password, imap_url, size=connections, **pool_options
+        )
+        self.chunk_size = chunk_size
+        self.pending_sync = {}
+        # Mailbox -> lowest UID that failed to download
+        self.failed = {}
+
+    def connect(self) -> None:
+        self.pool.open()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def fetch_emails(
+        self,
+        senders: list,
+        mailboxes: list = ("inbox",),
+        state: SyncState = None,
+    ) -> list:
+        """Search every mailbox for emails of every sender.
+
+        Returns the (mailbox, uid) pairs of the matching emails, sorted and
+        without duplicates. With a sync state only new emails are returned,
+        see EmailCollector.fetch_emails.
+        """
+        if isinstance(senders, str):
+            senders = [senders]
+        if isinstance(mailboxes, str):
+            mailboxes = [mailboxes]
+
+        def search(connection, mailbox, sender):
+            uids = connection.fetch_emails(sender, mailbox, state)
+            return uids, connection.pending_sync if state is not None else None
+
+        email_ids = set()
+        self.pending_sync = {}
+        self.failed = {}
+        for mailbox in mailboxes:
+            for sender in senders:
+                uids, pending_sync = self.pool.run(search, mailbox, sender)
+                if pending_sync is not None:
+                    self.pending_sync[(mailbox, sender)] = pending_sync
+                email_ids.update((mailbox, uid) for uid in uids)
+        return sorted(email_ids, key=lambda email_id: (email_id[0], int(email_id[1])))
+
+    def _chunks(self, email_ids: list) -> list:
+        """Split the email ids into (mailbox, uids) ranges of chunk_size."""
+        by_mailbox = {}
+        for mailbox, uid in email_ids:
+            by_mailbox.setdefault(mailbox, []).append(uid)
+        chunks = []
+        for mailbox, uids in by_mailbox.items():
+            uids.sort(key=int)
+            for i in range(0, len(uids), self.chunk_size):
+                chunks.append((mailbox, uids[i : i + self.chunk_size]))
+        return chunks
+
+    def _download_chunk(
+        self, connection, mailbox: str, uids: list, download_folder: str
+    ) -> list:
+        connection.select(mailbox)
+        return connection.fetch_attachments(uids, download_folder)
+
+    def fetch_attachments(self, email_ids: list, download_folder: str) -> list[str]:
+        """Download the attachments of (mailbox, uid) pairs in parallel."""
+        chunks = self._chunks(email_ids)
+        file_paths = []
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            futures = [
+                executor.submit(
+                    self.pool.run, self._download_chunk, mailbox, uids, download_folder
+                )
+                for mailbox, uids in chunks
+            ]
+            for (mailbox, uids), future in zip(chunks, futures):
+                try:
+                    file_paths.extend(future.result())
+                except CONNECTION_ERRORS as e:
+                    self.pool.logger.error(
+                        f"Giving up on {len(uids)} emails of {mailbox}: {e}"
+                    )
+                    first_uid = int(uids[0])
+                    self.failed[mailbox] = min(
+                        self.failed.get(mailbox, first_uid), first_uid
+                    )
+        return file_paths
+
+    def save_sync_state(self, state: SyncState) -> None:
+        """Persist the position reached, stopping before any failed range."""
+        for mailbox, sender, uidvalidity, last_uid in self.pending_sync.values():
+            if mailbox in self.failed:
+                last_uid = min(last_uid, self.failed[mailbox] - 1)
+                last_uid = max(
+                    last_uid, state.get_last_uid(mailbox, sender, uidvalidity)
+                )
+            state.update(mailbox, sender, uidvalidity, last_uid)
+        state.save()
+        self.pending_sync = {}
@@ -0,0 +1,102 @@
+import os
+import re
+
+from src.parser_factory import PARSER_CLASSES
+from src.ticket_parser import date_from_path
+
+
+class TicketClassifier:
+    """Finds the vendor of a ticket file from its name and extension.
+
+    The FILE_PATTERN of all the parsers accepting an extension are combined
+    into one regex, so each file name is lower cased and matched only once
+    however many vendors are registered.
+    """
+
+    def __init__(self, vendors: list = None) -> None:
+        parser_classes = [
+            parser_class
+            for name, parser_class in PARSER_CLASSES.items()
+            if vendors is None or name in {vendor.upper() for vendor in vendors}
+        ]
+        patterns = {}
+        self.vendors = {}
+        for i, parser_class in enumerate(parser_classes):
+            group = f"v{i}"
+            self.vendors[group] = parser_class.VENDOR
+            for extension in parser_class.FILE_EXTENSIONS:
+                patterns.setdefault(extension, []).append(
+                    f"(?P<{group}>{parser_class.FILE_PATTERN})"
+                )
+        # Extension -> combined pattern of its vendors
+        self.patterns = {
+            extension: re.compile("|".join(vendor_patterns))
+            for extension, vendor_patterns in patterns.items()
+        }
+
+    def classify(self, file_name: str) -> str:
+        """Vendor of the file, or None if no parser handles it."""
+        file_name = file_name.lower()
+        pattern = self.patterns.get(os.path.splitext(file_name)[1])
+        if pattern is None:
+            return None
+        match = pattern.search(file_name)
+        return self.vendors[match.lastgroup] if match else None
+
+
+def scan_tickets(
+    tickets_dir: str,
+    recursive: bool = False,
+    vendors: list = None,
+    classifier: TicketClassifier = None,
+) -> list:
+    """Classify the files of a directory in a single os.scandir pass.
+
+    Returns the sorted (vendor, file_path) pairs of the files that a parser
+    handles, restricted to `vendors` if given. With recursive, files in
+    subdirectories (e.g. 2024/01/) are included too.
+    """
+    if classifier is None:
+        classifier = TicketClassifier(vendors)
+    tickets = []
+    directories = [tickets_dir]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        directories.append(entry.path)
+                    continue
+                vendor = classifier.classify(entry.name)
+                if vendor is not None:
+                    tickets.append((vendor, entry.path))
+    tickets.sort(key=lambda ticket: ticket[1])
+    return tickets
+
+
+def group_by_vendor(tickets: list) -> dict:
+    """Vendor -> its (vendor, file_path) pairs, keeping their order."""
+    groups = {}
+    for ticket in tickets:
+        groups.setdefault(ticket[0], []).append(ticket)
+    return groups
+
+
+def filter_by_date(tickets: list, since: int = None, until: int = None) -> list:
+    """Keep the (vendor, file_path) pairs dated within since and until.
+
+    Both bounds are YYYYMMDD ints and inclusive. The date comes from the
+    file path (see date_from_path), so no ticket is opened. Undated tickets
+    are dropped when a bound is given.
+    """
+    if since is None and until is None:
+        return tickets
+    kept = []
+    for ticket in tickets:
+        date = date_from_path(ticket[1])
+        if len(date) != 8 or not date.isdigit():
+            continue
+        date = int(date)
+        if (since is None or date >= since) and (until is None or date <= until):
+            kept.append(ticket)
+    return kept
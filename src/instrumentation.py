@@ -0,0 +1,201 @@
+import cProfile
+import csv
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Instrumentation is off unless enabled, the decorated functions then only
+# pay one global lookup per call
+_enabled = False
+_records = []
+_ticket = None
+
+TRACE_FIELDS = ("stage", "ticket", "seconds", "bytes", "items", "pid")
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def record(
+    stage: str, seconds: float, n_bytes: int = None, n_items: int = None
+) -> None:
+    _records.append(
+        {
+            "stage": stage,
+            "ticket": _ticket,
+            "seconds": seconds,
+            "bytes": n_bytes,
+            "items": n_items,
+            "pid": os.getpid(),
+        }
+    )
+
+
+def drain() -> list[dict]:
+    """Return the recorded calls and forget them."""
+    records = _records[:]
+    _records.clear()
+    return records
+
+
+def merge(records: list[dict]) -> None:
+    """Add the records of another process, e.g. a parsing worker."""
+    _records.extend(records)
+
+
+@contextmanager
+def ticket(file_path: str):
+    """Attribute the calls recorded inside the block to a ticket."""
+    global _ticket
+    previous = _ticket
+    _ticket = file_path
+    try:
+        yield
+    finally:
+        _ticket = previous
+
+
+def timed(stage: str, count_bytes=None, count_items=None):
+    """Decorator recording the duration of every call while enabled.
+
+    count_bytes and count_items are called with the result and the
+    arguments of the call and return the bytes and items it handled.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            record(
+                stage,
+                seconds,
+                count_bytes(result, *args, **kwargs) if count_bytes else None,
+                count_items(result, *args, **kwargs) if count_items else None,
+            )
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def result_nbytes(result, *args, **kwargs) -> int:
+    """Bytes of a returned numpy array."""
+    return result.nbytes
+
+
+def result_len(result, *args, **kwargs) -> int:
+    return len(result)
+
+
+def first_arg_len(result, *args, **kwargs) -> int:
+    return len(args[0])
+
+
+def result_files_size(result, *args, **kwargs) -> int:
+    """Total size of the returned file paths."""
+    return sum(os.path.getsize(file_path) for file_path in result)
+
+
+def parser_file_size(result, parser, *args, **kwargs) -> int:
+    """Size of the ticket file of a parser method."""
+    return os.path.getsize(parser.file_path)
+
+
+def summary() -> dict:
+    """Stage -> calls, total seconds, mean/max ms and bytes and items."""
+    stages = {}
+    for entry in _records:
+        stats = stages.setdefault(
+            entry["stage"],
+            {"calls": 0, "total_s": 0.0, "max_ms": 0.0, "bytes": 0, "items": 0},
+        )
+        stats["calls"] += 1
+        stats["total_s"] += entry["seconds"]
+        stats["max_ms"] = max(stats["max_ms"], entry["seconds"] * 1000)
+        stats["bytes"] += entry["bytes"] or 0
+        stats["items"] += entry["items"] or 0
+    for stats in stages.values():
+        stats["mean_ms"] = stats["total_s"] / stats["calls"] * 1000
+    return stages
+
+
+def slowest_tickets(n: int = 5) -> list[tuple[str, float]]:
+    """The n tickets with the most recorded time, as (ticket, seconds)."""
+    tickets = {}
+    for entry in _records:
+        if entry["ticket"] is not None and entry["stage"] == "parse_ticket":
+            tickets[entry["ticket"]] = (
+                tickets.get(entry["ticket"], 0.0) + entry["seconds"]
+            )
+    return sorted(tickets.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def format_summary() -> str:
+    lines = [
+        f"{'stage':<22}{'calls':>7}{'total s':>10}{'mean ms':>10}{'max ms':>10}"
+        f"{'MB':>9}{'items':>8}"
+    ]
+    stages = summary()
+    for stage, stats in sorted(
+        stages.items(), key=lambda item: item[1]["total_s"], reverse=True
+    ):
+        lines.append(
+            f"{stage:<22}{stats['calls']:>7}{stats['total_s']:>10.3f}"
+            f"{stats['mean_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+            f"{stats['bytes'] / 1e6:>9.1f}{stats['items']:>8}"
+        )
+    tickets = slowest_tickets()
+    if tickets:
+        lines.append("Slowest tickets:")
+        for file_path, seconds in tickets:
+            lines.append(f"  {seconds:8.3f}s  {file_path}")
+    return "\n".join(lines)
+
+
+def write_trace(trace_path: str) -> None:
+    """Write every recorded call as JSON, or CSV for a .csv path."""
+    if trace_path.lower().endswith(".csv"):
+        with open(trace_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=TRACE_FIELDS)
+            writer.writeheader()
+            writer.writerows(_records)
+    else:
+        with open(trace_path, "w") as f:
+            json.dump({"summary": summary(), "calls": _records}, f, indent=2)
+
+
+@contextmanager
+def profile(profile_path: str = None):
+    """Run the block under cProfile and dump the stats, if a path is given.
+
+    Only the current process is profiled, not the parsing workers. Inspect
+    the stats with python -m pstats <profile_path>.
+    """
+    if profile_path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
@@ -0,0 +1,101 @@
+import re
+
+# A decimal amount as printed on the tickets, e.g. "1,250" or "3.99"
+DECIMAL = r"\d+(?:[.,]\d+)?"
+
+# All the clean ups of the OCR text in a single pass: "|" are dropped, runs
+# of newlines (and "|" between them) become one newline, and the spaces
+# OCR inserts inside numbers ("1. 50", "1 ,50") are dropped. Every branch
+# starts with one of " |\n" and checks the character before it afterwards,
+# so the regex engine only stops at those characters
+OCR_CLEANUP = re.compile(
+    r"[ |](?<=\.[ |])[ |]*(?=\d)"
+    r"|[ |](?<=\d[ |])[ |]*(?=,)"
+    r"|[\n|](?<=\n[\n|])[\n|]*"
+    r"|\|+"
+)
+
+# Confidence factors of the items found with OCR noise
+MERGED_LINE_CONFIDENCE = 0.9
+MISSING_PRODUCT_CONFIDENCE = 0.5
+INCONSISTENT_AMOUNTS_CONFIDENCE = 0.6
+TRAILING_NOISE_CONFIDENCE = 0.7
+
+
+def clean_ocr_text(text: str) -> str:
+    return OCR_CLEANUP.sub("", text)
+
+
+def parse_decimal(value: str) -> float:
+    """Convert a DECIMAL matched by a grammar, with a comma or a dot."""
+    return float(value.replace(",", "."))
+
+
+class LineGrammar:
+    """Item block of the tickets of weighed products.
+
+    Each item is a product line followed by a line of amounts with the
+    weight_kg, price_per_kg and total_price groups. Both patterns are given
+    by the vendor parser and compiled once into a single regex that matches
+    every line of the block in one pass.
+
+    OCR noise is tolerated: lines matching neither pattern are skipped, a
+    product line and its amounts merged in one line are split, a product
+    without amounts is dropped, amounts without product give an item
+    without name and anything but digits after the total (e.g. a "€") is
+    ignored. Every item comes with a confidence between 0 and 1.
+    """
+
+    def __init__(self, product_pattern: str, amounts_pattern: str) -> None:
+        # Only lines with a digit are tried as amounts
+        self.pattern = re.compile(
+            rf"^[ \t]*(?:(?=[^\n]*\d)(?P<name>[^\n]*?)[ \t]*"
+            rf"{amounts_pattern}[ \t]*(?P<noise>[^\d\n]*)$|(?P<line>[^\n]*))",
+            re.MULTILINE,
+        )
+        self.product_pattern = re.compile(product_pattern)
+
+    def _product(self, line: str) -> str:
+        match = self.product_pattern.fullmatch(line)
+        return match.group("product").strip() if match else None
+
+    def parse(self, items_text: str) -> list[tuple[dict, float]]:
+        """Return the (item, confidence) pairs of an item block."""
+        items = []
+        product = None
+        for match in self.pattern.finditer(items_text):
+            name, weight_kg, price_per_kg, total_price, noise = match.group(
+                "name", "weight_kg", "price_per_kg", "total_price", "noise"
+            )
+            if total_price is None:
+                # A product line, a later one replaces a product without
+                # amounts
+                line_product = self._product(match.group("line"))
+                if line_product:
+                    product = line_product
+                continue
+
+            confidence = 1.0
+            if name:
+                # Product and amounts merged in one line
+                product = self._product(name) or product
+                confidence *= MERGED_LINE_CONFIDENCE
+            if noise:
+                confidence *= TRAILING_NOISE_CONFIDENCE
+            if product is None:
+                product = ""
+                confidence *= MISSING_PRODUCT_CONFIDENCE
+
+            item = {
+                "product": product,
+                "weight_kg": parse_decimal(weight_kg),
+                "price_per_kg": parse_decimal(price_per_kg),
+                "total_price": parse_decimal(total_price),
+            }
+            # The total is rounded to cents
+            expected_total = item["weight_kg"] * item["price_per_kg"]
+            if abs(expected_total - item["total_price"]) > 0.011:
+                confidence *= INCONSISTENT_AMOUNTS_CONFIDENCE
+            items.append((item, confidence))
+            product = None
+        return items
@@ -0,0 +1,202 @@
+import unicodedata
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from src import instrumentation
+from src.logger import get_logger
+
+logger = get_logger("OCR")
+
+OCR_BACKENDS = ("auto", "tesserocr", "pytesseract")
+
+# Engines are long-lived and kept per process, so every worker of the ticket
+# pool loads the Tesseract models only once
+_engines = {}
+
+
+class OcrEngine(ABC):
+    # Backend name, part of the parse cache key of the OCR parsers
+    NAME = None
+
+    def __init__(self, lang: str, psm: int, oem: int) -> None:
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+
+    @abstractmethod
+    def image_to_string(self, img: np.ndarray) -> str:
+        pass
+
+    @abstractmethod
+    def image_to_data(self, img: np.ndarray) -> list[dict]:
+        """Return the recognized words with their "text" and bounding box
+        ("left", "top", "width", "height") in pixels."""
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Runs the tesseract executable once per image (fallback backend)."""
+
+    NAME = "pytesseract"
+
+    def __init__(self, lang: str, psm: int, oem: int) -> None:
+        super().__init__(lang, psm, oem)
+        import pytesseract
+
+        self.pytesseract = pytesseract
+
+    @instrumentation.timed("ocr")
+    def image_to_string(self, img: np.ndarray) -> str:
+        return self.pytesseract.image_to_string(
+            img, lang=self.lang, config=f"--psm {self.psm} --oem {self.oem}"
+        )
+
+    def image_to_data(self, img: np.ndarray) -> list[dict]:
+        data = self.pytesseract.image_to_data(
+            img,
+            lang=self.lang,
+            config=f"--psm {self.psm} --oem {self.oem}",
+            output_type=self.pytesseract.Output.DICT,
+        )
+        keys = ("text", "left", "top", "width", "height")
+        return [
+            {key: data[key][i] for key in keys}
+            for i in range(len(data["text"]))
+            if data["text"][i].strip()
+        ]
+
+
+class TesserocrEngine(OcrEngine):
+    """Keeps one Tesseract API instance alive and feeds it numpy buffers.
+
+    The API is not thread safe, use one engine per process.
+    """
+
+    NAME = "tesserocr"
+
+    def __init__(self, lang: str, psm: int, oem: int) -> None:
+        super().__init__(lang, psm, oem)
+        import tesserocr
+
+        self.tesserocr = tesserocr
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm, oem=oem)
+
+    @instrumentation.timed("ocr")
+    def image_to_string(self, img: np.ndarray) -> str:
+        img = np.ascontiguousarray(img)
+        (h, w) = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        self.api.SetImageBytes(
+            img.tobytes(), w, h, bytes_per_pixel, w * bytes_per_pixel
+        )
+        return self.api.GetUTF8Text()
+
+    def image_to_data(self, img: np.ndarray) -> list[dict]:
+        self.image_to_string(img)
+        level = self.tesserocr.RIL.WORD
+        words = []
+        for word in self.tesserocr.iterate_level(self.api.GetIterator(), level):
+            text = word.GetUTF8Text(level)
+            if not text or not text.strip():
+                continue
+            x1, y1, x2, y2 = word.BoundingBox(level)
+            words.append(
+                {
+                    "text": text,
+                    "left": x1,
+                    "top": y1,
+                    "width": x2 - x1,
+                    "height": y2 - y1,
+                }
+            )
+        return words
+
+
+def get_ocr_engine(
+    lang: str = "cat+eng+spa", psm: int = 4, oem: int = 1, backend: str = "auto"
+) -> OcrEngine:
+    """Return the process wide OCR engine for the given settings.
+
+    With backend "auto" the tesserocr binding is used when it is installed
+    and can load the languages, falling back to pytesseract otherwise.
+    """
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {backend}")
+
+    key = (lang, psm, oem, backend)
+    if key not in _engines:
+        engine = None
+        if backend in ("auto", "tesserocr"):
+            try:
+                engine = TesserocrEngine(lang, psm, oem)
+            except (ImportError, RuntimeError) as e:
+                # RuntimeError: the API failed to load tessdata or a language
+                if backend == "tesserocr":
+                    raise
+                logger.info(f"tesserocr unavailable ({e}), using pytesseract")
+        if engine is None:
+            engine = PytesseractEngine(lang, psm, oem)
+        _engines[key] = engine
+    return _engines[key]
+
+
+def _normalize_word(word: str) -> str:
+    # Low resolution OCR often drops accents, so compare without them
+    word = unicodedata.normalize("NFKD", word)
+    return "".join(char for char in word if not unicodedata.combining(char))
+
+
+def find_item_region(
+    engine: OcrEngine,
+    img: np.ndarray,
+    start_marker: str,
+    end_marker: str,
+    scale: float = 0.5,
+    margin: int = 20,
+) -> tuple:
+    """Locate the rows between the start and end markers of the item table.
+
+    A cheap OCR pass runs on a downsampled copy of the image and the word
+    boxes of the markers give the region. Returns (top, bottom) in pixels of
+    the full image, or None when a marker is not found.
+    """
+    import cv2
+
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    words = engine.image_to_data(small)
+
+    start_marker = _normalize_word(start_marker)
+    end_marker = _normalize_word(end_marker)
+    start = None
+    for word in words:
+        text = _normalize_word(word["text"])
+        if start is None:
+            if text.startswith(start_marker):
+                start = word
+        elif (
+            text.startswith(end_marker)
+            and word["top"] > start["top"] + start["height"] / 2
+        ):
+            top = max(0, int(start["top"] / scale) - margin)
+            bottom = int((word["top"] + word["height"]) / scale) + margin
+            return top, min(img.shape[0], bottom)
+    return None
+
+
+def ocr_item_region(
+    engine: OcrEngine, img: np.ndarray, start_marker: str, end_marker: str
+) -> str:
+    """OCR only the item table of a ticket, or the full page as a fallback.
+
+    The crop keeps the marker lines, so the text can be sliced the same way
+    as a full page OCR.
+    """
+    region = find_item_region(engine, img, start_marker, end_marker)
+    if region is not None:
+        (top, bottom) = region
+        text = engine.image_to_string(img[top:bottom])
+        if start_marker in text and end_marker in text:
+            return text
+        logger.info("Item markers lost in the cropped region, using full page")
+    return engine.image_to_string(img)
@@ -0,0 +1,156 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src import instrumentation
+from src.logger import get_logger
+from src.parse_cache import ParseCache
+from src.parser_factory import get_ticket_parser
+
+logger = get_logger("TicketPool")
+
+# One cache connection per process, SQLite connections can't be shared
+_caches = {}
+
+# Result of a ticket whose worker pool broke before parsing it
+UNFINISHED = object()
+
+
+def _get_cache(cache_path: str) -> ParseCache:
+    if cache_path is None:
+        return None
+    if cache_path not in _caches:
+        _caches[cache_path] = ParseCache(cache_path)
+    return _caches[cache_path]
+
+
+def parse_ticket(vendor: str, file_path: str, cache_path: str = None) -> tuple:
+    """Parse one ticket and return (items, date), or None if it fails."""
+    print(f"Processing {file_path}...")
+    try:
+        with instrumentation.ticket(file_path):
+            parser = get_ticket_parser(vendor, file_path, cache=_get_cache(cache_path))
+            items = parser.extract_items()
+            date = parser.get_date()
+    except Exception as e:
+        logger.error(f"Failed to parse {file_path}: {e}")
+        return None
+    return items, date
+
+
+def parse_ticket_traced(vendor: str, file_path: str, cache_path: str = None):
+    """parse_ticket in a worker process, returning (result, records).
+
+    The instrumentation records of the worker are sent back to the parent,
+    which adds them with instrumentation.merge.
+    """
+    instrumentation.enable()
+    # Forget the records a forked worker inherited from the parent
+    instrumentation.drain()
+    result = parse_ticket(vendor, file_path, cache_path)
+    return result, instrumentation.drain()
+
+
+def iter_parsed_tickets(
+    tickets: list[tuple[str, str]], workers: int = 1, cache_path: str = None
+):
+    """Parse (vendor, file_path) pairs, optionally in a process pool.
+
+    Yields (vendor, file_path, (items, date)) in the order of the input.
+    Tickets that fail to parse are left out instead of aborting the whole
+    batch. With a cache path, parsed tickets are looked up in / stored to a
+    ParseCache.
+    """
+    if workers <= 1:
+        for vendor, file_path in tickets:
+            result = parse_ticket(vendor, file_path, cache_path)
+            if result is not None:
+                yield vendor, file_path, result
+        return
+
+    yield from _iter_pool(tickets, workers, cache_path, instrumentation.is_enabled())
+
+
+def _pool_result(future, file_path: str, traced: bool):
+    """The result of a parse_ticket future, UNFINISHED if the pool broke."""
+    if future is None:
+        return UNFINISHED
+    try:
+        result = future.result()
+    except BrokenProcessPool:
+        return UNFINISHED
+    except Exception as e:
+        logger.error(f"Worker failed on {file_path}: {e}")
+        return None
+    if traced:
+        result, records = result
+        instrumentation.merge(records)
+    return result
+
+
+def _iter_pool(tickets: list, workers: int, cache_path: str, traced: bool):
+    """iter_parsed_tickets in a process pool, surviving crashed workers.
+
+    A native crash in a worker (e.g. inside OpenCV) breaks the whole pool,
+    and every ticket not parsed yet fails with BrokenProcessPool. These are
+    parsed again in a new pool, split in halves while none of them gets
+    parsed, until the ticket that crashes is parsed alone and left out.
+    """
+    if not tickets:
+        return
+    results = []
+    broken = False
+    with ProcessPoolExecutor(max_workers=min(workers, len(tickets))) as executor:
+        futures = []
+        for vendor, file_path in tickets:
+            try:
+                futures.append(
+                    executor.submit(
+                        parse_ticket_traced if traced else parse_ticket,
+                        vendor,
+                        file_path,
+                        cache_path,
+                    )
+                )
+            except BrokenProcessPool:
+                futures.append(None)
+        for (vendor, file_path), future in zip(tickets, futures):
+            result = _pool_result(future, file_path, traced)
+            broken = broken or result is UNFINISHED
+            if broken:
+                # Kept, so that the results are yielded in order
+                results.append((vendor, file_path, result))
+            elif result is not None:
+                yield vendor, file_path, result
+
+    unfinished = [
+        (vendor, file_path)
+        for vendor, file_path, result in results
+        if result is UNFINISHED
+    ]
+    if not unfinished or len(unfinished) < len(tickets):
+        retries = [unfinished]
+    elif len(unfinished) > 1:
+        half = len(unfinished) // 2
+        retries = [unfinished[:half], unfinished[half:]]
+    else:
+        logger.error(f"Worker crashed on {unfinished[0][1]}")
+        retries = []
+    recovered = {}
+    for retry in retries:
+        for vendor, file_path, result in _iter_pool(retry, workers, cache_path, traced):
+            recovered[(vendor, file_path)] = result
+
+    for vendor, file_path, result in results:
+        if result is UNFINISHED:
+            result = recovered.get((vendor, file_path))
+        if result is not None:
+            yield vendor, file_path, result
+
+
+def parse_tickets(
+    tickets: list[tuple[str, str]], workers: int = 1, cache_path: str = None
+) -> list:
+    """Parse (vendor, file_path) pairs and return their (items, date)."""
+    return [
+        result for _, _, result in iter_parsed_tickets(tickets, workers, cache_path)
+    ]
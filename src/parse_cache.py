@@ -0,0 +1,117 @@
+import hashlib
+import json
+import sqlite3
+
+from src.ticket_parser import AbstractTicketParser
+
+
+class ParseCache:
+    """SQLite cache of parsed tickets keyed by file hash, vendor and version.
+
+    The version is the cache_version of the vendor parser, which includes
+    the settings the items depend on, like the OCR backend.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        # WAL lets several worker processes read while one of them writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS parse_cache (
+                digest TEXT NOT NULL,
+                vendor TEXT NOT NULL,
+                version TEXT NOT NULL,
+                text TEXT NOT NULL,
+                items TEXT NOT NULL,
+                PRIMARY KEY (digest, vendor, version)
+            )""")
+        self.conn.commit()
+
+    @staticmethod
+    def file_digest(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, digest: str, vendor: str, version: str) -> tuple:
+        """Return the cached (text, items), or None on a miss."""
+        row = self.conn.execute(
+            "SELECT text, items FROM parse_cache "
+            "WHERE digest = ? AND vendor = ? AND version = ?",
+            (digest, vendor, version),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put(
+        self, digest: str, vendor: str, version: str, text: str, items: list[dict]
+    ) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO parse_cache VALUES (?, ?, ?, ?, ?)",
+            (digest, vendor, version, text, json.dumps(items)),
+        )
+        self.conn.commit()
+
+    def prune(self, versions: dict) -> int:
+        """Delete entries whose version differs from the vendor's current one."""
+        deleted = 0
+        for vendor, version in versions.items():
+            cursor = self.conn.execute(
+                "DELETE FROM parse_cache WHERE vendor = ? AND version != ?",
+                (vendor, version),
+            )
+            deleted += cursor.rowcount
+        self.conn.commit()
+        return deleted
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CachedTicketParser(AbstractTicketParser):
+    """Parser that serves text and items from a ParseCache when possible.
+
+    The wrapped vendor parser is only built (and OCR/PDF extraction only run)
+    on a cache miss, and like any parser only once the text or the items are
+    requested.
+    """
+
+    def __init__(
+        self,
+        parser_class: type,
+        vendor: str,
+        file_path: str,
+        cache: ParseCache,
+        logger_name: str = "CachedTicketParser",
+    ) -> None:
+        self.parser_class = parser_class
+        self.vendor = vendor.upper()
+        self.cache = cache
+        self.cached_items = None
+        super().__init__(file_path, logger_name)
+
+    def _parse_ticket(self) -> str:
+        digest = ParseCache.file_digest(self.file_path)
+        version = self.parser_class.cache_version()
+        cached = self.cache.get(digest, self.vendor, version)
+        if cached is not None:
+            self.logger.debug(f"Cache hit for {self.file_path}")
+            text, self.cached_items = cached
+            return text
+
+        parser = self.parser_class(
+            self.file_path, logger_name=self.parser_class.__name__
+        )
+        self.cached_items = parser.extract_items()
+        self.cache.put(digest, self.vendor, version, parser.text, self.cached_items)
+        return parser.text
+
+    def extract_items(self) -> list[dict]:
+        # Only for its side effect: getting the text parses the ticket, or
+        # loads it from the cache, and fills cached_items
+        _ = self.text
+        self.items = [dict(item) for item in self.cached_items]
+        return self.items
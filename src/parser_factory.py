@@ -1,15 +1,24 @@
-from src.vendors.fruteria_parser import FruteriaTicketParser
-from src.vendors.mercadona_parser import MercadonaTicketParser
-from src.vendors.granel_parser import GranelTicketParser
-from src.ticket_parser import AbstractTicketParser
-
-
-def get_ticket_parser(vendor: str, file_path: str) -> AbstractTicketParser:
-    if vendor.upper() == "MERCADONA":
-        return MercadonaTicketParser(file_path, logger_name="MercadonaTicketParser")
-    elif vendor.upper() == "GRANEL":
-        return GranelTicketParser(file_path, logger_name="GranelTicketParser")
-    elif vendor.upper() == "FRUTERIA":
-        return FruteriaTicketParser(file_path, logger_name="FruteriaTicketParser")
-    else:
+# Importing the vendor modules registers their parsers
+import src.vendors.mercadona_parser  # noqa: F401
+import src.vendors.granel_parser  # noqa: F401
+import src.vendors.fruteria_parser  # noqa: F401
+from src.ticket_parser import PARSER_REGISTRY, AbstractTicketParser
+from src.parse_cache import CachedTicketParser, ParseCache
+
+# Vendor name in upper case -> parser class
+PARSER_CLASSES = PARSER_REGISTRY
+
+
+def get_parser_versions() -> dict:
+    return {vendor: cls.cache_version() for vendor, cls in PARSER_CLASSES.items()}
+
+
+def get_ticket_parser(
+    vendor: str, file_path: str, cache: ParseCache = None
+) -> AbstractTicketParser:
+    parser_class = PARSER_CLASSES.get(vendor.upper())
+    if parser_class is None:
         raise ValueError(f"Unknown vendor: {vendor}")
+    if cache is not None:
+        return CachedTicketParser(parser_class, vendor, file_path, cache)
+    return parser_class(file_path, logger_name=parser_class.__name__)
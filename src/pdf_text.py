@@ -0,0 +1,224 @@
+import re
+
+PDF_BACKENDS = ("pypdf", "content_stream", "pymupdf")
+
+TOKEN_PATTERN = re.compile(
+    rb"(?P<string>\((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*\))"
+    rb"|(?P<dict><<|>>)"
+    rb"|(?P<hex><[0-9A-Fa-f\s]*>)"
+    rb"|(?P<open>\[)|(?P<close>\])"
+    rb"|(?P<comment>%[^\r\n]*)"
+    rb"|(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?![^\s/\[\]()<>{}%]))"
+    rb"|(?P<word>/?[^\s/\[\]()<>{}%]+|/)",
+    re.DOTALL,
+)
+ESCAPE_PATTERN = re.compile(rb"\\([nrtbf()\\]|[0-7]{1,3}|\r\n|\r|\n)")
+ESCAPES = {
+    b"n": b"\n",
+    b"r": b"\r",
+    b"t": b"\t",
+    b"b": b"\b",
+    b"f": b"\f",
+    b"(": b"(",
+    b")": b")",
+    b"\\": b"\\",
+}
+SIMPLE_ENCODINGS = (None, "/WinAnsiEncoding", "/StandardEncoding")
+
+# TJ offsets (in thousandths of an em) wider than this are treated as spaces
+TJ_SPACE_THRESHOLD = 250
+
+
+def _unescape(match: re.Match) -> bytes:
+    escaped = match.group(1)
+    if escaped in ESCAPES:
+        return ESCAPES[escaped]
+    if escaped[:1].isdigit():
+        return bytes([int(escaped, 8) & 0xFF])
+    # Line continuation
+    return b""
+
+
+def _tokenize(data: bytes):
+    """Yield the operands and operators of a content stream.
+
+    Strings are yielded as bytes, numbers as float, arrays as lists and
+    operators and names as str.
+    """
+    arrays = []
+    pos = 0
+    while True:
+        match = TOKEN_PATTERN.search(data, pos)
+        if match is None:
+            return
+        pos = match.end()
+        kind = match.lastgroup
+        token = match.group()
+        if kind == "string":
+            value = token[1:-1]
+            if b"\\" in value:
+                value = ESCAPE_PATTERN.sub(_unescape, value)
+        elif kind == "number":
+            value = float(token)
+        elif kind == "word":
+            if token == b"ID":
+                # Skip the binary data of inline images
+                end = data.find(b"EI", pos)
+                pos = len(data) if end == -1 else end + 2
+                continue
+            value = token.decode("latin-1")
+        elif kind == "hex":
+            digits = re.sub(rb"\s", b"", token[1:-1])
+            if len(digits) % 2:
+                digits += b"0"
+            value = bytes.fromhex(digits.decode("ascii"))
+        elif kind == "open":
+            arrays.append([])
+            continue
+        elif kind == "close" and arrays:
+            value = arrays.pop()
+        else:
+            continue
+
+        if arrays:
+            arrays[-1].append(value)
+        else:
+            yield value
+
+
+def _has_simple_fonts(page) -> bool:
+    """True if every font of the page can be decoded byte by byte."""
+    resources = page.get("/Resources")
+    if resources is None:
+        return True
+    fonts = resources.get_object().get("/Font")
+    if fonts is None:
+        return True
+    for font in fonts.get_object().values():
+        font = font.get_object()
+        if "/ToUnicode" in font or font.get("/Subtype") == "/Type0":
+            return False
+        if font.get("/Encoding") not in SIMPLE_ENCODINGS:
+            return False
+    return True
+
+
+def _page_content(page) -> bytes:
+    contents = page.get("/Contents")
+    if contents is None:
+        return b""
+    contents = contents.get_object()
+    if isinstance(contents, list):
+        return b"\n".join(stream.get_object().get_data() for stream in contents)
+    return contents.get_data()
+
+
+def content_stream_text(data: bytes, encoding: str = "cp1252") -> str:
+    """Rebuild the text lines of a page from its text showing operators.
+
+    Text fragments are grouped by their baseline and lines are returned from
+    top to bottom, fragments of one line from left to right.
+    """
+    segments = []
+    operands = []
+    line_x, line_y, leading = 0.0, 0.0, 0.0
+
+    def show(value):
+        if isinstance(value, list):
+            text = ""
+            for part in value:
+                if isinstance(part, bytes):
+                    text += part.decode(encoding, errors="replace")
+                elif part < -TJ_SPACE_THRESHOLD:
+                    text += " "
+        else:
+            text = value.decode(encoding, errors="replace")
+        segments.append((line_y, line_x, len(segments), text))
+
+    for token in _tokenize(data):
+        if not isinstance(token, str) or token.startswith("/"):
+            operands.append(token)
+            continue
+        if token == "BT":
+            line_x, line_y = 0.0, 0.0
+        elif token in ("Td", "TD") and len(operands) >= 2:
+            line_x += operands[-2]
+            line_y += operands[-1]
+            if token == "TD":
+                leading = -operands[-1]
+        elif token == "Tm" and len(operands) >= 6:
+            line_x, line_y = operands[-2], operands[-1]
+        elif token == "TL" and operands:
+            leading = operands[-1]
+        elif token == "T*":
+            line_y -= leading
+        elif token in ("Tj", "TJ") and operands:
+            show(operands[-1])
+        elif token in ("'", '"') and operands:
+            line_y -= leading
+            show(operands[-1])
+        operands = []
+
+    lines = []
+    current_y = None
+    for y, _, _, text in sorted(segments, key=lambda s: (-s[0], s[1], s[2])):
+        if current_y is None or abs(y - current_y) > 0.5:
+            lines.append(text)
+            current_y = y
+        elif lines[-1].endswith(" ") or text.startswith(" "):
+            lines[-1] += text
+        else:
+            lines[-1] += " " + text
+    return "\n".join(line.strip() for line in lines)
+
+
+class PdfTextExtractor:
+    """Extracts the text of all the pages of a PDF with a chosen backend.
+
+    - "pypdf": pypdf layout aware extract_text (slowest, most robust).
+    - "content_stream": reads the page content streams and parses the text
+      operators directly. Pages using fonts that need a ToUnicode map fall
+      back to pypdf.
+    - "pymupdf": MuPDF, if the pymupdf package is installed.
+
+    Create one extractor and reuse it for a whole batch of files.
+    """
+
+    def __init__(self, backend: str = "content_stream") -> None:
+        if backend not in PDF_BACKENDS:
+            raise ValueError(f"Unknown PDF backend: {backend}")
+        self.backend = backend
+        # The PDF libraries are imported once an extractor is needed
+        if backend == "pymupdf":
+            import fitz
+
+            self.fitz = fitz
+        else:
+            import pypdf
+
+            self.pypdf = pypdf
+
+    def extract(self, file_path: str) -> str:
+        if self.backend == "pymupdf":
+            with self.fitz.open(file_path) as doc:
+                return "\n".join(page.get_text() for page in doc)
+
+        with open(file_path, "rb") as f:
+            pdf_reader = self.pypdf.PdfReader(f)
+            pages_text = []
+            for page in pdf_reader.pages:
+                if self.backend == "content_stream" and _has_simple_fonts(page):
+                    pages_text.append(content_stream_text(_page_content(page)))
+                else:
+                    pages_text.append(page.extract_text())
+        return "\n".join(pages_text)
+
+
+# One extractor per backend, shared by every parser of the process
+_extractors = {}
+
+
+def get_pdf_extractor(backend: str = "content_stream") -> PdfTextExtractor:
+    if backend not in _extractors:
+        _extractors[backend] = PdfTextExtractor(backend)
+    return _extractors[backend]
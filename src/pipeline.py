@@ -0,0 +1,153 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from src.collector import EmailCollector
+from src import instrumentation
+from src.expense_table import ExpenseTable
+from src.logger import get_logger
+from src.parallel import parse_ticket, parse_ticket_traced
+from src.ticket_db import TicketDatabase
+
+# Marks the end of a queue
+DONE = None
+
+
+class TicketPipeline:
+    """Streams tickets from IMAP and disk through parsing into aggregates.
+
+    Attachment downloads (in a thread), ticket parsing (in a process pool)
+    and aggregation run concurrently and are connected by bounded queues, so
+    a slow stage makes the others wait instead of piling up work in memory.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        cache_path: str = None,
+        ticket_db: TicketDatabase = None,
+        queue_size: int = None,
+        batch_size: int = 50,
+    ) -> None:
+        self.logger = get_logger("TicketPipeline")
+        self.workers = max(1, workers)
+        self.cache_path = cache_path
+        self.ticket_db = ticket_db
+        self.queue_size = queue_size or 2 * self.workers
+        self.batch_size = batch_size
+        self.expenses = ExpenseTable()
+        self.seen = set()
+
+    async def _put_ticket(self, tickets: asyncio.Queue, vendor: str, file_path: str):
+        if file_path in self.seen:
+            return
+        self.seen.add(file_path)
+        if self.ticket_db is not None and self.ticket_db.is_known(file_path):
+            return
+        # Blocks while the parsers are behind
+        await tickets.put((vendor, file_path))
+
+    async def _produce_local(self, tickets: asyncio.Queue, local_tickets: list):
+        for vendor, file_path in local_tickets:
+            await self._put_ticket(tickets, vendor, file_path)
+
+    async def _produce_emails(
+        self,
+        tickets: asyncio.Queue,
+        email_collector: EmailCollector,
+        email_ids: list,
+        download_folder: str,
+    ):
+        for i in range(0, len(email_ids), self.batch_size):
+            batch = email_ids[i : i + self.batch_size]
+            file_paths = await asyncio.to_thread(
+                email_collector.fetch_attachments, batch, download_folder
+            )
+            for file_path in file_paths:
+                if file_path.lower().endswith(".pdf"):
+                    await self._put_ticket(tickets, "Mercadona", file_path)
+
+    async def _parse(
+        self,
+        executor: ProcessPoolExecutor,
+        tickets: asyncio.Queue,
+        results: asyncio.Queue,
+    ):
+        loop = asyncio.get_running_loop()
+        traced = instrumentation.is_enabled()
+        while True:
+            ticket = await tickets.get()
+            if ticket is DONE:
+                return
+            vendor, file_path = ticket
+            try:
+                result = await loop.run_in_executor(
+                    executor,
+                    parse_ticket_traced if traced else parse_ticket,
+                    vendor,
+                    file_path,
+                    self.cache_path,
+                )
+            except Exception as e:
+                # The worker itself died (e.g. a crash inside OpenCV)
+                self.logger.error(f"Worker failed on {file_path}: {e}")
+                continue
+            if traced:
+                result, records = result
+                instrumentation.merge(records)
+            if result is not None:
+                await results.put((vendor, file_path, result))
+
+    async def _aggregate(self, results: asyncio.Queue):
+        while True:
+            result = await results.get()
+            if result is DONE:
+                return
+            vendor, file_path, (items, date) = result
+            if self.ticket_db is not None:
+                self.ticket_db.upsert_ticket(vendor, file_path, date, items)
+            else:
+                self.expenses.append_ticket(vendor, items, date)
+
+    async def run(
+        self,
+        local_tickets: list = (),
+        email_collector: EmailCollector = None,
+        email_ids: list = (),
+        download_folder: str = None,
+    ):
+        """Process local (vendor, file_path) tickets and email attachments.
+
+        Returns the aggregates: the ticket database if one was given, an
+        ExpenseTable otherwise.
+        """
+        tickets = asyncio.Queue(maxsize=self.queue_size)
+        results = asyncio.Queue(maxsize=self.queue_size)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            parsers = [
+                asyncio.create_task(self._parse(executor, tickets, results))
+                for _ in range(self.workers)
+            ]
+            aggregator = asyncio.create_task(self._aggregate(results))
+
+            producers = [self._produce_local(tickets, local_tickets)]
+            if email_collector is not None and email_ids:
+                producers.append(
+                    self._produce_emails(
+                        tickets, email_collector, email_ids, download_folder
+                    )
+                )
+            try:
+                await asyncio.gather(*producers)
+
+                for _ in parsers:
+                    await tickets.put(DONE)
+                await asyncio.gather(*parsers)
+                await results.put(DONE)
+                await aggregator
+            except BaseException:
+                for task in parsers + [aggregator]:
+                    task.cancel()
+                raise
+
+        return self.ticket_db if self.ticket_db is not None else self.expenses
@@ -1,59 +1,237 @@
-import matplotlib.pyplot as plt
-import numpy as np
+import hashlib
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src import instrumentation
+
+# matplotlib is imported by the functions that draw, so that runs which
+# don't plot never pay for it
+
+CHART_FORMATS = ("png", "svg", "pdf")
 
 
 def set_plot_params(title: str, x_label: str, y_label: str):
-    plt.title(title, fontsize=16)
-    plt.xlabel(x_label, fontsize=14)
-    plt.ylabel(y_label, fontsize=14)
-    plt.grid(axis="x")
+    import matplotlib.pyplot as plt
 
+    set_axes_params(plt.gca(), title, x_label, y_label)
 
-def plot_expenses_per_month(expenses_per_month: dict, title_vendor: str = None) -> None:
+
+def set_axes_params(ax, title: str, x_label: str, y_label: str):
+    ax.set_title(title, fontsize=16)
+    ax.set_xlabel(x_label, fontsize=14)
+    ax.set_ylabel(y_label, fontsize=14)
+    ax.grid(axis="x")
+
+
+def top_items(expenses_per_item: dict, top_n: int = 30) -> dict:
+    """The top_n most expensive items, from the most expensive one.
+
+    heapq.nlargest keeps only top_n items while scanning, instead of
+    sorting thousands of products.
+    """
+    return dict(
+        heapq.nlargest(top_n, expenses_per_item.items(), key=lambda item: item[1])
+    )
+
+
+def draw_expenses_per_month(ax, expenses_per_month: dict, title_vendor: str = None):
     # Sort the dictionary by month
     expenses_per_month = dict(sorted(expenses_per_month.items()))
 
-    # Create the plot
-    plt.figure(figsize=(10, 6))
-    plt.bar(
+    ax.bar(
         range(len(expenses_per_month)),
         list(expenses_per_month.values()),
         align="center",
         color="skyblue",
     )
-    plt.xticks(range(len(expenses_per_month)), list(expenses_per_month.keys()))
-    set_plot_params(f"Expenses per Month {title_vendor}", "Month", "Expenses (€)")
+    ax.set_xticks(range(len(expenses_per_month)))
+    ax.set_xticklabels([str(month) for month in expenses_per_month])
+    set_axes_params(ax, f"Expenses per Month {title_vendor}", "Month", "Expenses (€)")
 
 
-def plot_expenses_per_item(
-    expenses_per_item: dict, title_vendor: str = None, top_n: int = 30
-) -> None:
-    if len(expenses_per_item) < top_n:
-        top_n = len(expenses_per_item)
-
-    # Sort the dictionary by expense and select the top N items
-    expenses_per_item = dict(
-        sorted(expenses_per_item.items(), key=lambda item: item[1], reverse=True)[
-            :top_n
-        ]
-    )
+def draw_expenses_per_item(
+    ax, expenses_per_item: dict, title_vendor: str = None, top_n: int = 30
+):
+    expenses_per_item = top_items(expenses_per_item, top_n)
+    top_n = len(expenses_per_item)
 
-    # Create the plot
-    plt.figure(figsize=(10, 6))
-    plt.barh(
+    ax.barh(
         range(len(expenses_per_item)),
         list(expenses_per_item.values()),
         align="center",
         color="skyblue",
     )
-    plt.yticks(
-        range(len(expenses_per_item)),
-        list(expenses_per_item.keys()),
-    )
-    set_plot_params(
-        f"Top {top_n} Expenses per Item {title_vendor}", "Expenses (€)", "Item"
+    ax.set_yticks(range(len(expenses_per_item)))
+    ax.set_yticklabels(list(expenses_per_item.keys()))
+    set_axes_params(
+        ax, f"Top {top_n} Expenses per Item {title_vendor}", "Expenses (€)", "Item"
     )
 
 
+@instrumentation.timed(
+    "plot_expenses_per_month", count_items=instrumentation.first_arg_len
+)
+def plot_expenses_per_month(expenses_per_month: dict, title_vendor: str = None) -> None:
+    import matplotlib.pyplot as plt
+
+    # Create the plot
+    plt.figure(figsize=(10, 6))
+    draw_expenses_per_month(plt.gca(), expenses_per_month, title_vendor)
+
+
+@instrumentation.timed(
+    "plot_expenses_per_item", count_items=instrumentation.first_arg_len
+)
+def plot_expenses_per_item(
+    expenses_per_item: dict, title_vendor: str = None, top_n: int = 30
+) -> None:
+    import matplotlib.pyplot as plt
+
+    # Create the plot
+    plt.figure(figsize=(10, 6))
+    draw_expenses_per_item(plt.gca(), expenses_per_item, title_vendor, top_n)
+
+
+@instrumentation.timed("plot_show")
 def plot_show():
+    import matplotlib.pyplot as plt
+
     plt.show()
+
+
+class ChartRenderer:
+    """Writes the charts to files instead of showing them, for headless runs.
+
+    The figures are drawn with the Agg canvas, without pyplot or a GUI, and
+    one figure object is reused for every chart. png and svg charts are
+    written as they are added, optionally by a background thread so that
+    parsing goes on meanwhile, and all the pdf charts go to one multi-page
+    charts.pdf on close. A chart whose data didn't change since the last
+    run is not drawn again.
+    """
+
+    DIGESTS_FILE = "chart_digests.json"
+    PDF_FILE = "charts.pdf"
+
+    def __init__(
+        self, output_dir: str, formats: list = ("png",), background: bool = False
+    ) -> None:
+        for chart_format in formats:
+            if chart_format not in CHART_FORMATS:
+                raise ValueError(f"Unknown chart format: {chart_format}")
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        os.makedirs(output_dir, exist_ok=True)
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(10, 6))
+        FigureCanvasAgg(self.figure)
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.futures = []
+        # Charts of the multi-page pdf, drawn on close
+        self.pdf_charts = []
+        self.written = []
+
+        self.digests_path = os.path.join(output_dir, self.DIGESTS_FILE)
+        self.digests = {}
+        if os.path.isfile(self.digests_path):
+            with open(self.digests_path, "r") as f:
+                self.digests = json.load(f)
+
+    @staticmethod
+    def _digest(*chart) -> str:
+        kind, data, title_vendor, options = chart
+        key = repr((kind, sorted(data.items()), title_vendor, sorted(options.items())))
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    @staticmethod
+    def _file_stem(kind: str, title_vendor: str) -> str:
+        title = str(title_vendor).lower().replace(" ", "_")
+        return f"{kind}_{title}"
+
+    def _draw(self, kind: str, data: dict, title_vendor: str, options: dict):
+        self.figure.clear()
+        ax = self.figure.add_subplot()
+        if kind == "expenses_per_month":
+            draw_expenses_per_month(ax, data, title_vendor)
+        else:
+            draw_expenses_per_item(ax, data, title_vendor, **options)
+        self.figure.tight_layout()
+
+    @instrumentation.timed("render_chart")
+    def _render(self, chart: tuple, file_paths: list) -> None:
+        self._draw(*chart)
+        for file_path in file_paths:
+            self.figure.savefig(file_path)
+
+    def add_chart(self, kind: str, data: dict, title_vendor: str, **options):
+        chart = (kind, dict(data), title_vendor, options)
+        digest = self._digest(*chart)
+        stem = self._file_stem(kind, title_vendor)
+        if "pdf" in self.formats:
+            self.pdf_charts.append((stem, digest, chart))
+
+        file_paths = []
+        for chart_format in self.formats:
+            if chart_format == "pdf":
+                continue
+            file_name = f"{stem}.{chart_format}"
+            file_path = os.path.join(self.output_dir, file_name)
+            if self.digests.get(file_name) == digest and os.path.isfile(file_path):
+                continue
+            self.digests[file_name] = digest
+            file_paths.append(file_path)
+        if not file_paths:
+            return
+
+        self.written.extend(file_paths)
+        if self.executor is None:
+            self._render(chart, file_paths)
+        else:
+            self.futures.append(self.executor.submit(self._render, chart, file_paths))
+
+    def expenses_per_month(self, expenses_per_month: dict, title_vendor: str = None):
+        self.add_chart("expenses_per_month", expenses_per_month, title_vendor)
+
+    def expenses_per_item(
+        self, expenses_per_item: dict, title_vendor: str = None, top_n: int = 30
+    ):
+        # Only the drawn items count for the digest
+        self.add_chart(
+            "expenses_per_item",
+            top_items(expenses_per_item, top_n),
+            title_vendor,
+            top_n=top_n,
+        )
+
+    def _write_pdf(self) -> None:
+        file_path = os.path.join(self.output_dir, self.PDF_FILE)
+        digest = hashlib.sha1(
+            "".join(digest for _, digest, _ in self.pdf_charts).encode()
+        ).hexdigest()
+        if self.digests.get(self.PDF_FILE) == digest and os.path.isfile(file_path):
+            return
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        with PdfPages(file_path) as pdf:
+            for _, _, chart in self.pdf_charts:
+                self._draw(*chart)
+                pdf.savefig(self.figure)
+        self.digests[self.PDF_FILE] = digest
+        self.written.append(file_path)
+
+    def close(self) -> list[str]:
+        """Wait for the background rendering, write the pdf and return the
+        written files."""
+        for future in self.futures:
+            future.result()
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.pdf_charts:
+            self._write_pdf()
+        with open(self.digests_path, "w") as f:
+            json.dump(self.digests, f, indent=2)
+        return self.written
@@ -0,0 +1,72 @@
+"""Preprocessing parity check
+
+Runs the standard and the fast enhance_image pipelines on sample tickets and
+compares the Tesseract output of both.
+
+Usage:
+  preprocess_parity.py TICKETS_DIR [--deskew-limit=<deg>]
+
+Arguments:
+  TICKETS_DIR    Directory with .jpg tickets.
+
+Options:
+  -h --help               Show this screen.
+  --deskew-limit=<deg>    Deskew limit in degrees [default: 3].
+"""
+
+import difflib
+import os
+import time
+
+from docopt import docopt
+
+from src.image_processor import ImageProcessor
+from src.ocr import get_ocr_engine
+
+
+def ocr(img) -> str:
+    return get_ocr_engine(lang="cat+eng+spa", psm=4, oem=1).image_to_string(img)
+
+
+def compare_ticket(file_path: str, deskew_limit: float) -> dict:
+    result = {"file_path": file_path}
+    for mode in ("standard", "fast"):
+        img_processor = ImageProcessor(img_path=file_path)
+        start = time.perf_counter()
+        img = img_processor.enhance_image(
+            deskew_limit=deskew_limit, deskew_method="exhaustive", mode=mode
+        )
+        result[f"{mode}_seconds"] = time.perf_counter() - start
+        result[f"{mode}_text"] = ocr(img)
+    result["similarity"] = difflib.SequenceMatcher(
+        None, result["standard_text"], result["fast_text"]
+    ).ratio()
+    return result
+
+
+def main(tickets_dir: str, deskew_limit: float) -> None:
+    file_names = sorted(
+        f for f in os.listdir(tickets_dir) if f.lower().endswith(".jpg")
+    )
+    for file_name in file_names:
+        result = compare_ticket(os.path.join(tickets_dir, file_name), deskew_limit)
+        status = "OK" if result["standard_text"] == result["fast_text"] else "DIFF"
+        print(
+            f"{status} {file_name}: similarity {result['similarity']:.3f}, "
+            f"standard {result['standard_seconds']:.2f}s, "
+            f"fast {result['fast_seconds']:.2f}s"
+        )
+        if status == "DIFF":
+            diff = difflib.unified_diff(
+                result["standard_text"].splitlines(),
+                result["fast_text"].splitlines(),
+                "standard",
+                "fast",
+                lineterm="",
+            )
+            print("\n".join(diff))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    main(args["TICKETS_DIR"], float(args["--deskew-limit"]))
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import unicodedata
+
+NON_ALNUM_PATTERN = re.compile(r"[^A-Z0-9]+")
+# A number or size word of a normalized name, e.g. "2", "X6" or "500G"
+SIZE_WORD_PATTERN = re.compile(r"X?\d+[A-Z]{0,3}")
+
+
+def normalize_product(name: str) -> str:
+    """Upper case, without accents, punctuation or repeated spaces."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return NON_ALNUM_PATTERN.sub(" ", name.upper()).strip()
+
+
+def trigrams(normalized: str) -> set[str]:
+    # Padded so that short names and word starts get trigrams too
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def size_words(normalized: str) -> set[str]:
+    return {word for word in normalized.split() if SIZE_WORD_PATTERN.fullmatch(word)}
+
+
+def can_be_variant(normalized: str, product_normalized: str) -> bool:
+    """Whether a similar name can be an OCR variant of the product.
+
+    Names with other numbers or sizes ("ESPECIAS TIPO 2", "YOGUR NATURAL
+    X6") or with an extra word ("ARROZ BASMATI INTEGRAL") are sibling
+    products, however similar they are.
+    """
+    if size_words(normalized) != size_words(product_normalized):
+        return False
+    words, product_words = set(normalized.split()), set(product_normalized.split())
+    return not (words < product_words or product_words < words)
+
+
+class ProductCatalog:
+    """Canonical product names that the OCR variants of a name resolve to.
+
+    A parsed name is normalized and looked up in the alias table first.
+    Unknown names are compared with the canonical names through a trigram
+    index, and the most similar one (Dice coefficient of the trigrams) wins
+    if it reaches the threshold and can be a variant, see can_be_variant.
+    A name without any such product becomes a new canonical product.
+
+    Fuzzy matches only last for the session and are kept as suggestions,
+    the alias table only grows with the variants confirmed with add_alias.
+    Resolved names are memoized, so every distinct name is matched once.
+
+    Products, aliases and suggestions are persisted as JSON, see save.
+    """
+
+    def __init__(self, catalog_path: str = None, threshold: float = 0.7) -> None:
+        self.catalog_path = catalog_path
+        self.threshold = threshold
+        self.products = []
+        # Normalized name -> product id, including the canonical names
+        self.aliases = {}
+        # Normalized name -> canonical name it was matched to, to confirm
+        self.suggestions = {}
+        # Trigram -> ids of the products containing it
+        self.index = {}
+        self.product_trigrams = []
+        # Raw name -> product id
+        self.cache = {}
+        self.changed = False
+
+        if catalog_path is not None and os.path.isfile(catalog_path):
+            with open(catalog_path, "r") as f:
+                catalog = json.load(f)
+            for name in catalog["products"]:
+                self.add_product(name)
+            self.aliases.update(catalog["aliases"])
+            self.suggestions.update(catalog.get("suggestions", {}))
+            self.changed = False
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def add_product(self, name: str) -> int:
+        """Add a canonical product, returns its id."""
+        normalized = normalize_product(name)
+        product_id = self.aliases.get(normalized)
+        if product_id is not None:
+            return product_id
+        product_id = len(self.products)
+        self.products.append(name.strip())
+        self.aliases[normalized] = product_id
+        grams = trigrams(normalized)
+        self.product_trigrams.append(grams)
+        for gram in grams:
+            self.index.setdefault(gram, []).append(product_id)
+        self.changed = True
+        return product_id
+
+    def add_alias(self, name: str, product: str) -> None:
+        """Confirm that name is a variant of the canonical product."""
+        product_id = self.add_product(product)
+        normalized = normalize_product(name)
+        self.aliases[normalized] = product_id
+        self.suggestions.pop(normalized, None)
+        self.cache.pop(name, None)
+        self.changed = True
+
+    def match(self, name: str) -> tuple[int, float]:
+        """The most similar possible product and its similarity.
+
+        (None, 0.0) when no product shares a trigram and can be a variant.
+        """
+        normalized = normalize_product(name)
+        grams = trigrams(normalized)
+        shared = {}
+        for gram in grams:
+            for product_id in self.index.get(gram, ()):
+                shared[product_id] = shared.get(product_id, 0) + 1
+
+        best_id, best_score = None, 0.0
+        for product_id, count in shared.items():
+            score = 2 * count / (len(grams) + len(self.product_trigrams[product_id]))
+            if score > best_score and can_be_variant(
+                normalized, normalize_product(self.products[product_id])
+            ):
+                best_id, best_score = product_id, score
+        return best_id, best_score
+
+    def resolve(self, name: str) -> int:
+        """Id of the canonical product of a parsed name."""
+        product_id = self.cache.get(name)
+        if product_id is not None:
+            return product_id
+
+        normalized = normalize_product(name)
+        product_id = self.aliases.get(normalized)
+        if product_id is None:
+            product_id, score = self.match(name)
+            if product_id is not None and score >= self.threshold:
+                # Not an alias until confirmed, so a wrong match is never
+                # persisted
+                product = self.products[product_id]
+                if self.suggestions.get(normalized) != product:
+                    self.suggestions[normalized] = product
+                    self.changed = True
+            else:
+                product_id = self.add_product(name)
+        self.cache[name] = product_id
+        return product_id
+
+    def canonical(self, name: str) -> str:
+        return self.products[self.resolve(name)]
+
+    def merge_totals(self, expenses_per_item: dict) -> dict:
+        """Add up the totals of the variants of each canonical product."""
+        merged = {}
+        for name, total in expenses_per_item.items():
+            product = self.canonical(name)
+            merged[product] = merged.get(product, 0.0) + total
+        return merged
+
+    def save(self) -> None:
+        if self.catalog_path is None or not self.changed:
+            return
+        # Write to a temporary file first so a crash never leaves a broken
+        # catalog
+        dir_name = os.path.dirname(self.catalog_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        tmp_path = self.catalog_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "products": self.products,
+                    "aliases": self.aliases,
+                    "suggestions": self.suggestions,
+                },
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.catalog_path)
+        self.changed = False
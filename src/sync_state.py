@@ -0,0 +1,40 @@
+import json
+import os
+
+
+class SyncState:
+    """Last seen UID and UIDVALIDITY per mailbox/sender, persisted as JSON."""
+
+    def __init__(self, state_path: str) -> None:
+        self.state_path = state_path
+        self.state = {}
+        if os.path.isfile(state_path):
+            with open(state_path, "r") as f:
+                self.state = json.load(f)
+
+    @staticmethod
+    def _key(mailbox: str, sender: str) -> str:
+        return f"{mailbox}|{sender}"
+
+    def get_last_uid(self, mailbox: str, sender: str, uidvalidity: int) -> int:
+        """Return the last synced UID, or 0 if a full resync is needed."""
+        entry = self.state.get(self._key(mailbox, sender))
+        if entry is None or entry["uidvalidity"] != uidvalidity:
+            return 0
+        return entry["last_uid"]
+
+    def update(self, mailbox: str, sender: str, uidvalidity: int, last_uid: int):
+        self.state[self._key(mailbox, sender)] = {
+            "uidvalidity": uidvalidity,
+            "last_uid": last_uid,
+        }
+
+    def save(self) -> None:
+        # Write to a temporary file first so a crash never leaves a broken state
+        dir_name = os.path.dirname(self.state_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,66 @@
+# test_expense_table.py
+import pytest
+
+from src.expense_table import ExpenseTable
+from src.utils import extract_expenses_per_item, extract_expenses_per_month
+
+MERCADONA = [
+    (
+        [
+            {"units": 2, "product": "PAN", "price_per_unit": 0.5, "total_price": 1.0},
+            {
+                "product": "PLATANO",
+                "weight_kg": 0.5,
+                "price_per_kg": 2.0,
+                "total_price": 1.0,
+            },
+        ],
+        "20240105",
+    ),
+    ([{"units": 1, "product": "PAN", "total_price": 0.5}], "20240211"),
+]
+GRANEL = [
+    (
+        [
+            {
+                "product": "ARROZ",
+                "weight_kg": 1.0,
+                "price_per_kg": 3.0,
+                "total_price": 3.0,
+            }
+        ],
+        "20240120",
+    )
+]
+
+
+def test_group_by():
+    table = ExpenseTable.from_items(MERCADONA, vendor="Mercadona")
+    table.extend(GRANEL, vendor="Granel")
+
+    assert len(table) == 4
+    assert table.expenses_per_month() == {("2024", "01"): 5.0, ("2024", "02"): 0.5}
+    assert table.expenses_per_item(vendor="Mercadona") == {"PAN": 1.5, "PLATANO": 1.0}
+    assert table.expenses_per_vendor() == {"Mercadona": 2.5, "Granel": 3.0}
+    assert table.group_by("vendor", "month", since=20240110) == {
+        ("Mercadona", "02"): 0.5,
+        ("Granel", "01"): 3.0,
+    }
+    assert table.expenses_per_item(vendor="Unknown") == {}
+    with pytest.raises(ValueError):
+        table.group_by("weekday")
+
+
+def test_merge():
+    table = ExpenseTable.from_items(GRANEL, vendor="Granel")
+    table.merge(ExpenseTable.from_items(MERCADONA, vendor="Mercadona"))
+    assert table.expenses_per_item() == {"ARROZ": 3.0, "PAN": 1.5, "PLATANO": 1.0}
+    assert table.expenses_per_vendor() == {"Granel": 3.0, "Mercadona": 2.5}
+
+
+def test_utils_wrappers():
+    assert extract_expenses_per_month(MERCADONA) == {
+        ("2024", "01"): 2.0,
+        ("2024", "02"): 0.5,
+    }
+    assert extract_expenses_per_item(MERCADONA) == {"PAN": 1.5, "PLATANO": 1.0}
@@ -0,0 +1,124 @@
+# test_image_processor.py
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import write_granel_jpeg
+from src.image_processor import ImageProcessor, jpeg_size
+
+
+def make_ticket(angle: float) -> np.ndarray:
+    img = np.full((1200, 600, 3), 255, np.uint8)
+    for i in range(20):
+        cv2.putText(
+            img,
+            f"PRODUCTO {i} 1,234 2,50",
+            (30, 60 + i * 55),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.9,
+            (0, 0, 0),
+            2,
+        )
+    M = cv2.getRotationMatrix2D((300, 600), angle, 1.0)
+    return cv2.warpAffine(img, M, (600, 1200), borderValue=(255, 255, 255))
+
+
+def make_processor(img: np.ndarray) -> ImageProcessor:
+    processor = ImageProcessor.__new__(ImageProcessor)
+    processor.img = img
+    return processor
+
+
+@pytest.mark.parametrize("angle", [-2.4, 0.6, 1.8])
+def test_coarse_to_fine_matches_exhaustive(angle):
+    img = make_ticket(angle)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    processor = make_processor(img)
+
+    exhaustive = processor._exhaustive_skew_angle(thresh, 0.2, 3)
+    coarse_to_fine = processor._coarse_to_fine_skew_angle(thresh, 0.2, 3)
+    assert abs(exhaustive - coarse_to_fine) <= 0.2 + 1e-9
+    assert abs(coarse_to_fine + angle) <= 0.2 + 1e-9
+
+
+def test_unknown_deskew_method():
+    with pytest.raises(ValueError):
+        make_processor(make_ticket(0)).deskew_image(method="hough")
+
+
+def test_fast_mode_matches_standard():
+    img = make_ticket(1.4)
+    standard = make_processor(img.copy()).enhance_image(
+        3, deskew_method="coarse_to_fine"
+    )
+    fast = make_processor(img.copy()).enhance_image(3, mode="fast")
+    assert fast.shape == standard.shape
+    assert (fast == standard).mean() > 0.99
+
+
+@pytest.mark.parametrize(
+    "distortions, clean",
+    [
+        ({}, True),
+        ({"skew": 1.5}, True),
+        ({"noise": 0.1}, False),
+        ({"shadow": 0.4}, False),
+    ],
+)
+def test_quality_metrics(tmp_path, distortions, clean):
+    file_path = str(tmp_path / "20240113_granel.jpg")
+    write_granel_jpeg(file_path, n_items=8, **distortions)
+    processor = ImageProcessor(file_path)
+    metrics = processor.quality_metrics(deskew_limit=3)
+    assert ImageProcessor.is_clean(metrics) == clean
+    # The skew is the rotation that straightens the photo
+    assert abs(metrics["skew"] + distortions.get("skew", 0)) <= 0.4
+
+    img = processor.enhance_image_light(metrics["skew"])
+    assert img.ndim == 2 and set(np.unique(img)) <= {0, 255}
+    # The original photo is kept for the standard preprocessing
+    assert processor.img.ndim == 3
+
+
+def test_reduced_decode(tmp_path):
+    img = cv2.resize(make_ticket(0), None, fx=3, fy=3)
+    encoded = cv2.imencode(".jpg", img)[1]
+    file_path = str(tmp_path / "ticket.jpg")
+    encoded.tofile(file_path)
+    assert jpeg_size(encoded.tobytes()) == (3600, 1800)
+
+    # Decoded at 1/2 (1800 px high), then downscaled to the target
+    processor = ImageProcessor(file_path, target_height=1000)
+    assert processor.img.shape == (1000, 500, 3)
+    # Close enough to the target, no resize
+    processor = ImageProcessor(file_path, target_height=1700)
+    assert processor.img.shape == (1800, 900, 3)
+
+    # Encoded bytes and memory mapped files give the same image
+    full = ImageProcessor(file_path, grayscale=True).img
+    assert full.shape == (3600, 1800)
+    assert (ImageProcessor(encoded.tobytes(), grayscale=True).img == full).all()
+    mapped = np.memmap(file_path, dtype=np.uint8, mode="r")
+    assert (ImageProcessor(mapped, grayscale=True).img == full).all()
+
+    with pytest.raises(ValueError):
+        ImageProcessor(b"not an image")
+
+
+def test_remove_shadows_in_place():
+    img = make_ticket(0.5)
+    # The former implementation, with new planes for every step
+    expected = cv2.merge(
+        [
+            255
+            - cv2.absdiff(
+                plane, cv2.medianBlur(cv2.dilate(plane, np.ones((7, 7), np.uint8)), 21)
+            )
+            for plane in cv2.split(img)
+        ]
+    )
+    processor = make_processor(img)
+    result = processor.remove_shadows()
+    assert result is img
+    assert (result == expected).all()
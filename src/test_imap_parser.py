@@ -0,0 +1,161 @@
+# test_imap_parser.py
+import base64
+import os
+import quopri
+from email.message import EmailMessage
+
+import pytest
+
+from src import instrumentation
+from src.collector import EmailCollector
+from src.imap_parser import (
+    compress_uid_set,
+    find_attachments,
+    iter_decoded_payload,
+    parse_fetch_response,
+    split_by_size,
+)
+
+BODYSTRUCTURE = (
+    b'1 (UID 12 BODYSTRUCTURE ((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL '
+    b'"7BIT" 20 1 NIL NIL NIL)("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL '
+    b'"QUOTED-PRINTABLE" 300 6 NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b2") '
+    b'NIL NIL)("APPLICATION" "PDF" ("NAME" "ticket.pdf") NIL NIL "BASE64" 44 '
+    b'NIL ("ATTACHMENT" ("FILENAME" "=?utf-8?q?20240105_Mercadona_12=2C50_=E2=82=AC.pdf?=")) '
+    b'NIL) "MIXED" ("BOUNDARY" "b1") NIL NIL))'
+)
+
+
+class FakeIMAP:
+    def __init__(self, payload: bytes) -> None:
+        self.payload = payload
+        self.commands = []
+
+    def uid(self, command, uid_set, items):
+        self.commands.append((uid_set, items))
+        if "BODYSTRUCTURE" in items:
+            return "OK", [BODYSTRUCTURE]
+        header = b"1 (UID 12 BODY[2] {%d}" % len(self.payload)
+        return "OK", [(header, self.payload), b")"]
+
+
+def test_find_attachments():
+    structure = parse_fetch_response([BODYSTRUCTURE])["12"]["BODYSTRUCTURE"]
+    attachments = find_attachments(structure)
+    assert len(attachments) == 1
+    assert attachments[0]["section"] == "2"
+    assert attachments[0]["content_type"] == "application/pdf"
+    assert attachments[0]["encoding"] == "base64"
+    assert attachments[0]["filename"] == "20240105 Mercadona 12,50 €.pdf"
+
+
+def test_truncated_response():
+    with pytest.raises(ValueError):
+        parse_fetch_response([b'1 (UID 12 BODYSTRUCTURE ("TEXT" "PLAI'])
+    with pytest.raises(ValueError):
+        parse_fetch_response([b'1 (UID 12 BODYSTRUCTURE ("TEXT" "PLAIN\\'])
+
+
+def test_compress_uid_set():
+    assert compress_uid_set([b"5", b"1", b"2", b"3", b"9", b"10"]) == "1:3,5,9:10"
+
+
+def test_split_by_size():
+    sizes = {"1": 40, "2": 50, "3": 200, "4": 10, "5": 10}
+    assert split_by_size(sizes, 100) == [["1", "2"], ["3"], ["4", "5"]]
+
+
+def test_literals_are_not_copied():
+    payload = b"x" * 1000
+    data = [(b"1 (UID 12 BODY[2] {1000}", payload), b")"]
+    assert parse_fetch_response(data)["12"]["BODY[2]"] is payload
+
+
+def test_fetch_attachments(tmp_path):
+    content = b"%PDF-1.4\n\x00\xff binary"
+    mail = FakeIMAP(base64.encodebytes(content))
+    collector = EmailCollector("user", "password", "imap.example.com")
+    collector.mail = mail
+
+    file_paths = collector.fetch_attachments([b"12"], str(tmp_path))
+    assert len(file_paths) == 1
+    with open(file_paths[0], "rb") as f:
+        assert f.read() == content
+    assert mail.commands[1] == ("12", "(UID BODY.PEEK[2])")
+
+    # Existing files are not downloaded again
+    collector.fetch_attachments([b"12"], str(tmp_path))
+    assert len(mail.commands) == 3
+
+
+def test_fetch_attachments_timing(tmp_path):
+    collector = EmailCollector("user", "password", "imap.example.com")
+    collector.mail = FakeIMAP(base64.encodebytes(b"%PDF-1.4"))
+    instrumentation.drain()
+    instrumentation.enable()
+    try:
+        collector.fetch_attachments([b"12"], str(tmp_path))
+    finally:
+        instrumentation.disable()
+    # One record per call, covering the section downloads too
+    stages = [record["stage"] for record in instrumentation.drain()]
+    assert sorted(stages) == ["fetch_attachments", "fetch_section"]
+
+
+class FakeMessageIMAP:
+    def __init__(self, raw_email: bytes) -> None:
+        self.raw_email = raw_email
+
+    def uid(self, command, uid_set, items):
+        header = b"1 (UID 12 BODY[] {%d}" % len(self.raw_email)
+        return "OK", [(header, self.raw_email), b")"]
+
+
+def test_iter_decoded_payload():
+    content = bytes(range(256)) * 50
+    encoded = base64.encodebytes(content)
+    for chunk_size in (5, 77, 1000):
+        chunks = iter_decoded_payload(encoded, "base64", chunk_size)
+        assert b"".join(chunks) == content
+        chunks = iter_decoded_payload(encoded.decode(), "base64", chunk_size)
+        assert b"".join(chunks) == content
+
+    text = "Préstamo = 12,50 € " * 20
+    encoded = quopri.encodestring(text.encode())
+    chunks = iter_decoded_payload(encoded, "quoted-printable", 7)
+    assert b"".join(chunks).decode() == text
+
+
+def test_download_attachments(tmp_path):
+    pdf = b"%PDF-1.4\n\x00\xff binary" * 1000
+    jpeg = b"\xff\xd8\xff\xe0 jpeg"
+    message = EmailMessage()
+    message.set_content("Your tickets")
+    message.add_attachment(
+        pdf, maintype="application", subtype="pdf", filename="ticket.pdf"
+    )
+    message.add_attachment(jpeg, maintype="image", subtype="jpeg", filename="a.jpg")
+    # Named with RFC 2047 encoded words, like some mail clients do
+    raw_email = message.as_bytes().replace(
+        b'filename="a.jpg"', b'filename="=?utf-8?q?Fruter=C3=ADa.jpg?="'
+    )
+
+    collector = EmailCollector("user", "password", "imap.example.com")
+    collector.mail = FakeMessageIMAP(raw_email)
+    file_paths = collector.download_attachments(b"12", str(tmp_path))
+    assert [os.path.basename(file_path) for file_path in file_paths] == [
+        "ticket.pdf",
+        "Frutería.jpg",
+    ]
+    with open(file_paths[0], "rb") as f:
+        assert f.read() == pdf
+    with open(file_paths[1], "rb") as f:
+        assert f.read() == jpeg
+    # No temporary files are left behind
+    assert sorted(os.listdir(tmp_path)) == ["Frutería.jpg", "ticket.pdf"]
+
+    # An email without attachments
+    message = EmailMessage()
+    message.set_content("No tickets today")
+    collector.mail = FakeMessageIMAP(message.as_bytes())
+    assert collector.download_attachments(b"13", str(tmp_path)) == []
@@ -0,0 +1,172 @@
+# test_imap_pool.py
+import imaplib
+import os
+
+import pytest
+
+from src.collector import EmailCollector
+from src.imap_pool import ImapConnectionPool, PooledEmailCollector
+from src.sync_state import SyncState
+
+MAILBOXES = {"inbox": ["3", "5", "7", "9"], "Tickets": ["2", "4"]}
+
+
+class FakeConnection:
+    """In-memory stand-in for EmailCollector that drops some connections."""
+
+    drops = 0
+    connect_failures = 0
+
+    def __init__(self, username, password, imap_url, timeout=None) -> None:
+        self.mailbox = None
+        self.pending_sync = None
+        self.connected = False
+        self.connects = 0
+
+    def connect(self) -> None:
+        if FakeConnection.connect_failures:
+            FakeConnection.connect_failures -= 1
+            raise TimeoutError("connect timed out")
+        self.connected = True
+        self.connects += 1
+
+    def close(self) -> None:
+        self.connected = False
+
+    def noop(self) -> None:
+        if not self.connected:
+            raise imaplib.IMAP4.abort("socket closed")
+
+    def select(self, mailbox: str) -> None:
+        self.mailbox = mailbox
+
+    def fetch_emails(self, sender, mailbox="inbox", state=None) -> list:
+        self.select(mailbox)
+        self.pending_sync = (mailbox, sender, 1, int(MAILBOXES[mailbox][-1]))
+        return list(MAILBOXES[mailbox])
+
+    def fetch_attachments(self, email_ids, download_folder) -> list:
+        assert self.connected
+        if FakeConnection.drops:
+            FakeConnection.drops -= 1
+            self.connected = False
+            raise imaplib.IMAP4.abort("connection reset")
+        file_paths = []
+        for uid in email_ids:
+            file_path = os.path.join(download_folder, f"{self.mailbox}_{uid}.pdf")
+            open(file_path, "w").close()
+            file_paths.append(file_path)
+        return file_paths
+
+
+def make_collector(connections: int = 2, **options) -> PooledEmailCollector:
+    collector = PooledEmailCollector(
+        "user",
+        "password",
+        "imap.example.com",
+        connections=connections,
+        chunk_size=2,
+        backoff=0,
+        connection_class=FakeConnection,
+        **options,
+    )
+    collector.connect()
+    return collector
+
+
+def test_fan_out_and_reconnect(tmp_path):
+    collector = make_collector()
+    email_ids = collector.fetch_emails(["a@x", "b@x"], ["inbox", "Tickets"])
+    assert email_ids == [
+        ("Tickets", "2"),
+        ("Tickets", "4"),
+        ("inbox", "3"),
+        ("inbox", "5"),
+        ("inbox", "7"),
+        ("inbox", "9"),
+    ]
+    assert collector._chunks(email_ids) == [
+        ("Tickets", ["2", "4"]),
+        ("inbox", ["3", "5"]),
+        ("inbox", ["7", "9"]),
+    ]
+
+    # Two dropped connections are retried transparently
+    FakeConnection.drops = 2
+    file_paths = collector.fetch_attachments(email_ids, str(tmp_path))
+    assert len(file_paths) == 6
+    assert sum(c.connects for c in collector.pool.all_connections) == 4
+
+
+def test_failed_range_holds_back_sync_state(tmp_path):
+    # One connection, so that the ranges are downloaded in order
+    collector = make_collector(connections=1, retries=0)
+    state = SyncState(str(tmp_path / "state.json"))
+    email_ids = collector.fetch_emails("a@x", "inbox", state)
+
+    # Only the first range ("3", "5") fails
+    FakeConnection.drops = 1
+    file_paths = collector.fetch_attachments(email_ids, str(tmp_path))
+    assert len(file_paths) == 2
+    collector.save_sync_state(state)
+    assert state.get_last_uid("inbox", "a@x", 1) == 2
+
+
+def test_failed_reconnect_is_retried(tmp_path):
+    collector = make_collector(connections=1)
+    email_ids = collector.fetch_emails("a@x", "inbox")
+
+    # The connection drops and the first reconnect times out too
+    FakeConnection.drops = 1
+    FakeConnection.connect_failures = 1
+    file_paths = collector.fetch_attachments(email_ids, str(tmp_path))
+    assert len(file_paths) == 4
+    assert not collector.failed
+
+
+class FlakyIMAP4_SSL:
+    """imaplib.IMAP4_SSL stand-in, the constructions in `fail` time out."""
+
+    constructions = 0
+    fail = ()
+
+    def __init__(self, host, timeout=None) -> None:
+        FlakyIMAP4_SSL.constructions += 1
+        if FlakyIMAP4_SSL.constructions in FlakyIMAP4_SSL.fail:
+            raise TimeoutError("connect timed out")
+
+    def login(self, username, password) -> None:
+        pass
+
+    def noop(self) -> None:
+        pass
+
+    def logout(self) -> None:
+        pass
+
+
+def test_failed_last_reconnect_with_email_collector(monkeypatch):
+    monkeypatch.setattr(imaplib, "IMAP4_SSL", FlakyIMAP4_SSL)
+    monkeypatch.setattr(FlakyIMAP4_SSL, "constructions", 0)
+    # The reconnect after the first failure is the second construction
+    monkeypatch.setattr(FlakyIMAP4_SSL, "fail", (2,))
+    pool = ImapConnectionPool(
+        "user", "password", "imap.example.com", size=1, retries=1, backoff=0
+    )
+    pool.open()
+
+    def drop(connection):
+        raise imaplib.IMAP4.abort("connection reset")
+
+    with pytest.raises(TimeoutError):
+        pool.run(drop)
+    # The closed connection is reconnected instead of checked with a NOOP
+    assert pool.run(lambda connection: connection.connected)
+    assert isinstance(pool.all_connections[0], EmailCollector)
+
+
+@pytest.fixture(autouse=True)
+def reset_drops():
+    yield
+    FakeConnection.drops = 0
+    FakeConnection.connect_failures = 0
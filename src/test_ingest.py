@@ -0,0 +1,76 @@
+# test_ingest.py
+import os
+
+from src.ingest import TicketClassifier, filter_by_date, group_by_vendor, scan_tickets
+from src.parser_factory import PARSER_CLASSES
+from src.ticket_parser import date_from_path
+
+FILES = [
+    "20240105 Mercadona 12,50 €.pdf",
+    "20240110_Granel.JPG",
+    "20240111_fruteria.jpg",
+    "20240112_granel.pdf",
+    "notes.txt",
+    os.path.join("2024", "02", "15", "granel.jpg"),
+    os.path.join("2024-03", "Fruteria.jpeg"),
+]
+
+
+def make_tree(tmp_path) -> str:
+    for file_name in FILES:
+        file_path = tmp_path / file_name
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(b"")
+    return str(tmp_path)
+
+
+def test_registry():
+    assert {"MERCADONA", "GRANEL", "FRUTERIA"} <= set(PARSER_CLASSES)
+    classifier = TicketClassifier()
+    assert classifier.classify("20240105 MERCADONA.PDF") == "Mercadona"
+    assert classifier.classify("20240105_mercadona.jpg") is None
+    assert TicketClassifier(vendors=["Granel"]).classify("x_fruteria.jpg") is None
+
+
+def test_scan_tickets(tmp_path):
+    tickets_dir = make_tree(tmp_path)
+    names = [
+        (vendor, os.path.relpath(file_path, tickets_dir))
+        for vendor, file_path in scan_tickets(tickets_dir)
+    ]
+    assert names == [
+        ("Mercadona", FILES[0]),
+        ("Granel", FILES[1]),
+        ("Fruteria", FILES[2]),
+    ]
+
+    tickets = scan_tickets(tickets_dir, recursive=True)
+    groups = group_by_vendor(tickets)
+    assert {vendor: len(group) for vendor, group in groups.items()} == {
+        "Mercadona": 1,
+        "Granel": 2,
+        "Fruteria": 2,
+    }
+    # Dated directories give the date of files not starting with one
+    dates = [date_from_path(file_path) for _, file_path in tickets]
+    assert sorted(dates) == [
+        "20240105",
+        "20240110",
+        "20240111",
+        "20240215",
+        "20240301",
+    ]
+
+
+def test_filter_by_date(tmp_path):
+    tickets = scan_tickets(make_tree(tmp_path), recursive=True)
+    assert filter_by_date(tickets) == tickets
+
+    window = filter_by_date(tickets, since=20240110, until=20240215)
+    assert sorted(date_from_path(file_path) for _, file_path in window) == [
+        "20240110",
+        "20240111",
+        "20240215",
+    ]
+    assert len(filter_by_date(tickets, since=20240301)) == 1
+    assert filter_by_date([("Granel", "ticket.jpg")], until=20240301) == []
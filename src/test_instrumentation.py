@@ -0,0 +1,65 @@
+# test_instrumentation.py
+import csv
+import json
+
+import pytest
+
+from benchmarks.synthetic import write_mercadona_pdf
+from src import instrumentation
+from src.parallel import parse_tickets
+
+
+@pytest.fixture(autouse=True)
+def reset_instrumentation():
+    yield
+    instrumentation.disable()
+    instrumentation.drain()
+
+
+def write_tickets(tmp_path, n_tickets: int = 3) -> list:
+    tickets = []
+    for i in range(n_tickets):
+        file_path = str(tmp_path / f"2024010{i + 1} Mercadona.pdf")
+        write_mercadona_pdf(file_path, n_items=4, seed=i)
+        tickets.append(("Mercadona", file_path))
+    return tickets
+
+
+def test_disabled_records_nothing(tmp_path):
+    parse_tickets(write_tickets(tmp_path, 1))
+    assert instrumentation.summary() == {}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_summary_and_trace(tmp_path, workers):
+    tickets = write_tickets(tmp_path)
+    instrumentation.enable()
+    parse_tickets(tickets, workers=workers)
+
+    summary = instrumentation.summary()
+    assert summary["parse_ticket"]["calls"] == 3
+    assert summary["parse_ticket"]["bytes"] > 0
+    assert summary["extract_items"]["items"] == 12
+    assert {file_path for file_path, _ in instrumentation.slowest_tickets()} == {
+        file_path for _, file_path in tickets
+    }
+    assert "parse_ticket" in instrumentation.format_summary()
+
+    instrumentation.write_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as f:
+        assert len(json.load(f)["calls"]) == 6
+    instrumentation.write_trace(str(tmp_path / "trace.csv"))
+    with open(tmp_path / "trace.csv", newline="") as f:
+        assert {row["stage"] for row in csv.DictReader(f)} == {
+            "parse_ticket",
+            "extract_items",
+        }
+
+
+def test_profile(tmp_path):
+    profile_path = str(tmp_path / "profile.pstats")
+    with instrumentation.profile(profile_path):
+        sum(range(1000))
+    with instrumentation.profile(None):
+        pass
+    assert (tmp_path / "profile.pstats").stat().st_size > 0
@@ -0,0 +1,77 @@
+# test_line_grammar.py
+from src.line_grammar import clean_ocr_text
+from src.parser_factory import get_ticket_parser
+
+
+def test_clean_ocr_text():
+    text = "ART |DESCRIPCION\n\n|\n101 ARROZ\n1 ,000 3. 00 3 ,00\n\n\nTOTAL 3,00"
+    assert clean_ocr_text(text) == (
+        "ART DESCRIPCION\n101 ARROZ\n1,000 3.00 3,00\nTOTAL 3,00"
+    )
+
+
+def parse(vendor: str, text: str):
+    parser = get_ticket_parser(vendor, "20240113_ticket.jpg")
+    parser._text = parser._clean_ocr_text(text)
+    return parser.extract_items(), parser.confidences
+
+
+def test_granel_ocr_noise():
+    lines = [
+        "ART DESCRIPCION",
+        "101 ARROZ",
+        "1,000 3,00 3,00",
+        # Merged columns
+        "102 PASAS 0,500 8,00 4,00",
+        # Missing amounts line, then noise
+        "103 NUECES",
+        "~",
+        "104 TIPO 1",
+        "0,100 20,00 2,00",
+        # Missing product line and a misread total
+        "0,200 5,00 1,90",
+        # OCR noise after the total
+        "106 AVENA",
+        "1,000 2,50 2,50 €|",
+        # Odd line count at the end
+        "105 QUINOA",
+        "TOTAL 10,90",
+    ]
+    items, confidences = parse("Granel", "\n".join(lines))
+    assert [item["product"] for item in items] == [
+        "ARROZ",
+        "PASAS",
+        "ESPECIAS TIPO 1",
+        "",
+        "AVENA",
+    ]
+    assert [item["total_price"] for item in items] == [3.0, 4.0, 2.0, 1.9, 2.5]
+    assert confidences[0] == confidences[2] == 1.0
+    assert 0.8 <= confidences[1] < 1.0
+    assert confidences[3] < 0.5
+    assert confidences[4] < 0.8
+
+
+def test_fruteria_formats():
+    items, confidences = parse(
+        "Fruteria",
+        "Artículo Importe\n"
+        "MANZANA\n1 x 0,500 kg 2,00 EUR/kg 1,00\n"
+        "NARANJA\n1 1,000 1,50 1,50\n"
+        "Total 2,50",
+    )
+    assert items == [
+        {
+            "product": "MANZANA",
+            "weight_kg": 0.5,
+            "price_per_kg": 2.0,
+            "total_price": 1.0,
+        },
+        {
+            "product": "NARANJA",
+            "weight_kg": 1.0,
+            "price_per_kg": 1.5,
+            "total_price": 1.5,
+        },
+    ]
+    assert confidences == [1.0, 1.0]
@@ -0,0 +1,162 @@
+# test_main.py
+import pytest
+import yaml
+from docopt import docopt
+
+import main
+from benchmarks.synthetic import write_mercadona_pdf
+
+
+class FakeCollector:
+    """Downloads the given tickets, without any IMAP server."""
+
+    def __init__(self, file_paths: list[str]) -> None:
+        self.file_paths = file_paths
+
+    def connect(self) -> None:
+        pass
+
+    def fetch_emails(self, sender, state=None) -> list:
+        return [b"1"]
+
+    def fetch_attachments(self, email_ids, download_folder) -> list[str]:
+        return self.file_paths
+
+    def close(self) -> None:
+        pass
+
+
+def test_collect_expenses_counts_mercadona_once(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "20240105 Mercadona 12,50 €.pdf")
+    items = write_mercadona_pdf(file_path, n_items=3)
+    monkeypatch.setattr(
+        main,
+        "create_email_collector",
+        lambda config, password: FakeCollector([file_path]),
+    )
+    monkeypatch.setattr(main, "plot_vendor_expenses", lambda *args, **kwargs: None)
+    plotted = []
+    monkeypatch.setattr(
+        main, "plot_all_vendors", lambda expenses, *args: plotted.append(expenses)
+    )
+
+    # The emails are downloaded to the tickets directory
+    config = {
+        "imap_url": "imap.example.com",
+        "email_sender": "tickets@example.com",
+        "username": "user",
+        "download_folder": str(tmp_path),
+        "tickets_dir": str(tmp_path),
+    }
+    main.collect_expenses(config, "password")
+    total = sum(item["total_price"] for item in items)
+    assert abs(plotted[0].expenses_per_vendor()["Mercadona"] - total) < 0.01
+
+
+def cli_options(*argv: str) -> tuple[str, dict]:
+    args = docopt(main.__doc__, argv=list(argv))
+    command = next((command for command in main.COMMANDS if args[command]), None)
+    return command, main.parse_options(args)
+
+
+def test_parse_options():
+    command, options = cli_options(
+        "parse",
+        "config.yaml",
+        "--vendor=granel, Fruteria",
+        "--since=2024-01-01",
+        "--until=20240131",
+        "--workers=2",
+        "--no-plot",
+    )
+    assert command == "parse"
+    assert options == {
+        "vendors": ["Granel", "Fruteria"],
+        "since": 20240101,
+        "until": 20240131,
+        "workers": 2,
+        "plot": False,
+    }
+    command, options = cli_options("config.yaml")
+    assert command is None
+    assert options["vendors"] is None and options["plot"]
+
+    with pytest.raises(SystemExit, match="Unknown vendor"):
+        cli_options("report", "config.yaml", "--vendor=lidl")
+    for date in ("2024-1-5", "20240105x", "yesterday"):
+        with pytest.raises(SystemExit, match="Invalid date"):
+            cli_options("report", "config.yaml", f"--since={date}")
+
+
+@pytest.fixture
+def tickets_config(tmp_path) -> dict:
+    tickets_dir = tmp_path / "tickets"
+    tickets_dir.mkdir()
+    totals = {}
+    for date in ("20240105", "20240210", "20240315"):
+        items = write_mercadona_pdf(
+            str(tickets_dir / f"{date} Mercadona.pdf"), n_items=3, seed=int(date)
+        )
+        totals[date] = sum(item["total_price"] for item in items)
+    config = {
+        "download_folder": str(tmp_path / "downloads"),
+        "tickets_dir": str(tickets_dir),
+        "ticket_db": str(tmp_path / "tickets.sqlite"),
+        "password": str(tmp_path / "password.txt"),
+        "imap_url": "imap.example.com",
+        "email_sender": "tickets@example.com",
+        "username": "user",
+    }
+    (tmp_path / "password.txt").write_text("password")
+    (tmp_path / "downloads").mkdir()
+    return config, totals
+
+
+def write_config(tmp_path, config: dict) -> str:
+    config_path = str(tmp_path / "config.yaml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+def test_parse_and_report(tmp_path, tickets_config, capsys):
+    config, totals = tickets_config
+    config_path = write_config(tmp_path, config)
+
+    # Only the tickets in the date range are parsed
+    _, options = cli_options("parse", config_path, "--since=2024-02-01", "--no-plot")
+    main.main(config_path, "parse", options)
+    output = capsys.readouterr().out
+    assert "Parsing 2 tickets..." in output
+    assert "20240105" not in output
+
+    _, options = cli_options("report", config_path, "--vendor=mercadona", "--no-plot")
+    main.main(config_path, "report", options)
+    output = capsys.readouterr().out
+    assert f"Mercadona: {totals['20240210'] + totals['20240315']:.2f} €" in output
+    assert "2024-02" in output and "2024-01" not in output
+
+
+def test_report_needs_ticket_db(tmp_path, tickets_config):
+    config, _ = tickets_config
+    del config["ticket_db"]
+    config_path = write_config(tmp_path, config)
+    _, options = cli_options("report", config_path)
+    with pytest.raises(SystemExit, match="ticket_db"):
+        main.main(config_path, "report", options)
+
+
+def test_sync_only_downloads(tmp_path, tickets_config, monkeypatch):
+    config, _ = tickets_config
+    config_path = write_config(tmp_path, config)
+    downloaded = [str(tmp_path / "downloads" / "20240105 Mercadona.pdf")]
+    monkeypatch.setattr(
+        main,
+        "create_email_collector",
+        lambda config, password: FakeCollector(downloaded),
+    )
+    monkeypatch.setattr(
+        main, "parse_selected_tickets", lambda *args: pytest.fail("parsed")
+    )
+    _, options = cli_options("sync", config_path)
+    main.main(config_path, "sync", options)
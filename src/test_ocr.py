@@ -0,0 +1,70 @@
+# test_ocr.py
+import numpy as np
+import pytest
+
+from src.ocr import (
+    OcrEngine,
+    PytesseractEngine,
+    TesserocrEngine,
+    find_item_region,
+    get_ocr_engine,
+    ocr_item_region,
+)
+
+
+class FakeEngine(OcrEngine):
+    def __init__(self, words: list[dict], text: str) -> None:
+        super().__init__("spa", 4, 1)
+        self.words = words
+        self.text = text
+        self.shapes = []
+
+    def image_to_string(self, img: np.ndarray) -> str:
+        self.shapes.append(img.shape)
+        return self.text
+
+    def image_to_data(self, img: np.ndarray) -> list[dict]:
+        return self.words
+
+
+def word(text: str, top: int) -> dict:
+    return {"text": text, "left": 10, "top": top, "width": 40, "height": 10}
+
+
+WORDS = [
+    word("FRUTERIA", 5),
+    word("Articulo", 100),
+    word("Total", 102),
+    word("PLATANO", 120),
+    word("Total", 300),
+]
+
+
+def test_auto_backend_falls_back(monkeypatch):
+    def missing_tessdata(self, lang, psm, oem):
+        raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+
+    monkeypatch.setattr(TesserocrEngine, "__init__", missing_tessdata)
+    monkeypatch.setattr("src.ocr._engines", {})
+    assert isinstance(get_ocr_engine(backend="auto"), PytesseractEngine)
+    with pytest.raises(RuntimeError):
+        get_ocr_engine(backend="tesserocr")
+
+
+def test_find_item_region():
+    img = np.zeros((1000, 400), np.uint8)
+    engine = FakeEngine(WORDS, "")
+    # The "Total" column header on the marker line is not the end marker
+    assert find_item_region(engine, img, "Artículo", "Total") == (180, 640)
+    assert find_item_region(engine, img, "Artículo", "IVA") is None
+
+
+def test_ocr_item_region_falls_back_to_full_page():
+    img = np.zeros((1000, 400), np.uint8)
+    engine = FakeEngine(WORDS, "Artículo\nPLATANO\n1,0 2,0 2,0\nTotal")
+    ocr_item_region(engine, img, "Artículo", "Total")
+    assert engine.shapes == [(460, 400)]
+
+    engine = FakeEngine(WORDS, "garbage")
+    ocr_item_region(engine, img, "Artículo", "Total")
+    assert engine.shapes == [(460, 400), (1000, 400)]
@@ -0,0 +1,55 @@
+# test_parallel.py
+import os
+
+import pytest
+
+from src.parallel import parse_tickets
+
+
+class FakeParser:
+    """Parses any ticket, except "bad" ones (error) and "crash" ones (exit)."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+
+    def extract_items(self) -> list[dict]:
+        if "crash" in self.file_path:
+            # Like a segfault inside OpenCV, no Python exception
+            os._exit(1)
+        if "bad" in self.file_path:
+            raise ValueError("garbled ticket")
+        return [{"product": self.file_path, "total_price": 1.0}]
+
+    def get_date(self) -> str:
+        return "20240105"
+
+
+@pytest.fixture(autouse=True)
+def fake_parser(monkeypatch):
+    # Forked workers inherit the patched factory
+    monkeypatch.setattr(
+        "src.parallel.get_ticket_parser",
+        lambda vendor, file_path, cache=None: FakeParser(file_path),
+    )
+
+
+def parsed_names(results: list) -> list[str]:
+    return [items[0]["product"] for items, _ in results]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_tickets_are_left_out(workers):
+    tickets = [("Granel", name) for name in ("a.jpg", "bad.jpg", "b.jpg")]
+    assert parsed_names(parse_tickets(tickets, workers)) == ["a.jpg", "b.jpg"]
+
+
+def test_crashed_worker_only_loses_its_ticket():
+    names = ["a.jpg", "crash1.jpg", "b.jpg", "c.jpg", "d.jpg", "crash2.jpg", "e.jpg"]
+    tickets = [("Granel", name) for name in names]
+    assert parsed_names(parse_tickets(tickets, workers=2)) == [
+        "a.jpg",
+        "b.jpg",
+        "c.jpg",
+        "d.jpg",
+        "e.jpg",
+    ]
@@ -0,0 +1,74 @@
+# test_parse_cache.py
+from src.parse_cache import CachedTicketParser, ParseCache
+from src.ticket_parser import AbstractTicketParser
+
+
+class FakeParser(AbstractTicketParser):
+    PARSER_VERSION = 1
+    BACKEND = "pytesseract"
+    calls = 0
+
+    @classmethod
+    def cache_version(cls) -> str:
+        return f"{cls.PARSER_VERSION}/{cls.BACKEND}"
+
+    def _parse_ticket(self) -> str:
+        FakeParser.calls += 1
+        return "ART\n1 PAN\nTOTAL"
+
+    def extract_items(self) -> list[dict]:
+        product = self.text.split("\n")[1].split(" ")[1]
+        self.items = [{"product": product, "total_price": 1.5}]
+        return self.items
+
+
+def test_cache_hit_skips_parsing(tmp_path):
+    ticket = tmp_path / "20240113_granel.jpg"
+    ticket.write_bytes(b"jpeg")
+    cache = ParseCache(str(tmp_path / "cache.sqlite"))
+    FakeParser.calls = 0
+
+    for _ in range(2):
+        parser = CachedTicketParser(FakeParser, "Granel", str(ticket), cache)
+        assert parser.extract_items() == [{"product": "PAN", "total_price": 1.5}]
+        assert parser.get_text() == "ART\n1 PAN\nTOTAL"
+        assert parser.get_date() == "20240113"
+    assert FakeParser.calls == 1
+
+    # A new file content is a new cache key
+    ticket.write_bytes(b"other jpeg")
+    CachedTicketParser(FakeParser, "Granel", str(ticket), cache).extract_items()
+    assert FakeParser.calls == 2
+
+
+def test_other_ocr_backend_is_a_miss(tmp_path, monkeypatch):
+    ticket = tmp_path / "20240113_granel.jpg"
+    ticket.write_bytes(b"jpeg")
+    cache = ParseCache(str(tmp_path / "cache.sqlite"))
+    FakeParser.calls = 0
+
+    CachedTicketParser(FakeParser, "Granel", str(ticket), cache).extract_items()
+    monkeypatch.setattr(FakeParser, "BACKEND", "tesserocr")
+    CachedTicketParser(FakeParser, "Granel", str(ticket), cache).extract_items()
+    assert FakeParser.calls == 2
+
+
+def test_version_bump_invalidates_only_vendor(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache.sqlite"))
+    cache.put("abc", "GRANEL", "1", "text", [])
+    cache.put("abc", "FRUTERIA", "1", "text", [])
+
+    assert cache.prune({"GRANEL": "2", "FRUTERIA": "1"}) == 1
+    assert cache.get("abc", "GRANEL", "1") is None
+    assert cache.get("abc", "FRUTERIA", "1") == ("text", [])
+
+
+def test_parsing_is_lazy(tmp_path):
+    FakeParser.calls = 0
+    parser = FakeParser(str(tmp_path / "20240113_granel.jpg"), "FakeParser")
+    assert parser.get_date() == "20240113"
+    assert FakeParser.calls == 0
+
+    parser.extract_items()
+    assert parser.extract_items() == [{"product": "PAN", "total_price": 1.5}]
+    assert FakeParser.calls == 1
@@ -0,0 +1,29 @@
+# test_pdf_text.py
+from benchmarks.synthetic import write_mercadona_pdf
+from src.pdf_text import PdfTextExtractor, content_stream_text
+from src.vendors.mercadona_parser import MercadonaTicketParser
+
+
+def test_content_stream_text():
+    data = (
+        b"BT /F1 10 Tf 12 TL 20 800 Td [(1 PAN) -300 (BARRA)] TJ "
+        b"T* (0,836 kg 1,99 \\200/kg 1,66) Tj (TOTAL \\(\\200\\)) ' ET"
+    )
+    assert content_stream_text(data) == (
+        "1 PAN BARRA\n0,836 kg 1,99 €/kg 1,66\nTOTAL (€)"
+    )
+
+
+def test_backends_agree_on_multi_page_ticket(tmp_path):
+    file_path = str(tmp_path / "20240105 Mercadona 12,50 €.pdf")
+    expected = write_mercadona_pdf(file_path, n_items=50, lines_per_page=20)
+
+    texts = [
+        PdfTextExtractor(backend).extract(file_path)
+        for backend in ("pypdf", "content_stream")
+    ]
+    assert texts[0] == texts[1]
+
+    parser = MercadonaTicketParser(file_path)
+    assert parser.extract_items() == expected
+    assert parser.get_date() == "20240105"
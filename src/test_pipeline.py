@@ -0,0 +1,43 @@
+# test_pipeline.py
+import asyncio
+
+from benchmarks.synthetic import write_mercadona_pdf
+from src.pipeline import TicketPipeline
+from src.ticket_db import TicketDatabase
+
+
+def write_tickets(tmp_path, n_tickets: int = 3) -> tuple:
+    tickets = []
+    expected = {}
+    for i in range(n_tickets):
+        file_path = str(tmp_path / f"2024010{i + 1} Mercadona.pdf")
+        for item in write_mercadona_pdf(file_path, n_items=5, seed=i):
+            expected[item["product"]] = (
+                expected.get(item["product"], 0) + item["total_price"]
+            )
+        tickets.append(("Mercadona", file_path))
+    return tickets, expected
+
+
+def test_pipeline_aggregates_local_tickets(tmp_path):
+    tickets, expected = write_tickets(tmp_path)
+    # A missing file is logged and skipped, duplicates are parsed once
+    tickets += [("Mercadona", str(tmp_path / "missing.pdf")), tickets[0]]
+
+    expenses = asyncio.run(TicketPipeline(workers=2, queue_size=1).run(tickets))
+    items = expenses.expenses_per_item()
+    assert items.keys() == expected.keys()
+    for product, total in expected.items():
+        assert abs(items[product] - total) < 1e-6
+
+
+def test_pipeline_skips_known_tickets(tmp_path):
+    tickets, _ = write_tickets(tmp_path, n_tickets=2)
+    db = TicketDatabase(str(tmp_path / "tickets.sqlite"))
+
+    assert asyncio.run(TicketPipeline(ticket_db=db).run(tickets)) is db
+    assert all(db.is_known(file_path) for _, file_path in tickets)
+
+    pipeline = TicketPipeline(ticket_db=db)
+    asyncio.run(pipeline.run(tickets))
+    assert len(pipeline.expenses) == 0
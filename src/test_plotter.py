@@ -0,0 +1,48 @@
+# test_plotter.py
+import os
+
+from src.plotter import ChartRenderer, top_items
+
+
+def test_top_items():
+    expenses = {f"item {i}": float(i % 97) + i / 10000 for i in range(5000)}
+    top = top_items(expenses, top_n=5)
+    expected = sorted(expenses.items(), key=lambda item: item[1], reverse=True)[:5]
+    assert list(top.items()) == expected
+    assert top_items({"a": 1.0}, top_n=30) == {"a": 1.0}
+
+
+def test_renderer_skips_unchanged_charts(tmp_path):
+    per_month = {("2024", "01"): 10.5, ("2024", "02"): 3.2}
+    per_item = {f"item {i}": float(i) for i in range(1000)}
+
+    renderer = ChartRenderer(str(tmp_path), formats=["png", "svg", "pdf"])
+    renderer.expenses_per_month(per_month, title_vendor="Granel")
+    renderer.expenses_per_item(per_item, title_vendor="Granel")
+    written = renderer.close()
+    assert sorted(os.path.basename(file_path) for file_path in written) == [
+        "charts.pdf",
+        "expenses_per_item_granel.png",
+        "expenses_per_item_granel.svg",
+        "expenses_per_month_granel.png",
+        "expenses_per_month_granel.svg",
+    ]
+    for file_path in written:
+        assert os.path.getsize(file_path) > 0
+
+    # Same aggregates: nothing is drawn again
+    renderer = ChartRenderer(str(tmp_path), formats=["png", "svg", "pdf"])
+    renderer.expenses_per_month(per_month, title_vendor="Granel")
+    renderer.expenses_per_item(per_item, title_vendor="Granel")
+    assert renderer.close() == []
+
+    # A new month only redraws the monthly chart and the pdf
+    per_month[("2024", "03")] = 1.0
+    renderer = ChartRenderer(str(tmp_path), formats=["png", "pdf"], background=True)
+    renderer.expenses_per_month(per_month, title_vendor="Granel")
+    renderer.expenses_per_item(per_item, title_vendor="Granel")
+    written = renderer.close()
+    assert sorted(os.path.basename(file_path) for file_path in written) == [
+        "charts.pdf",
+        "expenses_per_month_granel.png",
+    ]
@@ -0,0 +1,73 @@
+# test_product_catalog.py
+from src.product_catalog import ProductCatalog, normalize_product
+from src.utils import extract_expenses_per_item
+
+
+def test_normalize_product():
+    assert normalize_product("  Lentejas  pardinas. ") == "LENTEJAS PARDINAS"
+    assert normalize_product("Plátano canarias") == "PLATANO CANARIAS"
+
+
+def test_resolve_variants(tmp_path):
+    catalog_path = str(tmp_path / "catalog.json")
+    catalog = ProductCatalog(catalog_path)
+    for name in ("LENTEJAS PARDINAS", "PLATANO CANARIAS", "ARROZ INTEGRAL"):
+        catalog.add_product(name)
+
+    assert catalog.canonical("LENTEJAS PARD1NAS") == "LENTEJAS PARDINAS"
+    assert catalog.canonical("Platano  Canárias") == "PLATANO CANARIAS"
+    assert catalog.canonical("ARROZINTEGRAL") == "ARROZ INTEGRAL"
+    # A different product is added to the catalog
+    assert catalog.canonical("NUECES") == "NUECES"
+    assert len(catalog) == 4
+
+    # A confirmed alias wins over the trigram match
+    catalog.add_alias("TIPO 1", "ESPECIAS TIPO 1")
+    assert catalog.canonical("TIPO 1") == "ESPECIAS TIPO 1"
+
+    catalog.save()
+    catalog = ProductCatalog(catalog_path)
+    assert len(catalog) == 5
+    # Fuzzy matches are only suggested, confirmed aliases are kept
+    assert normalize_product("LENTEJAS PARD1NAS") not in catalog.aliases
+    assert catalog.suggestions["LENTEJAS PARD1NAS"] == "LENTEJAS PARDINAS"
+    assert catalog.canonical("TIPO 1") == "ESPECIAS TIPO 1"
+
+    catalog.add_alias("LENTEJAS PARD1NAS", "LENTEJAS PARDINAS")
+    assert catalog.aliases["LENTEJAS PARD1NAS"] == 0
+    assert "LENTEJAS PARD1NAS" not in catalog.suggestions
+
+
+def test_sibling_products():
+    catalog = ProductCatalog()
+    for name in ("ESPECIAS TIPO 1", "YOGUR NATURAL", "ARROZ BASMATI"):
+        catalog.add_product(name)
+
+    assert catalog.canonical("ESPECIAS TIPO 2") == "ESPECIAS TIPO 2"
+    assert catalog.canonical("YOGUR NATURAL X6") == "YOGUR NATURAL X6"
+    assert catalog.canonical("ARROZ BASMATI INTEGRAL") == "ARROZ BASMATI INTEGRAL"
+    # OCR variants of the sizes still match
+    assert catalog.canonical("ESPEC1AS TIPO 1") == "ESPECIAS TIPO 1"
+    assert len(catalog) == 6
+    assert not catalog.aliases.keys() - {
+        normalize_product(name) for name in catalog.products
+    }
+
+
+def test_merge_totals():
+    catalog = ProductCatalog()
+    catalog.add_product("PERA CONFERENCIA")
+    items = [
+        (
+            [
+                {"product": "PERA CONFERENCIA", "total_price": 1.0},
+                {"product": "PERA C0NFERENCIA", "total_price": 2.0},
+                {"product": "NARANJA", "total_price": 0.5},
+            ],
+            "20240105",
+        )
+    ]
+    assert extract_expenses_per_item(items, catalog) == {
+        "PERA CONFERENCIA": 3.0,
+        "NARANJA": 0.5,
+    }
@@ -0,0 +1,38 @@
+# test_startup.py
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("cv2", "scipy", "pytesseract", "pypdf", "matplotlib")
+# Seconds main.py --help may add to the interpreter startup. Importing the
+# heavy modules eagerly took over a second.
+HELP_BUDGET = 0.6
+
+
+def run_python(*args: str) -> tuple[float, subprocess.CompletedProcess]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True
+    )
+    return time.perf_counter() - start, result
+
+
+def test_import_main_skips_heavy_modules():
+    _, result = run_python(
+        "-c",
+        "import sys, main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_help_import_budget():
+    # Best of a few runs, against the bare interpreter startup
+    bare = min(run_python("-c", "pass")[0] for _ in range(3))
+    runs = [run_python("main.py", "--help") for _ in range(3)]
+    assert all(result.returncode == 0 for _, result in runs)
+    assert "Usage:" in runs[0][1].stdout
+    assert min(seconds for seconds, _ in runs) - bare < HELP_BUDGET
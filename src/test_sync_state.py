@@ -0,0 +1,67 @@
+# test_sync_state.py
+from src.collector import EmailCollector
+from src.sync_state import SyncState
+
+
+class FakeIMAP:
+    def __init__(self, uids: list, uidvalidity: int = 1) -> None:
+        self.uids = uids
+        self.uidvalidity = uidvalidity
+        self.searches = []
+
+    def select(self, mailbox):
+        return "OK", [str(len(self.uids)).encode()]
+
+    def response(self, code):
+        if code == "UIDVALIDITY":
+            return code, [str(self.uidvalidity).encode()]
+        return code, [str(max(self.uids) + 1).encode()]
+
+    def uid(self, command, charset, criteria):
+        self.searches.append(criteria)
+        return "OK", [b" ".join(str(uid).encode() for uid in self.uids)]
+
+
+def make_collector(mail: FakeIMAP) -> EmailCollector:
+    collector = EmailCollector("user", "password", "imap.example.com")
+    collector.mail = mail
+    return collector
+
+
+def test_state_roundtrip(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    state = SyncState(state_path)
+    assert state.get_last_uid("inbox", "a@b.c", 7) == 0
+    state.update("inbox", "a@b.c", 7, 42)
+    state.save()
+
+    state = SyncState(state_path)
+    assert state.get_last_uid("inbox", "a@b.c", 7) == 42
+    # A different UIDVALIDITY forces a full resync
+    assert state.get_last_uid("inbox", "a@b.c", 8) == 0
+
+
+def test_incremental_fetch(tmp_path):
+    state = SyncState(str(tmp_path / "state.json"))
+    mail = FakeIMAP([3, 5, 9])
+    collector = make_collector(mail)
+
+    assert collector.fetch_emails("a@b.c", state=state) == [b"3", b"5", b"9"]
+    collector.save_sync_state(state)
+    assert state.get_last_uid("inbox", "a@b.c", 1) == 9
+
+    # No new mail: no search is sent at all
+    assert collector.fetch_emails("a@b.c", state=state) == []
+    assert len(mail.searches) == 1
+
+    # New mail only returns UIDs above the last synced one
+    mail.uids = [3, 5, 9, 12]
+    assert collector.fetch_emails("a@b.c", state=state) == [b"12"]
+    assert mail.searches[-1] == "(UID 10:* FROM a@b.c)"
+
+
+def test_uidvalidity_change_resyncs(tmp_path):
+    state = SyncState(str(tmp_path / "state.json"))
+    state.update("inbox", "a@b.c", 1, 9)
+    collector = make_collector(FakeIMAP([1, 2], uidvalidity=2))
+    assert collector.fetch_emails("a@b.c", state=state) == [b"1", b"2"]
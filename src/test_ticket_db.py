@@ -0,0 +1,49 @@
+# test_ticket_db.py
+import os
+
+from src.ticket_db import TicketDatabase
+
+
+def write_ticket(tmp_path, name: str) -> str:
+    file_path = str(tmp_path / name)
+    with open(file_path, "wb") as f:
+        f.write(b"ticket")
+    return file_path
+
+
+def test_upsert_and_queries(tmp_path):
+    db = TicketDatabase(str(tmp_path / "tickets.sqlite"))
+    mercadona = write_ticket(tmp_path, "20240105 Mercadona.pdf")
+    granel = write_ticket(tmp_path, "20240812_granel.jpg")
+
+    assert not db.is_known(mercadona)
+    db.upsert_ticket(
+        "Mercadona",
+        mercadona,
+        "20240105",
+        [
+            {"units": 2, "product": "PAN", "price_per_unit": 0.5, "total_price": 1.0},
+            {"product": "PLATANO", "weight_kg": 0.5, "total_price": 1.0},
+        ],
+    )
+    db.upsert_ticket(
+        "Granel", granel, "20240812", [{"product": "ARROZ", "total_price": 3.0}]
+    )
+    assert db.is_known(mercadona)
+
+    assert db.expenses_per_month() == {("2024", "01"): 2.0, ("2024", "08"): 3.0}
+    assert db.expenses_per_item(vendor="Mercadona") == {"PAN": 1.0, "PLATANO": 1.0}
+    assert db.expenses_per_vendor(since=20240701) == {"Granel": 3.0}
+    # Spend on rice in Q3
+    assert db.spend_on("%ARROZ%", since=20240701, until=20240930) == 3.0
+    assert db.spend_on("%ARROZ%", until=20240630) == 0.0
+
+    # Upserting the same file again replaces its items
+    db.upsert_ticket(
+        "Granel", granel, "20240812", [{"product": "ARROZ", "total_price": 4.0}]
+    )
+    assert db.expenses_per_vendor() == {"Mercadona": 2.0, "Granel": 4.0}
+
+    # A modified file has to be parsed again
+    os.utime(granel, (0, 0))
+    assert not db.is_known(granel)
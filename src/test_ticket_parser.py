@@ -1,22 +1,109 @@
 # test_ticket_parser.py
+import shutil
+
 import pytest
-from .ticket_parser import get_ticket_parser
 
+from benchmarks.synthetic import (
+    FRUTERIA_PRODUCTS,
+    GRANEL_PRODUCTS,
+    fruteria_ticket_lines,
+    granel_ticket_lines,
+    random_weighed_items,
+    write_fruteria_jpeg,
+    write_granel_jpeg,
+    write_mercadona_pdf,
+)
+from src.parser_factory import get_ticket_parser
+
+needs_tesseract = pytest.mark.skipif(
+    shutil.which("tesseract") is None, reason="tesseract is not installed"
+)
 
-def test_mercadona():
-    file_path = "../downloads/20240105 Mercadona 12,50 €.pdf"
+
+def test_mercadona(tmp_path):
+    file_path = str(tmp_path / "20240105 Mercadona 12,50 €.pdf")
+    expected = write_mercadona_pdf(file_path, n_items=5)
     pdf_parser = get_ticket_parser("Mercadona", file_path)
     items = pdf_parser.extract_items()
     total_price = pdf_parser.calculate_total_price()
-    # Add assertions here based on what you expect the output to be
-    # For example:
-    assert len(items) == 5
-    assert abs(total_price - 12.50) < 0.01
+    assert items == expected
+    assert abs(total_price - sum(item["total_price"] for item in expected)) < 0.01
+    assert pdf_parser.get_date() == "20240105"
+
 
+@pytest.mark.parametrize(
+    "vendor, products, ticket_lines",
+    [
+        ("Granel", GRANEL_PRODUCTS, granel_ticket_lines),
+        ("Fruteria", FRUTERIA_PRODUCTS, fruteria_ticket_lines),
+    ],
+)
+def test_extract_items_from_text(vendor, products, ticket_lines):
+    expected = random_weighed_items(8, products, seed=1)
+    parser = get_ticket_parser(vendor, "20240113_ticket.jpg")
+    # Skip the OCR, parse the text as printed on the ticket
+    parser._text = parser._clean_ocr_text("\n".join(ticket_lines(expected)))
+    assert parser.extract_items() == expected
+    assert parser.extract_items() == expected
 
-def test_granel():
-    file_path = "P:/tickets/20240113_granel.jpg"
-    jpg_parser = get_ticket_parser("Granel", file_path)
+
+@needs_tesseract
+@pytest.mark.parametrize(
+    "vendor, write_jpeg",
+    [("Granel", write_granel_jpeg), ("Fruteria", write_fruteria_jpeg)],
+)
+def test_jpeg(tmp_path, vendor, write_jpeg):
+    file_path = str(tmp_path / f"20240113_{vendor.lower()}.jpg")
+    expected = write_jpeg(file_path, n_items=5, skew=1.0, shadow=0.3)
+    jpg_parser = get_ticket_parser(vendor, file_path)
     items = jpg_parser.extract_items()
     total_price = jpg_parser.calculate_total_price()
-    # Add assertions here based on what you expect the output to be
+    assert len(items) == len(expected)
+    assert abs(total_price - sum(item["total_price"] for item in expected)) < 0.01
+
+
+class FakeOcrEngine:
+    """Returns the given texts in order, one per image_to_string call."""
+
+    def __init__(self, texts: list[str]) -> None:
+        self.texts = texts
+        self.images = []
+
+    def image_to_string(self, img) -> str:
+        self.images.append(img)
+        return self.texts[len(self.images) - 1]
+
+
+@pytest.mark.parametrize("light_text_ok", [True, False])
+def test_adaptive_preprocessing(tmp_path, monkeypatch, light_text_ok):
+    file_path = str(tmp_path / "20240113_granel.jpg")
+    expected = write_granel_jpeg(file_path, n_items=5)
+    text = "\n".join(granel_ticket_lines(expected))
+    # A misread price makes the items not add up to the TOTAL
+    bad_text = text.replace(text.splitlines()[4], "0,100 1,00 0,10")
+    engine = FakeOcrEngine([text if light_text_ok else bad_text, text])
+    monkeypatch.setattr(
+        "src.vendors.photo_parser.get_ocr_engine", lambda **kwargs: engine
+    )
+
+    parser = get_ticket_parser("Granel", file_path)
+    assert parser.PREPROCESS_MODE == "adaptive"
+    assert parser.extract_items() == expected
+    # The clean photo goes through the light path, and is only escalated to
+    # the standard preprocessing when the light one fails the TOTAL check
+    assert len(engine.images) == (1 if light_text_ok else 2)
+
+
+def test_items_match_total():
+    expected = random_weighed_items(5, GRANEL_PRODUCTS, seed=2)
+    text = "\n".join(granel_ticket_lines(expected))
+    parser = get_ticket_parser("Granel", "20240113_granel.jpg")
+    parser._text = text
+    items = parser.extract_items()
+
+    assert parser._items_match_total(text)
+    bad_text = text.replace(text.splitlines()[2], "0,100 1,00 0,10")
+    assert not parser._items_match_total(bad_text)
+    # The parsed ticket is left untouched
+    assert parser.text == text
+    assert parser.items is items and items == expected
@@ -0,0 +1,144 @@
+import os
+import sqlite3
+
+
+class TicketDatabase:
+    """Local SQLite store of parsed tickets and their items.
+
+    Tickets are identified by their file path and are only parsed again when
+    the file size or modification time changes. Aggregations run as indexed
+    SQL queries, so charts and ad hoc questions never touch the PDF/JPEG
+    files.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                id INTEGER PRIMARY KEY,
+                vendor TEXT NOT NULL,
+                date INTEGER NOT NULL,
+                file_path TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                ticket_id INTEGER NOT NULL
+                    REFERENCES tickets(id) ON DELETE CASCADE,
+                vendor TEXT NOT NULL,
+                date INTEGER NOT NULL,
+                product TEXT NOT NULL,
+                units REAL,
+                weight_kg REAL,
+                unit_price REAL,
+                total_price REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tickets_vendor_date
+                ON tickets(vendor, date);
+            CREATE INDEX IF NOT EXISTS idx_items_vendor_date
+                ON items(vendor, date);
+            CREATE INDEX IF NOT EXISTS idx_items_product ON items(product);
+            CREATE INDEX IF NOT EXISTS idx_items_ticket ON items(ticket_id);
+            """)
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def is_known(self, file_path: str) -> bool:
+        """True if the file is stored and didn't change since it was parsed."""
+        row = self.conn.execute(
+            "SELECT size, mtime FROM tickets WHERE file_path = ?", (file_path,)
+        ).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(file_path)
+        return row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def upsert_ticket(
+        self, vendor: str, file_path: str, date: str, items: list[dict]
+    ) -> None:
+        """Insert a parsed ticket, replacing a previous version of the file."""
+        stat = os.stat(file_path)
+        date = int(date) if date.isdigit() else 0
+        with self.conn:
+            self.conn.execute("DELETE FROM tickets WHERE file_path = ?", (file_path,))
+            cursor = self.conn.execute(
+                "INSERT INTO tickets (vendor, date, file_path, size, mtime) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (vendor, date, file_path, stat.st_size, stat.st_mtime),
+            )
+            ticket_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        ticket_id,
+                        vendor,
+                        date,
+                        item["product"],
+                        item.get("units"),
+                        item.get("weight_kg"),
+                        item.get("price_per_unit", item.get("price_per_kg")),
+                        item["total_price"],
+                    )
+                    for item in items
+                ],
+            )
+
+    @staticmethod
+    def _where(vendor: str = None, since: int = None, until: int = None) -> tuple:
+        conditions = []
+        params = []
+        if vendor is not None:
+            conditions.append("vendor = ?")
+            params.append(vendor)
+        if since is not None:
+            conditions.append("date >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("date <= ?")
+            params.append(until)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def expenses_per_month(self, **filters) -> dict:
+        """Total per (year, month), both as strings, like ExpenseTable."""
+        where, params = self._where(**filters)
+        rows = self.conn.execute(
+            f"SELECT date / 100, SUM(total_price) FROM items{where} "
+            "GROUP BY date / 100",
+            params,
+        )
+        return {
+            (f"{month // 100:04d}", f"{month % 100:02d}"): total
+            for month, total in rows
+        }
+
+    def expenses_per_item(self, **filters) -> dict:
+        where, params = self._where(**filters)
+        rows = self.conn.execute(
+            f"SELECT product, SUM(total_price) FROM items{where} GROUP BY product",
+            params,
+        )
+        return dict(rows.fetchall())
+
+    def expenses_per_vendor(self, **filters) -> dict:
+        where, params = self._where(**filters)
+        rows = self.conn.execute(
+            f"SELECT vendor, SUM(total_price) FROM items{where} GROUP BY vendor",
+            params,
+        )
+        return dict(rows.fetchall())
+
+    def spend_on(self, product: str, **filters) -> float:
+        """Total spent on products matching a LIKE pattern, e.g. "%PLATANO%"."""
+        where, params = self._where(**filters)
+        where += " AND " if where else " WHERE "
+        row = self.conn.execute(
+            f"SELECT SUM(total_price) FROM items{where}product LIKE ?",
+            params + [product],
+        ).fetchone()
+        return row[0] or 0.0
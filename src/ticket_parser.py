@@ -1,24 +1,85 @@
+import os
+import re
 from abc import ABC, abstractmethod
 
 from src.logger import get_logger
 
+# Vendor name in upper case -> parser class, filled by register_parser
+PARSER_REGISTRY = {}
+
+
+def register_parser(parser_class: type) -> type:
+    """Class decorator adding a vendor parser to PARSER_REGISTRY."""
+    PARSER_REGISTRY[parser_class.VENDOR.upper()] = parser_class
+    return parser_class
+
+
+def date_from_path(file_path: str) -> str:
+    """Ticket date as YYYYMMDD.
+
+    Taken from the first 8 characters of the file name, or from dated
+    directories (e.g. 2024/01/15, 2024-01 or 202401) when the file name
+    doesn't start with a date. Month directories give the first day.
+    """
+    file_name = os.path.basename(file_path)
+    if file_name[:8].isdigit():
+        return file_name[:8]
+
+    digits = ""
+    for part in reversed(os.path.normpath(os.path.dirname(file_path)).split(os.sep)):
+        part = part.replace("-", "")
+        if not part.isdigit() or len(digits) + len(part) > 8:
+            break
+        digits = part + digits
+    if len(digits) == 6:
+        digits += "01"
+    return digits if len(digits) == 8 else file_name[:8]
+
 
 class AbstractTicketParser(ABC):
+    # Bump in a vendor parser whenever its text extraction, preprocessing or
+    # item extraction changes, so cached results of that vendor are dropped
+    PARSER_VERSION = 1
+    # Vendor name, and the files it parses: a regex searched in the lower
+    # case file name and the accepted extensions, see src/ingest.py
+    VENDOR = None
+    FILE_PATTERN = None
+    FILE_EXTENSIONS = ()
+    # The items are printed between these two markers
+    ITEM_START_MARKER = None
+    ITEM_END_MARKER = None
+
     def __init__(self, file_path: str, logger_name: str) -> None:
         # Create a logger at the class level
         self.logger = get_logger(logger_name)
 
         self.file_path = file_path
         self.items = []
-        self.text = self._parse_ticket()
+        # Parse confidence (0-1) of every item, filled by the OCR parsers
+        self.confidences = []
+        # The text is extracted on first access, see the text property
+        self._text = None
         self.total_price = 0
         self.file_date = self._parse_date_from_file_path()
 
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._parse_ticket()
+        return self._text
+
     def _parse_date_from_file_path(self) -> str:
-        # Extract the date from the file name
-        # The date is the first 8 characters of the file name
+        # Extract the date from the file name or its directories
         # The format is YYYYMMDD
-        return self.file_path.split("/")[-1][:8]
+        return date_from_path(self.file_path)
+
+    @classmethod
+    def cache_version(cls) -> str:
+        """PARSER_VERSION and the settings the parsed items depend on.
+
+        Tickets are cached under this version, see src/parse_cache.py.
+        """
+        return str(cls.PARSER_VERSION)
 
     def get_date(self) -> str:
         return self.file_date
@@ -32,6 +93,15 @@ class AbstractTicketParser(ABC):
             self.logger.warning("Total price is 0. Check the parser!")
         return self.total_price
 
+    def _parse_total_from_text(self, text: str) -> float:
+        """The amount after the end marker (e.g. "TOTAL 12,34"), or None."""
+        match = re.search(
+            re.escape(self.ITEM_END_MARKER) + r"[^\d\n]*(\d+[.,]\d{2})", text
+        )
+        if match is None:
+            return None
+        return float(match.group(1).replace(",", "."))
+
     @abstractmethod
     def _parse_ticket(self) -> None:
         pass
@@ -1,25 +1,18 @@
-from collections import defaultdict
+from src.expense_table import ExpenseTable
+from src.product_catalog import ProductCatalog
 
 
 def convert_to_float(value: str) -> float:
-    try:
-        return float(value)
-    except ValueError:
-        return float(value.replace(",", "."))
+    # Decimals come with a comma or a dot
+    return float(value.replace(",", "."))
 
 
 def extract_expenses_per_month(all_items):
-    expenses_per_month = defaultdict(float)
-    for items, date in all_items:
-        for item in items:
-            year, month = date[:4], date[4:6]
-            expenses_per_month[(year, month)] += item["total_price"]
-    return expenses_per_month
+    return ExpenseTable.from_items(all_items).expenses_per_month()
 
 
-def extract_expenses_per_item(all_items):
-    expenses_per_item = defaultdict(float)
-    for items, _ in all_items:
-        for item in items:
-            expenses_per_item[item["product"]] += item["total_price"]
+def extract_expenses_per_item(all_items, catalog: ProductCatalog = None):
+    expenses_per_item = ExpenseTable.from_items(all_items).expenses_per_item()
+    if catalog is not None:
+        expenses_per_item = catalog.merge_totals(expenses_per_item)
     return expenses_per_item
@@ -1,23 +1,36 @@
 import re
-import pypdf
 
-from src.ticket_parser import AbstractTicketParser
+from src.pdf_text import get_pdf_extractor
+from src import instrumentation
+from src.ticket_parser import AbstractTicketParser, register_parser
 
 ITEM_PATTERN_MERCA = re.compile(r"(\d+)(.*?)(\d+,\d{2})\s*(\d+,\d{2})?")
 WEIGHT_PATTERN_MERCA = re.compile(r"(\d+,\d{3}) kg (\d+,\d{2}) €/kg (\d+,\d{2})")
 
 
+@register_parser
 class MercadonaTicketParser(AbstractTicketParser):
+    PARSER_VERSION = 2
+    VENDOR = "Mercadona"
+    FILE_PATTERN = r"mercadona"
+    FILE_EXTENSIONS = (".pdf",)
+    # See src.pdf_text.PDF_BACKENDS
+    PDF_BACKEND = "content_stream"
+    ITEM_START_MARKER = "Descripció"
+    ITEM_END_MARKER = "TOTAL"
+
     def __init__(self, file_path: str, logger_name: str = "MercadonaTicketParser"):
         super().__init__(file_path, logger_name)
 
+    @instrumentation.timed("parse_ticket", count_bytes=instrumentation.parser_file_size)
     def _parse_ticket(self) -> None:
-        # Extract the text from the PDF
-        pdf_file_obj = open(self.file_path, "rb")
-        pdf_reader = pypdf.PdfReader(pdf_file_obj)
-        page_obj = pdf_reader.pages[0]
-        text = page_obj.extract_text()
-        pdf_file_obj.close()
+        # Extract the text from all the pages of the PDF
+        text = get_pdf_extractor(self.PDF_BACKEND).extract(self.file_path)
+        if self.PDF_BACKEND != "pypdf" and not (
+            self.ITEM_START_MARKER in text and self.ITEM_END_MARKER in text
+        ):
+            self.logger.debug("Item markers not found, retrying with pypdf")
+            text = get_pdf_extractor("pypdf").extract(self.file_path)
         return text
 
     def parse_line(self, lines_iter: iter) -> dict:
@@ -50,10 +63,14 @@ class MercadonaTicketParser(AbstractTicketParser):
                     }
                     yield item
 
+    @instrumentation.timed("extract_items", count_items=instrumentation.result_len)
     def extract_items(self) -> list:
+        # Start from scratch so calling this twice doesn't duplicate items
+        self.items = []
+
         # Find the start and end of the items
-        start = self.text.find("Descripció")
-        end = self.text.find("TOTAL")
+        start = self.text.find(self.ITEM_START_MARKER)
+        end = self.text.find(self.ITEM_END_MARKER)
         items_text = self.text[start:end]
 
         # remove first and last line (Descripción and empty line)
@@ -0,0 +1,130 @@
+from src import instrumentation
+from src.line_grammar import LineGrammar, clean_ocr_text
+from src.ticket_parser import AbstractTicketParser
+from src.ocr import get_ocr_engine, ocr_item_region
+
+# Items parsed with less confidence are logged
+LOW_CONFIDENCE = 0.8
+
+
+class PhotoTicketParser(AbstractTicketParser):
+    """Tickets photographed as JPEG, read with OCR and a LineGrammar."""
+
+    FILE_EXTENSIONS = (".jpg", ".jpeg")
+    DESKEW_METHOD = "coarse_to_fine"
+    # Maximum skew (degrees) searched when straightening the photo
+    DESKEW_LIMIT = 1
+    # "fast" preprocesses a single grayscale plane, see src/preprocess_parity.py
+    # "adaptive" tries a light preprocessing on clean photos first
+    PREPROCESS_MODE = "adaptive"
+    # Photos are decoded at a reduced size down to this height (pixels)
+    DECODE_HEIGHT = 2000
+    # Run the full quality OCR only on the item table found by a cheap pass
+    OCR_ITEM_REGION = False
+    OCR_OPTIONS = {"lang": "cat+eng+spa", "psm": 4, "oem": 1}
+    # Product and amounts lines of the items, set by every vendor
+    GRAMMAR: LineGrammar = None
+
+    @classmethod
+    def cache_version(cls) -> str:
+        # The OCR backend and the preprocessing change the text read
+        engine = get_ocr_engine(**cls.OCR_OPTIONS)
+        region = "region" if cls.OCR_ITEM_REGION else "page"
+        return (
+            f"{cls.PARSER_VERSION}/{engine.NAME}/{cls.PREPROCESS_MODE}/"
+            f"{cls.DESKEW_METHOD}/{cls.DECODE_HEIGHT}/{region}"
+        )
+
+    def _clean_ocr_text(self, text: str) -> str:
+        # Remove "|", empty lines and spaces inside prices and weights
+        return clean_ocr_text(text)
+
+    def _clean_product_name(self, product: str) -> str:
+        return product
+
+    @instrumentation.timed("parse_ticket", count_bytes=instrumentation.parser_file_size)
+    def _parse_ticket(self) -> None:
+        # OpenCV and SciPy are only imported once a photo is parsed
+        from src.image_processor import ImageProcessor
+
+        # Extract the text from the JPEG
+        # The fast mode only works on the grayscale plane
+        img_processor = ImageProcessor(
+            img_path=self.file_path,
+            target_height=self.DECODE_HEIGHT,
+            grayscale=self.PREPROCESS_MODE == "fast",
+        )
+        ocr_engine = get_ocr_engine(**self.OCR_OPTIONS)
+        mode = self.PREPROCESS_MODE
+        if mode == "adaptive":
+            # Clean photos only get the light preprocessing, unless their
+            # items don't add up to the TOTAL
+            metrics = img_processor.quality_metrics(deskew_limit=self.DESKEW_LIMIT)
+            if img_processor.is_clean(metrics):
+                img_light = img_processor.enhance_image_light(metrics["skew"])
+                text = self._ocr_text(ocr_engine, img_light)
+                if self._items_match_total(text):
+                    self.logger.debug(text)
+                    return text
+                self.logger.info("Light preprocessing failed, using the standard one")
+            mode = "standard"
+
+        img_prepared = img_processor.enhance_image(
+            deskew_limit=self.DESKEW_LIMIT,
+            deskew_method=self.DESKEW_METHOD,
+            mode=mode,
+            show=False,
+        )
+        cleaned_text = self._ocr_text(ocr_engine, img_prepared)
+        self.logger.debug(cleaned_text)
+        return cleaned_text
+
+    def _ocr_text(self, ocr_engine, img) -> str:
+        if self.OCR_ITEM_REGION:
+            text = ocr_item_region(
+                ocr_engine, img, self.ITEM_START_MARKER, self.ITEM_END_MARKER
+            )
+        else:
+            text = ocr_engine.image_to_string(img)
+        return self._clean_ocr_text(text)
+
+    def _parse_items(self, text: str) -> tuple[list[dict], list[float]]:
+        """The items of a ticket text and their confidences."""
+        # Find the start and end of the items
+        start = text.find(self.ITEM_START_MARKER)
+        end = text.find(self.ITEM_END_MARKER)
+        items_text = text[start:end]
+
+        # remove the first line (Descripción)
+        items_text = items_text[items_text.find("\n") + 1 :]
+
+        items = []
+        confidences = []
+        for item, confidence in self.GRAMMAR.parse(items_text):
+            item["product"] = self._clean_product_name(item["product"])
+            items.append(item)
+            confidences.append(confidence)
+        return items, confidences
+
+    def _items_match_total(self, text: str) -> bool:
+        """True if both markers are found and the items add up to the TOTAL."""
+        if self.ITEM_START_MARKER not in text or self.ITEM_END_MARKER not in text:
+            return False
+        total = self._parse_total_from_text(text)
+        if total is None:
+            return False
+        items, _ = self._parse_items(text)
+        return bool(items) and abs(sum(i["total_price"] for i in items) - total) < 0.01
+
+    @instrumentation.timed("extract_items", count_items=instrumentation.result_len)
+    def extract_items(self) -> list[dict]:
+        self.logger.debug(f"TEXT: \n{self.text}")
+
+        # Replaced, so calling this twice doesn't duplicate items
+        self.items, self.confidences = self._parse_items(self.text)
+        for item, confidence in zip(self.items, self.confidences):
+            if confidence < LOW_CONFIDENCE:
+                self.logger.warning(f"Low confidence ({confidence:.2f}): {item}")
+        # Formatted only when debugging, items are many on large batches
+        self.logger.debug("Extracted items: %s", self.items)
+        return self.items